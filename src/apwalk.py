@@ -2,18 +2,25 @@
 
 import time
 import logging
+import argparse
 import binascii
 import multiprocessing
 
 import whatabanger
 
 
-def _handle_parity(data):
-    ''' Raise an exception on parity failure. '''
-    if data:
-        parity = data.pop()
-        if not whatabanger.swd.check_parity(parity, data):
-            raise Exception("Response failed parity check!")
+def _log_component(log, component, depth=1):
+    ''' Log a component, and any components in its ROM table. '''
+    log.info(
+        "-> %s0x%08x: class 0x%x, part 0x%03x, designer 0x%03x",
+        '  ' * depth,
+        component['address'],
+        component['class'],
+        component['part'],
+        component['designer'],
+    )
+    for child in component.get('children', []):
+        _log_component(log, child, depth + 1)
 
 
 def main():
@@ -24,13 +31,27 @@ def main():
     )
     log = logging.getLogger()
 
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help='Probe all 256 APs, rather than stopping at the first missing.',
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore any cached topology for this part.',
+    )
+    parser.add_argument(
+        '--cache',
+        default=whatabanger.discovery.DISCOVERY_CACHE,
+        help='Where to cache discovered topologies.',
+    )
+    args = parser.parse_args()
+
     # NOTE: Enabling debug logging has an impact on clock jitter!
     # log.setLevel(logging.DEBUG)
 
-    # Setup an SWD object to handle building requests.
-    log.info("Setting up SWD")
-    swd = whatabanger.swd.Protocol()
-
     # We're using queues to communicate with the main execution process - 
     # which is responsible for doing the actual bit banging. This is in
     # order to (hopefully) reduce clock jitter.
@@ -44,82 +65,39 @@ def main():
     banger = whatabanger.executor.Executor(request, response)
     banger.start()
 
-    # Define a list of messages to send - in order.
-    setup = [
-        swd.resync(),
-        swd.idr(),
-        swd.abort(),
-        swd.read(addr=0b01),
-    ]
-
-    # For each possible AP address, reset the line, and try to query the AP
-    # IDR.
-    apsel = 0b0
-
-    while apsel <= 0b11111111:
-        for command in setup:
-            request.put(command)
-            _handle_parity(response.get())
-
-        # On the first query, also grab the DP IDR too.
-        if apsel == 0b0:
-            log.info("Querying for DP IDR")
-            request.put(swd.idr())
-            data = response.get()
-            _handle_parity(data)
-
-            # Print our 'friendly' display of DP IDR info.
-            log.info(
-                "-> DP IDR 0x%x",
-                whatabanger.helpers.bits_to_bytes(data[0:31])
-            )
-            for key, val in whatabanger.helpers.decode_dp_idr(data).items():
-                log.info("-> DP %s: %s", key, val)
-
-        # Select the AP, and the 0xF0 bank.
-        log.info("Querying for AP 0x%02x IDR", apsel)
-        request.put(swd.select(apsel=apsel, apbanksel=0b1111))
-        _handle_parity(response.get())
-
-        # Read 0xFC from the AP (IDR).
-        request.put(swd.read(addr=0b11, apndp=0b1))
-        _handle_parity(response.get())
-
-        # Read the contents of RDBUFF to get the real value - this is due
-        # to the first read needing to be thrown away, per ARM DDI.
-        request.put(swd.rdbuff())
-        data = response.get()
-        _handle_parity(data)
-
+    # Setup a session, and discover everything behind the DAP. APs are
+    # probed until the first which isn't implemented, unless asked to probe
+    # them all, and the result is cached for the next run.
+    session = whatabanger.session.Session(request, response)
+    discovery = whatabanger.discovery.Discovery(session, cache=args.cache)
+    log.info("Discovering APs, and CoreSight components")
+    topology = discovery.discover(refresh=args.refresh, early_stop=not args.all)
+
+    # Print our 'friendly' display of DP IDR info.
+    log.info("-> DP IDR 0x%x", topology['dp'])
+    bits = whatabanger.helpers.Bits(topology['dp'], 32)
+    for key, val in whatabanger.helpers.decode_dp_idr(bits).items():
+        log.info("-> DP %s: %s", key, val)
+
+    for ap in topology['aps']:
         # Print our 'friendly' display of AP IDR info.
-        if whatabanger.helpers.bits_to_bytes(data[0:31]) != 0:
-            log.info(
-                "-> AP IDR 0x%x",
-                whatabanger.helpers.bits_to_bytes(data[0:31])
-            )
-            for key, val in whatabanger.helpers.decode_ap_idr(data).items():
-                log.info("-> AP %s: %s", key, val)
-
-        # Read 0xF8 from the AP (ROMTABLE).
-        request.put(swd.read(addr=0b10, apndp=0b1))
-        _handle_parity(response.get())
-        
-        # Read the contents of RDBUFF to get the real value - this is due
-        # to the first read needing to be thrown away, per ARM DDI.
-        request.put(swd.rdbuff())
-        data = response.get()
-        _handle_parity(data)
-
-        # Print the ROMTABLE base.
-        if whatabanger.helpers.decode_baseaddr(data) != 0:
+        log.info("-> AP 0x%02x IDR 0x%x", ap['apsel'], ap['idr'])
+        bits = whatabanger.helpers.Bits(ap['idr'], 32)
+        for key, val in whatabanger.helpers.decode_ap_idr(bits).items():
+            log.info("-> AP %s: %s", key, val)
+
+        # Print the ROMTABLE base, and the components found from it.
+        bits = whatabanger.helpers.Bits(ap['base'], 32)
+        if whatabanger.helpers.decode_baseaddr(bits) != 0:
             log.info(
                 "-> AP ROMTABLE 0x%x",
-                whatabanger.helpers.decode_baseaddr(data)
+                whatabanger.helpers.decode_baseaddr(bits)
             )
+        if ap['rom'] is not None:
+            _log_component(log, ap['rom'])
 
-        # Next!
-        apsel += 0b1
-
+    # Stop the bit banger.
+    banger.terminate()
 
 if __name__ == '__main__':
     main()
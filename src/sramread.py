@@ -2,20 +2,12 @@
 
 import time
 import logging
+import argparse
 import binascii
-import multiprocessing
 
 import whatabanger
 
 
-def _handle_parity(data):
-    ''' Raise an exception on parity failure. '''
-    if data:
-        parity = data.pop()
-        if not whatabanger.swd.check_parity(parity, data):
-            raise Exception("Response failed parity check!")
-
-
 def main():
     ''' A Python SWD initialisation script. Simply sets up an interface. '''
     logging.basicConfig(
@@ -24,66 +16,115 @@ def main():
     )
     log = logging.getLogger()
 
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', default='sram.bin')
+    parser.add_argument(
+        '--mmap',
+        action='store_true',
+        help='Write via a pre-sized mmap, rather than appending to file.',
+    )
+    parser.add_argument(
+        '--overrun',
+        action='store_true',
+        help='Set ORUNDETECT, so requests are streamed without ACK stalls.',
+    )
+    parser.add_argument(
+        '--clock',
+        type=float,
+        default=0.001,
+        help='Half SWCLK cycle time, in seconds (0 runs as fast as possible).',
+    )
+    parser.add_argument(
+        '--autotune',
+        action='store_true',
+        help='Search for the fastest clock at which DP IDR reads are clean.',
+    )
+    parser.add_argument(
+        '--diff',
+        metavar='DELTA',
+        help='Write only the blocks changed since the last snapshot.',
+    )
+    parser.add_argument(
+        '--all-probes',
+        action='store_true',
+        help='Shard the dump across all attached probes (identical boards).',
+    )
+    args = parser.parse_args()
+
     # NOTE: Enabling debug logging has an impact on clock jitter!
     # log.setLevel(logging.DEBUG)
 
-    # Setup an SWD object to handle building requests.
-    log.info("Setting up SWD")
-    swd = whatabanger.swd.Protocol()
-
-    # We're using queues to communicate with the main execution process - 
-    # which is responsible for doing the actual bit banging. This is in
-    # order to (hopefully) reduce clock jitter.
-    log.debug("Setting up requests queue")
-    request = multiprocessing.Queue()
-    log.debug("Setting up response queue")
-    response = multiprocessing.Queue()
+    # When using all probes, each dumps a range of SRAM from its own board,
+    # and the results are joined.
+    if args.all_probes:
+        manager = whatabanger.probe.Manager()
+        manager.start()
+        log.info("Dumping SRAM to %s via %d probes", args.output, len(manager.probes))
+        try:
+            manager.dump(0x20000000, 0x40000000 - 0x20000000, args.output)
+        finally:
+            manager.stop()
+        return
+
+    # We're using shared memory rings to communicate with the main execution
+    # process - which is responsible for doing the actual bit banging. This
+    # is in order to (hopefully) reduce clock jitter, without the overhead of
+    # pickling every request and response.
+    log.debug("Setting up requests ring")
+    request = whatabanger.ring.Ring()
+    log.debug("Setting up response ring")
+    response = whatabanger.ring.Ring()
     
     # Kick off the bit banger.
     log.debug("Setting up bit banger")
-    banger = whatabanger.executor.Executor(request, response)
+    banger = whatabanger.executor.Executor(
+        request,
+        response,
+        clock=args.clock,
+        autotune=args.autotune,
+    )
     banger.start()
 
-    # Define a list of messages to send - in order.
-    setup = [
-        swd.resync(),
-        swd.idr(),
-        swd.abort(),
-    ]
-
-    # Ensure the interface is setup.
-    for command in setup:
-        request.put(command)
-        _handle_parity(response.get())
-
-    # Attempt to extract all SRAM.
-    addr = 0x20000000
-    contents = []
-    while addr <= 0x40000000:
-        request.put(swd.tar(addr=addr))
-        _handle_parity(response.get())
-
-        # Initiate a READ via DRW - which will use the address we just wrote
-        # to the TAR register.
-        request.put(swd.drw())
-        _handle_parity(response.get())
-
-        # Read the contents of RDBUFF to get the real value - this is due to
-        # the first read needing to be thrown away, per ARM DDI.
-        request.put(swd.rdbuff())
-        data = response.get()
-        _handle_parity(data)
-
-        # Log and add to contents.
-        contents.extend(data)
-        log.info(
-            "-> 0x%x :: 0x%x ",
-            addr,
-            whatabanger.helpers.bits_to_bytes(data)
-        )
+    # Setup an SWD session to handle building requests, and ensure the
+    # interface is setup.
+    log.info("Setting up SWD")
+    session = whatabanger.session.Session(request, response)
+    session.connect()
+    if args.overrun:
+        session.overrun_detect()
+
+    # When diffing, only blocks found to have changed since the last run
+    # are read, and written as a delta. The routine used to checksum blocks
+    # on the core would have to be placed in SRAM itself, so words of each
+    # block are sampled instead.
+    if args.diff:
+        log.info("Writing SRAM delta to %s", args.diff)
+        store = whatabanger.snapshot.Store(session)
+        changed = store.diff(0x20000000, 0x40000000 - 0x20000000, args.diff)
+        log.info("Done, %d blocks changed", len(changed))
+        banger.terminate()
+        request.close()
+        response.close()
+        return
+
+    # Attempt to extract all SRAM. This is streamed directly to file, so
+    # memory use is constant, with progress logged periodically rather than
+    # per word.
+    log.info("Dumping SRAM to %s", args.output)
+    rate = whatabanger.dump.dump(
+        session,
+        0x20000000,
+        0x40000000 - 0x20000000,
+        args.output,
+        use_mmap=args.mmap,
+    )
+    log.info("Done at %.1f KB/s", rate / 1024)
+    log.info("SWCLK achieved %.1f Hz", banger.stats()['frequency'])
 
-        # Next!
-        addr += 0x4
+    # Stop the bit banger, and release the shared memory.
+    banger.terminate()
+    request.close()
+    response.close()
 
 if __name__ == '__main__':
     main()
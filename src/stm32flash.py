@@ -0,0 +1,91 @@
+''' Programs, and verifies, STM32F103x flash from a binary image. '''
+
+import logging
+import argparse
+
+import whatabanger
+
+
+def main():
+    ''' Programs, and verifies, STM32F103x flash from a binary image. '''
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(process)d - [%(levelname)s] %(message)s',
+    )
+    log = logging.getLogger()
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('image')
+    parser.add_argument(
+        '--address',
+        type=lambda value: int(value, 0),
+        default=whatabanger.stm32.STM32_FLASH_BASE,
+    )
+    parser.add_argument(
+        '--page-size',
+        type=lambda value: int(value, 0),
+        default=whatabanger.stm32.STM32_PAGE_SIZE,
+        help='Flash page size (0x800 for high density devices).',
+    )
+    parser.add_argument(
+        '--verify-only',
+        action='store_true',
+        help='Only compare page checksums, without programming.',
+    )
+    parser.add_argument(
+        '--loader',
+        action='store_true',
+        help='Program via a loader in SRAM, rather than over SWD directly.',
+    )
+    parser.add_argument(
+        '--on-target',
+        action='store_true',
+        help='Checksum pages on the core, skipping those already programmed.',
+    )
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as handle:
+        image = handle.read()
+
+    # Kick off the bit banger, using shared memory rings for requests and
+    # responses.
+    request = whatabanger.ring.Ring()
+    response = whatabanger.ring.Ring()
+    banger = whatabanger.executor.Executor(request, response)
+    banger.start()
+
+    log.info("Setting up SWD")
+    session = whatabanger.session.Session(request, response)
+    session.connect()
+    checksum = None
+    if args.on_target:
+        checksum = whatabanger.cortexm.Checksum(session)
+    flash = whatabanger.stm32.Flash(
+        session,
+        page_size=args.page_size,
+        checksum=checksum,
+    )
+
+    if not args.verify_only:
+        log.info("Programming %d bytes at 0x%08x", len(image), args.address)
+        if args.loader:
+            loader = whatabanger.stm32.Loader(session, flash=flash)
+            loader.write(args.address, image)
+        else:
+            flash.write(args.address, image)
+
+    log.info("Verifying %d bytes at 0x%08x", len(image), args.address)
+    bad = flash.verify(args.address, image)
+    if bad:
+        log.error("%d pages failed verification", len(bad))
+    else:
+        log.info("Done, all pages verified")
+
+    # Stop the bit banger, and release the shared memory.
+    banger.terminate()
+    request.close()
+    response.close()
+
+
+if __name__ == '__main__':
+    main()
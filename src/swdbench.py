@@ -0,0 +1,176 @@
+''' Benchmarks SWD workloads against a simulated target - no hardware needed. '''
+
+import os
+import time
+import collections
+import logging
+import argparse
+import multiprocessing
+
+import whatabanger
+
+
+def _handle_parity(data):
+    ''' Raise an exception on parity failure. '''
+    if data:
+        if not whatabanger.swd.check_parity(data[32], data[0:32]):
+            raise Exception("Response failed parity check!")
+
+
+class _Channel(object):
+    '''
+    Provides queue-like access to a transport, recording the latency of every
+    request from put() until its result is returned by get().
+    '''
+
+    def __init__(self, req, res):
+        ''' Ensure the work queues are accessible. '''
+        self._in = req
+        self._out = res
+        self._started = collections.deque()
+        self.latency = []
+
+    def put(self, request):
+        ''' Sends a request to the transport, recording the time. '''
+        self._started.append(time.perf_counter())
+        self._in.put(request)
+
+    def get(self, block=True, timeout=None):
+        ''' Returns the oldest result, recording the latency. '''
+        result = self._out.get(block, timeout)
+        self.latency.append(time.perf_counter() - self._started.popleft())
+        return result
+
+    def transact(self, request):
+        ''' Sends a request to the transport, and waits for the result. '''
+        self.put(request)
+        return self.get()
+
+
+def _sramread(channel, swd, words):
+    ''' An sramread.py style workload: TAR, DRW and RDBUFF for every word. '''
+    transact = channel.transact
+    for command in [swd.resync(), swd.idr(), swd.abort()]:
+        _handle_parity(transact(command))
+
+    addr = 0x20000000
+    for _ in range(words):
+        _handle_parity(transact(swd.tar(addr=addr)))
+        _handle_parity(transact(swd.drw()))
+        _handle_parity(transact(swd.rdbuff()))
+        addr += 0x4
+
+
+def _apwalk(channel, swd, words):
+    ''' An apwalk.py style workload: probe the IDR and BASE of every AP. '''
+    transact = channel.transact
+    setup = [swd.resync(), swd.idr(), swd.abort(), swd.read(addr=0b01)]
+    for apsel in range(0x100):
+        for command in setup:
+            _handle_parity(transact(command))
+
+        _handle_parity(transact(swd.select(apsel=apsel, apbanksel=0b1111)))
+        _handle_parity(transact(swd.read(addr=0b11, apndp=0b1)))
+        _handle_parity(transact(swd.rdbuff()))
+        _handle_parity(transact(swd.read(addr=0b10, apndp=0b1)))
+        _handle_parity(transact(swd.rdbuff()))
+
+
+def _readmem(channel, swd, words):
+    ''' A bulk memory read, using TAR auto-increment via a session. '''
+    session = whatabanger.session.Session(channel, channel)
+    session.connect()
+    session.read_memory(0x20000000, words * 4)
+
+
+WORKLOADS = {
+    'sramread': _sramread,
+    'readmem': _readmem,
+    'apwalk': _apwalk,
+}
+
+
+def main():
+    ''' Benchmarks SWD workloads against a simulated target. '''
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(process)d - [%(levelname)s] %(message)s',
+    )
+    log = logging.getLogger()
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workload', choices=WORKLOADS, default='sramread')
+    parser.add_argument('--words', type=int, default=4096)
+    parser.add_argument(
+        '--inline',
+        action='store_true',
+        help='Call the simulator directly, rather than via queues.',
+    )
+    parser.add_argument(
+        '--ring',
+        action='store_true',
+        help='Use shared memory rings, rather than queues.',
+    )
+    parser.add_argument(
+        '--wait',
+        type=float,
+        default=0.0,
+        help='Fraction of AP accesses which the simulator WAITs.',
+    )
+    args = parser.parse_args()
+
+    # Setup an SWD object to handle building requests, and a target with
+    # enough SRAM for the requested number of words.
+    swd = whatabanger.swd.Protocol()
+    if args.ring:
+        request = whatabanger.ring.Ring()
+        response = whatabanger.ring.Ring()
+    else:
+        request = multiprocessing.Queue()
+        response = multiprocessing.Queue()
+    target = whatabanger.simulator.Simulator(
+        request,
+        response,
+        memory={0x20000000: os.urandom(args.words * 4)},
+        wait=args.wait,
+    )
+
+    # Requests are either serviced in-process, or by the simulator running
+    # in a separate process.
+    if args.inline:
+        request = response = whatabanger.transport.Loopback(target)
+    else:
+        target.daemon = True
+        target.start()
+
+    # Track the latency of every transaction, as well as the total.
+    channel = _Channel(request, response)
+
+    log.info("Running %s workload", args.workload)
+    start = time.perf_counter()
+    WORKLOADS[args.workload](channel, swd, args.words)
+    elapsed = time.perf_counter() - start
+
+    latency = channel.latency
+    latency.sort()
+    log.info("-> Transactions: %d", len(latency))
+    log.info("-> Elapsed: %.3fs", elapsed)
+    log.info("-> Throughput: %.1f transactions/s", len(latency) / elapsed)
+    log.info("-> Latency (mean): %.1fus", sum(latency) / len(latency) * 1E6)
+    log.info("-> Latency (p99): %.1fus", latency[int(len(latency) * 0.99)] * 1E6)
+
+    # The time spent by the transport itself is only known when run in a
+    # separate process.
+    if not args.inline:
+        stats = target.stats()
+        log.info("-> Transport busy: %.3fs", stats['busy'])
+        log.info("-> Transport idle: %.3fs", stats['idle'])
+
+    # Retries are counted in shared memory, so are known either way.
+    stats = target.stats()
+    log.info("-> WAITs: %d, FAULTs: %d", stats['waits'], stats['faults'])
+    log.info("-> Retries: %d", stats['retries'])
+
+
+if __name__ == '__main__':
+    main()
@@ -53,7 +53,8 @@ def main():
         data = response.get()
 
         if data:
-            parity = data.pop()
+            parity = data[32]
+            data = data[0:32]
             log.info("Response: %x", whatabanger.helpers.bits_to_bytes(data))
 
             # Do a quick parity check (TODO: Re-try?)
@@ -2,4 +2,18 @@
 
 from whatabanger import swd
 from whatabanger import helpers
+from whatabanger import waveform
+from whatabanger import timing
+from whatabanger import transport
 from whatabanger import executor
+from whatabanger import mpsse
+from whatabanger import simulator
+from whatabanger import session
+from whatabanger import dump
+from whatabanger import snapshot
+from whatabanger import cortexm
+from whatabanger import ring
+from whatabanger import stm32
+from whatabanger import discovery
+from whatabanger import probe
+from whatabanger import aio
@@ -0,0 +1,251 @@
+'''
+Provides an asyncio front-end to a session - awaitable operations, pipelined
+as their synchronous equivalents are, which poll the response channel from
+the event loop rather than blocking on it. This allows a single process to
+drive many probes, and time out those which stall.
+'''
+
+import asyncio
+import logging
+import collections
+
+from whatabanger import swd
+from whatabanger import session
+from whatabanger import discovery
+
+# The interval between polls of the response channel while waiting, which
+# doubles up to the limit while nothing arrives.
+AIO_POLL_INTERVAL = 0.0005
+AIO_POLL_LIMIT = 0.01
+
+
+class Session(object):
+    '''
+    Provides an asyncio front-end to a session. Operations on a session run
+    one at a time, as the requests of each rely on the DAP state left by the
+    last, while operations on different sessions are interleaved by the
+    event loop. Every operation takes a deadline, in seconds, after which it
+    is cancelled.
+
+    Requests are never submitted beyond the window of the session, so that
+    submitting doesn't block waiting for responses. Requests already
+    submitted by an operation which is cancelled still complete, and their
+    responses are collected - and ignored - by the next operation.
+    '''
+
+    def __init__(self, session, timeout=None, interval=AIO_POLL_INTERVAL,
+                 limit=AIO_POLL_LIMIT):
+        ''' Ensure a logger is setup, and the session is accessible. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+        self.timeout = timeout
+
+        self.interval = interval
+        self.limit = limit
+        self._lock = asyncio.Lock()
+
+    async def _poll(self, interval):
+        ''' Collects responses received, or sleeps, returning the interval. '''
+        if self.session.poll():
+            return self.interval
+
+        await asyncio.sleep(interval)
+        return min(interval * 2, self.limit)
+
+    async def _wait(self, futures):
+        ''' Waits until all futures are resolved. '''
+        interval = self.interval
+        for future in futures:
+            while not future.done():
+                interval = await self._poll(interval)
+
+    async def _room(self, count):
+        ''' Waits until N requests can be submitted without blocking. '''
+        interval = self.interval
+        while self.session.space() < min(count, self.session.window):
+            interval = await self._poll(interval)
+
+    async def _run(self, operation, timeout, *args):
+        ''' Runs an operation alone on the session, within a deadline. '''
+        async def locked():
+            async with self._lock:
+                return await operation(*args)
+
+        if timeout is None:
+            timeout = self.timeout
+        return await asyncio.wait_for(locked(), timeout)
+
+    async def _read(self, addr, ap, apsel):
+        ''' Reads a DP, or AP, register. '''
+        await self._room(4)
+        if ap:
+            future = self.session.submit_read_ap([addr], apsel)[0]
+        else:
+            future = self.session.submit_read_dp(addr)
+
+        await self._wait([future])
+        return self.session.result(future)
+
+    async def read(self, addr, ap=False, apsel=None, timeout=None):
+        ''' Reads a DP register, or AP register if set, returning its value. '''
+        return await self._run(self._read, timeout, addr, ap, apsel)
+
+    async def _write(self, addr, value, ap, apsel):
+        ''' Writes a DP, or AP, register. '''
+        await self._room(2)
+        if ap:
+            pending = self.session.submit_write_ap(addr, value, apsel)
+        else:
+            pending = [self.session.submit_dp(addr, value)]
+
+        pending = [future for future in pending if future is not None]
+        await self._wait(pending)
+        for future in pending:
+            future.result()
+
+    async def write(self, addr, value, ap=False, apsel=None, timeout=None):
+        ''' Writes a DP register, or AP register if set. '''
+        await self._run(self._write, timeout, addr, value, ap, apsel)
+
+    async def _connect(self):
+        ''' Resets the line, clears errors, and returns the DP IDR. '''
+        await self._room(3)
+        if self.session.target is None:
+            self.session.submit(self.session.protocol.resync())
+        idr = self.session.submit_read_dp(0x0)
+        abort = self.session.submit(self.session.protocol.abort())
+
+        await self._wait([idr, abort])
+        abort.result()
+        return self.session.result(idr)
+
+    async def connect(self, timeout=None):
+        ''' Resets the line, clears errors, and returns the DP IDR. '''
+        return await self._run(self._connect, timeout)
+
+    def _requests(self, addr, length, size, packed):
+        ''' Returns the most requests which a read of a range may submit. '''
+        if size is None:
+            return sum(
+                self._requests(start, count, size, False)
+                for start, count, size in self.session._runs(addr, length)
+            )
+
+        # SELECT and CSW, then a TAR write and RDBUFF read per 1KB block,
+        # around a DRW read per transfer.
+        step = 4 if packed else 1 << size
+        wrap = session.SESSION_TAR_WRAP
+        blocks = (addr % wrap + length - 1) // wrap + 1
+        return 2 + 2 * blocks + length // step
+
+    def _chunks(self, addr, length, size, packed):
+        ''' Splits a range into chunks which fit in half the window. '''
+        # Chunks are aligned, so that only the head and tail of an unaligned
+        # range need sub-word transfers. Half the window is used, so that a
+        # chunk is submitted while the last is still in flight.
+        step = 4 if size is None or packed else 1 << size
+        least = 1 if size is None else step
+        budget = max(1, self.session.window // 2)
+
+        end = addr + length
+        while addr < end:
+            # Chunks are halved, staying aligned, until their requests -
+            # including the setup of each run and block - fit the budget.
+            chunk = step << (budget.bit_length() - 1)
+            while True:
+                count = min(end, (addr // chunk + 1) * chunk) - addr
+                if chunk == least or \
+                        self._requests(addr, count, size, packed) <= budget:
+                    break
+                chunk //= 2
+
+            yield addr, count
+            addr += count
+
+    async def _unpack(self, blocks):
+        ''' Waits for the blocks of a chunk, returning the data read. '''
+        result = bytearray()
+        for start, step, writes, reads in blocks:
+            await self._wait(writes + reads)
+            # Writes return nothing, but errors must still be raised.
+            for future in writes:
+                future.result()
+            result.extend(session.unpack(
+                start,
+                step,
+                [self.session.result(read) for read in reads],
+            ))
+        return bytes(result)
+
+    async def _read_memory(self, addr, length, size, packed):
+        ''' Reads memory via the MEM-AP, a chunk at a time. '''
+        result = bytearray()
+        inflight = collections.deque()
+        for start, count in self._chunks(addr, length, size, packed):
+            await self._room(self._requests(start, count, size, packed))
+            inflight.append(list(self.session.submit_read_memory(
+                start,
+                count,
+                size,
+                packed,
+            )))
+
+            # The previous chunk is collected while this one is in flight.
+            if len(inflight) > 1:
+                result.extend(await self._unpack(inflight.popleft()))
+
+        while inflight:
+            result.extend(await self._unpack(inflight.popleft()))
+        return bytes(result)
+
+    async def read_memory(self, addr, length, size=None, packed=False,
+                          timeout=None):
+        ''' Reads memory via the MEM-AP, using TAR auto-increment. '''
+        return await self._run(
+            self._read_memory,
+            timeout,
+            addr,
+            length,
+            size,
+            packed,
+        )
+
+    async def _enumerate_aps(self, early_stop, lookahead):
+        ''' Returns the APSEL, IDR and BASE of all implemented APs. '''
+        aps = []
+        for start in range(0, discovery.DISCOVERY_APS, lookahead):
+            # As discovery.Discovery, each AP only needs the SELECT, IDR and
+            # BASE reads, and RDBUFF - all without waiting.
+            await self._room(lookahead * 4)
+            pending = []
+            end = min(start + lookahead, discovery.DISCOVERY_APS)
+            for apsel in range(start, end):
+                pending.append((apsel, self.session.submit_read_ap(
+                    [swd.SWD_AP_IDR, swd.SWD_AP_BASE],
+                    apsel=apsel,
+                )))
+
+            for apsel, (idr, base) in pending:
+                await self._wait([idr, base])
+                idr = self.session.result(idr)
+                base = self.session.result(base)
+                if not idr:
+                    if early_stop:
+                        return aps
+                    continue
+
+                self.log.debug("Found AP 0x%02x with IDR 0x%08x", apsel, idr)
+                aps.append({'apsel': apsel, 'idr': idr, 'base': base})
+
+        return aps
+
+    async def enumerate_aps(self, early_stop=True,
+                            lookahead=discovery.DISCOVERY_LOOKAHEAD,
+                            timeout=None):
+        ''' Returns the APSEL, IDR and BASE of all implemented APs. '''
+        return await self._run(
+            self._enumerate_aps,
+            timeout,
+            early_stop,
+            lookahead,
+        )
@@ -0,0 +1,312 @@
+'''
+Provides debug access to a Cortex-M core - halting, resuming and accessing
+core registers via the Debug Control Block, per section C1.6 of ARM DDI0403E.
+'''
+
+import time
+import struct
+import logging
+
+# Debug Control Block registers.
+CORTEXM_DHCSR = 0xE000EDF0
+CORTEXM_DCRSR = 0xE000EDF4
+CORTEXM_DCRDR = 0xE000EDF8
+CORTEXM_DEMCR = 0xE000EDFC
+
+# Define known DHCSR fields. Writes must include the debug key, or are ignored.
+CORTEXM_DHCSR_DBGKEY = 0xA05F << 16
+CORTEXM_DHCSR_C_DEBUGEN = 1 << 0
+CORTEXM_DHCSR_C_HALT = 1 << 1
+CORTEXM_DHCSR_C_STEP = 1 << 2
+CORTEXM_DHCSR_C_MASKINTS = 1 << 3
+CORTEXM_DHCSR_S_REGRDY = 1 << 16
+CORTEXM_DHCSR_S_HALT = 1 << 17
+
+# Define known DCRSR fields.
+CORTEXM_DCRSR_REGWNR = 1 << 16
+
+# Core register numbers, as selected by DCRSR.REGSEL.
+CORTEXM_REG_SP = 13
+CORTEXM_REG_LR = 14
+CORTEXM_REG_PC = 15
+CORTEXM_REG_XPSR = 16
+CORTEXM_REG_MSP = 17
+CORTEXM_REG_PSP = 18
+
+# The register file - R0 to R12, SP, LR, PC, xPSR, MSP and PSP.
+CORTEXM_REGS = tuple(range(19))
+
+# The Thumb bit of xPSR, which must be set for a Cortex-M to execute.
+CORTEXM_XPSR_THUMB = 1 << 24
+
+# The architecturally defined SRAM region, where routines are run from.
+CORTEXM_SRAM_BASE = 0x20000000
+
+# A CRC32 routine, in Thumb code, matching zlib.crc32. Blocks of memory are
+# checksummed one after another, and the CRC of each stored to an array. On
+# entry, R0 is the address, R1 the block size, R2 the number of blocks and R3
+# the array. Blocks are processed bit-wise, as a table would need to be
+# uploaded - and costs more to transfer than it saves for a single pass.
+#
+#     00: ldr  r7, [pc, #40]     ; The (reflected) polynomial.
+#     02: movs r4, #0            ; Start each block with all ones.
+#     04: mvns r4, r4
+#     06: movs r5, r1
+#     08: ldrb r6, [r0, #0]      ; XOR in the next byte.
+#     0a: adds r0, #1
+#     0c: eors r4, r6
+#     0e: movs r6, #8
+#     10: lsrs r4, r4, #1        ; Shift out each bit, applying the
+#     12: bcc  0x16              ; polynomial if set.
+#     14: eors r4, r7
+#     16: subs r6, #1
+#     18: bne  0x10
+#     1a: subs r5, #1
+#     1c: bne  0x08
+#     1e: mvns r4, r4            ; Store the final CRC of the block.
+#     20: str  r4, [r3, #0]
+#     22: adds r3, #4
+#     24: subs r2, #1
+#     26: bne  0x02
+#     28: bkpt #0
+#     2a: bkpt #0
+#     2c: .word 0xEDB88320
+#
+CORTEXM_CRC32 = struct.pack(
+    '<22HI',
+    0x4F0A, 0x2400, 0x43E4, 0x000D, 0x7806, 0x3001, 0x4074, 0x2608,
+    0x0864, 0xD300, 0x407C, 0x3E01, 0xD1FA, 0x3D01, 0xD1F4, 0x43E4,
+    0x601C, 0x3304, 0x3A01, 0xD1EC, 0xBE00, 0xBE00, 0xEDB88320,
+)
+
+# Where the CRC array is placed, relative to the routine, and the number of
+# blocks checksummed per run - limiting the array to 1KB.
+CORTEXM_CRC32_DIGESTS = 0x40
+CORTEXM_CRC32_BATCH = 0x100
+
+
+class Core(object):
+    '''
+    Provides debug access to a Cortex-M core via a session. DHCSR, DCRSR and
+    DCRDR are in one 16 byte window, so all are accessed via the banked data
+    registers - allowing the transfer of each core register, and the check
+    of S_REGRDY after it, to be pipelined with the rest of the register file
+    rather than waiting on each in turn.
+    '''
+
+    def __init__(self, session, timeout=1.0):
+        ''' Ensure a logger is setup, and the session is accessible. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+
+        # The time, in seconds, to wait for the core to halt or transfer.
+        self.timeout = timeout
+
+    def _submit(self, accesses):
+        ''' Submits accesses to the debug registers, returning futures. '''
+        writes, futures = self.session.submit_banked(accesses)
+        for future in writes:
+            future.result()
+        return futures
+
+    def _poll(self, mask, message):
+        ''' Polls DHCSR until all bits of the mask are set, returning it. '''
+        deadline = time.monotonic() + self.timeout
+        while True:
+            status = self.session.read_word(CORTEXM_DHCSR)
+            if status & mask == mask:
+                return status
+            if time.monotonic() > deadline:
+                raise Exception(message)
+
+    def _control(self, value, mask=None, message=None):
+        ''' Writes DHCSR control bits, with the debug key, and waits. '''
+        # DHCSR is read back in the same burst, so the wait is only polled
+        # for if whatever was requested hasn't already happened.
+        write, status = self._submit([
+            (CORTEXM_DHCSR, CORTEXM_DHCSR_DBGKEY | value),
+            (CORTEXM_DHCSR, None),
+        ])
+        write.result()
+        status = self.session.result(status)
+        if mask is not None and status & mask != mask:
+            status = self._poll(mask, message)
+        return status
+
+    def halted(self):
+        ''' Returns whether the core is halted. '''
+        status = self.session.read_word(CORTEXM_DHCSR)
+        return bool(status & CORTEXM_DHCSR_S_HALT)
+
+    def halt(self):
+        ''' Halts the core, with interrupts masked, and waits until halted. '''
+        self._control(
+            CORTEXM_DHCSR_C_DEBUGEN | CORTEXM_DHCSR_C_HALT |
+            CORTEXM_DHCSR_C_MASKINTS,
+            CORTEXM_DHCSR_S_HALT,
+            "Timed out waiting for core to halt",
+        )
+
+    def step(self):
+        ''' Executes a single instruction, with interrupts masked. '''
+        # The core must be halted to step, and halts again once stepped.
+        self._control(
+            CORTEXM_DHCSR_C_DEBUGEN | CORTEXM_DHCSR_C_STEP |
+            CORTEXM_DHCSR_C_MASKINTS,
+            CORTEXM_DHCSR_S_HALT,
+            "Timed out waiting for core to step",
+        )
+
+    def resume(self, maskints=False):
+        ''' Resumes the core, optionally leaving interrupts masked. '''
+        value = CORTEXM_DHCSR_C_DEBUGEN
+        if maskints:
+            value |= CORTEXM_DHCSR_C_MASKINTS
+        self._control(value)
+
+    def _ready(self, status):
+        ''' Returns whether a transfer has completed, per DHCSR. '''
+        if not status & CORTEXM_DHCSR_S_HALT:
+            raise Exception("Core must be halted to access registers")
+        return bool(status & CORTEXM_DHCSR_S_REGRDY)
+
+    def read_registers(self, regs=CORTEXM_REGS):
+        ''' Reads core registers, returning a dictionary of their values. '''
+        # Each register is selected, and DHCSR and DCRDR read, in a single
+        # burst. Registers which weren't ready when DHCSR was read - which a
+        # transfer taking longer than an SWD transaction would cause - are
+        # read again.
+        values = {}
+        pending = list(regs)
+        deadline = time.monotonic() + self.timeout
+        while pending:
+            futures = self._submit([
+                access for reg in pending for access in (
+                    (CORTEXM_DCRSR, reg),
+                    (CORTEXM_DHCSR, None),
+                    (CORTEXM_DCRDR, None),
+                )
+            ])
+
+            retry = []
+            for idx, reg in enumerate(pending):
+                select, status, value = futures[idx * 3:idx * 3 + 3]
+                select.result()
+                if self._ready(self.session.result(status)):
+                    values[reg] = self.session.result(value)
+                else:
+                    retry.append(reg)
+
+            pending = retry
+            if pending and time.monotonic() > deadline:
+                raise Exception("Timed out reading core registers")
+
+        return values
+
+    def write_registers(self, values):
+        ''' Writes core registers, from a dictionary of their values. '''
+        # As for reads, but DCRDR must not be written until the transfer
+        # before has completed. If a register wasn't ready, it - and every
+        # register written after it - is written again.
+        pending = list(values.items())
+        deadline = time.monotonic() + self.timeout
+        while pending:
+            futures = self._submit([
+                access for reg, value in pending for access in (
+                    (CORTEXM_DCRDR, value),
+                    (CORTEXM_DCRSR, CORTEXM_DCRSR_REGWNR | reg),
+                    (CORTEXM_DHCSR, None),
+                )
+            ])
+
+            retry = []
+            for idx, item in enumerate(pending):
+                data, select, status = futures[idx * 3:idx * 3 + 3]
+                data.result()
+                select.result()
+                if retry or not self._ready(self.session.result(status)):
+                    retry.append(item)
+
+            pending = retry
+            if pending and time.monotonic() > deadline:
+                raise Exception("Timed out writing core registers")
+
+    def read_register(self, reg):
+        ''' Reads a core register, returning its value. '''
+        return self.read_registers([reg])[reg]
+
+    def write_register(self, reg, value):
+        ''' Writes a core register. '''
+        self.write_registers({reg: value})
+
+    def run(self, pc, registers=None, maskints=True):
+        ''' Sets the PC, and any other registers, then resumes the core. '''
+        registers = dict(registers or {})
+        registers[CORTEXM_REG_PC] = pc
+        registers[CORTEXM_REG_XPSR] = CORTEXM_XPSR_THUMB
+        self.write_registers(registers)
+        self.resume(maskints=maskints)
+
+
+class Checksum(object):
+    '''
+    Provides checksums of target memory computed by the core itself, so
+    that only a CRC per block - rather than every word - is read back over
+    SWD. The routine, and its results, overwrite the start of SRAM, and the
+    core is left halted.
+    '''
+
+    def __init__(self, session, core=None, base=CORTEXM_SRAM_BASE,
+                 timeout=10.0):
+        ''' Ensure the session, and core, are accessible. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+        self.core = core or Core(session)
+
+        # Where the routine, and the CRC array, are placed.
+        self.base = base
+        self.digests = base + CORTEXM_CRC32_DIGESTS
+
+        # The time, in seconds, to wait for all blocks to be checksummed.
+        self.timeout = timeout
+
+    def _run(self, addr, size, count):
+        ''' Runs the routine over N blocks, returning the CRC of each. '''
+        self.core.run(self.base, {
+            0: addr,
+            1: size,
+            2: count,
+            3: self.digests,
+        })
+
+        deadline = time.monotonic() + self.timeout
+        while not self.core.halted():
+            if time.monotonic() > deadline:
+                self.core.halt()
+                raise Exception("Timed out waiting for CRC routine")
+
+        return list(struct.unpack(
+            '<{}I'.format(count),
+            self.session.read_memory(self.digests, count * 4),
+        ))
+
+    def crc32(self, addr, length, block_size):
+        ''' Returns the CRC32 of each block of memory in a range. '''
+        self.core.halt()
+        self.session.write_memory(self.base, CORTEXM_CRC32)
+
+        # The routine only handles equally sized blocks, so any remainder is
+        # checksummed by a final run. Runs are also limited in the number of
+        # blocks, so the CRC array has a fixed size.
+        digests = []
+        count = length // block_size
+        while count:
+            batch = min(count, CORTEXM_CRC32_BATCH)
+            digests += self._run(addr, block_size, batch)
+            addr += batch * block_size
+            length -= batch * block_size
+            count -= batch
+        if length:
+            digests += self._run(addr, length, 1)
+
+        return digests
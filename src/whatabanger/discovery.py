@@ -0,0 +1,200 @@
+'''
+Provides discovery of the APs, and CoreSight components, behind a DAP - with
+the resulting topology cached on disk, keyed by the DP IDR, so that repeated
+connections to the same part are able to skip discovery entirely.
+'''
+
+import os
+import json
+import struct
+import logging
+
+from whatabanger import swd
+from whatabanger import transport
+
+# The number of APs which are able to be addressed by APSEL.
+DISCOVERY_APS = 256
+
+# The number of APs which are probed ahead, before the results are checked.
+DISCOVERY_LOOKAHEAD = 4
+
+# The maximum depth of nested ROM tables to walk.
+DISCOVERY_DEPTH = 8
+
+# Where discovered topologies are cached by default.
+DISCOVERY_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'whatabanger')
+
+# CoreSight component identification registers, per ARM IHI0029. PIDR4-7,
+# PIDR0-3 and CIDR0-3 are contiguous, so are read in a single transfer.
+CS_PIDR4 = 0xFD0
+CS_IDENT_LENGTH = 0x30
+
+# The fixed fields of a CIDR, and the component classes walked.
+CS_CIDR_PREAMBLE = 0xB105000D
+CS_CIDR_PREAMBLE_MASK = 0xFFFF0FFF
+CS_CLASS_ROM = 0x1
+CS_CLASS_CORESIGHT = 0x9
+
+# ROM table entries, per section 10.2.2 of ARM IHI0031C.
+ROM_ENTRIES = 960
+ROM_ENTRY_CHUNK = 16
+ROM_ENTRY_PRESENT = 1 << 0
+ROM_ENTRY_FORMAT = 1 << 1
+
+# AP IDR class, for a MEM-AP.
+AP_IDR_MEM_AP = 1 << 16
+
+
+def _signed(value):
+    ''' Returns a 32-bit value as a signed integer. '''
+    return value - (1 << 32) if value & (1 << 31) else value
+
+
+class Discovery(object):
+    '''
+    Provides discovery of the APs, and CoreSight components, behind a DAP.
+    APs are probed with the IDR and BASE reads of several APs pipelined, and
+    probing stops at the first AP not implemented - as ADIv5 requires APs
+    to be numbered contiguously from zero.
+    '''
+
+    def __init__(self, session, cache=DISCOVERY_CACHE,
+                 lookahead=DISCOVERY_LOOKAHEAD):
+        ''' Ensure a logger is setup, and the session is accessible. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+        self.cache = cache
+        self.lookahead = lookahead
+
+    def enumerate_aps(self, early_stop=True):
+        ''' Returns the APSEL, IDR and BASE of all implemented APs. '''
+        aps = []
+        for start in range(0, DISCOVERY_APS, self.lookahead):
+            # IDR and BASE are in the same bank, so each AP only needs the
+            # SELECT, two reads and RDBUFF - all without waiting.
+            pending = []
+            for apsel in range(start, min(start + self.lookahead, DISCOVERY_APS)):
+                pending.append((apsel, self.session.submit_read_ap(
+                    [swd.SWD_AP_IDR, swd.SWD_AP_BASE],
+                    apsel=apsel,
+                )))
+
+            for apsel, (idr, base) in pending:
+                idr = self.session.result(idr)
+                base = self.session.result(base)
+                if not idr:
+                    if early_stop:
+                        return aps
+                    continue
+
+                self.log.debug("Found AP 0x%02x with IDR 0x%08x", apsel, idr)
+                aps.append({'apsel': apsel, 'idr': idr, 'base': base})
+
+        return aps
+
+    def _identify(self, addr):
+        ''' Returns the identification of a component, or None if absent. '''
+        # ROM table entries may point at components which aren't powered, or
+        # don't exist, which is a bus error rather than a failure.
+        try:
+            data = self.session.read_memory(addr + CS_PIDR4, CS_IDENT_LENGTH)
+        except transport.AckError:
+            self.log.warning("No component responding at 0x%08x", addr)
+            return None
+        words = struct.unpack('<12I', data)
+
+        # Only the bottom byte of each identification register is used.
+        pidr = 0
+        for idx, word in enumerate(words[4:8] + words[0:4]):
+            pidr |= (word & 0xFF) << (idx * 8)
+        cidr = 0
+        for idx, word in enumerate(words[8:12]):
+            cidr |= (word & 0xFF) << (idx * 8)
+
+        if cidr & CS_CIDR_PREAMBLE_MASK != CS_CIDR_PREAMBLE:
+            return None
+
+        return {
+            'address': addr,
+            'class': (cidr >> 12) & 0xF,
+            'cidr': cidr,
+            'pidr': pidr,
+            'part': pidr & 0xFFF,
+            'designer': ((pidr >> 12) & 0x7F) | ((pidr >> 32) & 0xF) << 7,
+        }
+
+    def _entries(self, addr):
+        ''' Yields the entries of a ROM table, up to the first empty entry. '''
+        for offset in range(0, ROM_ENTRIES * 4, ROM_ENTRY_CHUNK * 4):
+            data = self.session.read_memory(addr + offset, ROM_ENTRY_CHUNK * 4)
+            for (entry,) in struct.iter_unpack('<I', data):
+                if not entry:
+                    return
+                yield entry
+
+    def walk(self, addr, depth=0, seen=None):
+        ''' Walks a ROM table, returning the tree of components found. '''
+        if seen is None:
+            seen = set()
+        seen.add(addr)
+
+        component = self._identify(addr)
+        if component is None or component['class'] != CS_CLASS_ROM:
+            return component
+
+        component['children'] = []
+        if depth >= DISCOVERY_DEPTH:
+            self.log.warning("ROM table at 0x%08x is nested too deep", addr)
+            return component
+
+        for entry in self._entries(addr):
+            if not entry & ROM_ENTRY_PRESENT:
+                continue
+
+            # Entries are signed offsets from the ROM table itself. Tables
+            # which refer back to themselves are only walked once.
+            child = (addr + _signed(entry & 0xFFFFF000)) & 0xFFFFFFFF
+            if child in seen:
+                continue
+
+            found = self.walk(child, depth + 1, seen)
+            if found is not None:
+                component['children'].append(found)
+
+        return component
+
+    def _path(self, idr):
+        ''' Returns the path of the cached topology for a DP IDR. '''
+        return os.path.join(self.cache, '{:08x}.json'.format(idr))
+
+    def discover(self, refresh=False, early_stop=True):
+        ''' Connects, and returns the topology - from the cache if present. '''
+        idr = self.session.connect()
+        path = self._path(idr)
+        if not refresh and os.path.exists(path):
+            self.log.info("Using cached topology from %s", path)
+            with open(path, 'r') as handle:
+                return json.load(handle)
+
+        topology = {'dp': idr, 'aps': self.enumerate_aps(early_stop)}
+        for ap in topology['aps']:
+            # Only MEM-APs have a ROM table, which may be marked not present
+            # - or be the legacy 'no entry' value.
+            ap['rom'] = None
+            base = ap['base']
+            if not ap['idr'] & AP_IDR_MEM_AP or base == 0xFFFFFFFF or \
+                    (base & ROM_ENTRY_FORMAT and not base & ROM_ENTRY_PRESENT):
+                continue
+
+            apsel = self.session.apsel
+            self.session.apsel = ap['apsel']
+            try:
+                ap['rom'] = self.walk(base & 0xFFFFF000)
+            finally:
+                self.session.apsel = apsel
+
+        os.makedirs(self.cache, exist_ok=True)
+        with open(path, 'w') as handle:
+            json.dump(topology, handle, indent=2)
+
+        return topology
@@ -0,0 +1,79 @@
+'''
+Provides a memory dump pipeline - streaming data from a session directly to a
+file, or a pre-sized mmap, so that memory use is constant regardless of the
+size of the range being dumped.
+'''
+
+import mmap
+import time
+import logging
+
+
+class Progress(object):
+    '''
+    Provides progress reporting for long running operations - logging the
+    throughput at a fixed interval, rather than per word.
+    '''
+
+    def __init__(self, total, interval=5.0):
+        ''' Ensure a logger is setup, and the start time is known. '''
+        self.log = logging.getLogger(__name__)
+        self.total = total
+        self.interval = interval
+
+        self.done = 0
+        self.start = time.monotonic()
+        self._last = self.start
+
+    def rate(self):
+        ''' Returns the average throughput so far, in bytes per second. '''
+        elapsed = time.monotonic() - self.start
+        return self.done / elapsed if elapsed else 0.0
+
+    def update(self, count):
+        ''' Records N bytes as done, logging progress if the interval passed. '''
+        self.done += count
+
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.report()
+
+    def report(self):
+        ''' Logs the current progress and throughput. '''
+        self.log.info(
+            "-> %d of %d bytes (%.1f%%) at %.1f KB/s",
+            self.done,
+            self.total,
+            (self.done * 100.0 / self.total) if self.total else 100.0,
+            self.rate() / 1024,
+        )
+
+
+def dump(session, addr, length, path, use_mmap=False, interval=5.0):
+    ''' Dumps memory to a file, returning the average throughput. '''
+    progress = Progress(length, interval=interval)
+
+    with open(path, 'w+b' if use_mmap else 'wb') as handle:
+        # If using mmap, the file must be sized before mapping.
+        view = None
+        if use_mmap and length:
+            handle.truncate(length)
+            view = mmap.mmap(handle.fileno(), length)
+
+        offset = 0
+        for data in session.stream_memory(addr, length):
+            if view is not None:
+                view[offset:offset + len(data)] = data
+            else:
+                handle.write(data)
+
+            offset += len(data)
+            progress.update(len(data))
+
+        if view is not None:
+            view.flush()
+            view.close()
+
+    progress.report()
+    return progress.rate()
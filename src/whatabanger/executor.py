@@ -5,19 +5,38 @@ and has been built to use queues to try and reduce clock jitter.
  '''
 
 import time
-import logging
-import multiprocessing
 
 from whatabanger import swd
 from whatabanger import helpers
+from whatabanger import timing
+from whatabanger import waveform
+from whatabanger import transport
 
-from struct import pack
-from struct import unpack
-from operator import xor
-from pyftdi.gpio import GpioController 
+from pyftdi.ftdi import Ftdi
 
+# The maximum number of port states to write before reading back the states
+# sampled in synchronous bit-bang mode. This must fit in the FT2232H buffers.
+CHUNK_SIZE = 2048
 
-class Executor(multiprocessing.Process):
+# The default interface - the first on the first FT2232H found.
+EXECUTOR_URL = 'ftdi://0x0403:0x6010/1'
+
+# The half SWCLK cycle times tried by auto-tune, slowest first. Zero runs as
+# fast as the interface allows.
+EXECUTOR_TUNE_INTERVALS = (
+    1.0E-3, 2.0E-4, 1.0E-4, 2.0E-5, 1.0E-5, 2.0E-6, 1.0E-6, 0.0,
+)
+
+# The number of DP IDR reads which must all succeed at a clock rate.
+EXECUTOR_TUNE_READS = 32
+
+# Once tuned, the clock rate is lowered if this many errors are seen within
+# a window of transfers. Occasional FAULTs are expected, from bus errors.
+EXECUTOR_TUNE_WINDOW = 256
+EXECUTOR_TUNE_ERRORS = 8
+
+
+class Executor(transport.Transport):
     '''
     Provides an executor - responsible for banging data onto and off of the
     wire - which is intended to be run in a separate process. This also
@@ -25,19 +44,20 @@ class Executor(multiprocessing.Process):
     jitter.
     '''
 
-    def __init__(self, req, res, swclk=0x01, swdio=0x02, clock=0.001):
+    def __init__(self, req, res, swclk=0x01, swdio=0x02, clock=0.001,
+                 keepalive=None, retries=transport.TRANSPORT_RETRIES,
+                 url=EXECUTOR_URL, autotune=False):
         ''' Ensure a logger is setup, and access to the GPIO is possible. '''
-        super(Executor, self).__init__()
-        self.log = logging.getLogger(__name__)
+        super(Executor, self).__init__(
+            req,
+            res,
+            keepalive=keepalive,
+            retries=retries,
+        )
 
         # The intial state is everything pulled LOW.
         self.state = 0x0
 
-        # Ensure the work queue is accessible - this is used for the parent
-        # to push request to bang onto the wire.
-        self._in = req
-        self._out = res
-
         # Defaults are:
         #     Pin D0 - 0x01 - OUT (TCK)
         #     Pin D1 - 0x02 - OUT (TDI / TDO)
@@ -45,135 +65,270 @@ class Executor(multiprocessing.Process):
         self.swdio = swdio
 
         # Setup the clock interval. This isn't the cycle time, but half the
-        # target cycle time.
+        # target cycle time. An interval of zero runs as fast as possible.
         self.clock = clock
+        self.timing = timing.Clock(clock)
+
+        # Requests are compiled into port states ahead of time, so that an
+        # entire phase can be banged onto the wire in a single bulk write.
+        self.compiler = waveform.Compiler(swclk=swclk, swdio=swdio)
+
+        # When auto-tuned, the index of the interval in use. Transfers, and
+        # errors, are counted to know when to fall back to a slower clock.
+        self._tuned = None
+        self._intervals = EXECUTOR_TUNE_INTERVALS
+        self._transfers = 0
+        self._errors = 0
+        self._resync = swd.Protocol().resync()
 
         # Setup the interface.
-        self.gpio = GpioController()
-        self.log.debug("Setting up FT2232 for GPIO")
-        self.gpio.open_from_url(url='ftdi://0x0403:0x6010/1', direction=0xFF)
+        self.url = url
+        self._open()
+        if autotune:
+            self.tune()
+
+    def _open(self):
+        ''' Setup the interface, and set the initial GPIO state. '''
+        # Synchronous bit-bang mode is used so that the state of the port is
+        # sampled for every state written, and one port state is emitted per
+        # half-cycle.
+        self.direction = 0xFF
+        self.ftdi = Ftdi()
+        self.log.debug("Setting up FT2232 for synchronous bit-bang")
+        self.ftdi.open_bitbang_from_url(url=self.url, direction=self.direction)
+        self.ftdi.set_bitmode(self.direction, Ftdi.BITMODE_SYNCBB)
+        self.ftdi.set_baudrate(self.timing.rate())
 
         # Set the initial GPIO state.
         self.log.debug("Setting the initial GPIO state to %s", self.state)
-        self.gpio.write_port(self.state)
-
-    def _write_bits(self, bits):
-        ''' Write bits onto the wire (Master to Target) communication. '''
-        self.log.debug("Starting banging bits (%s)", bits)
-
-        # First, ensure the GPIO is set to OUT.
-        self.gpio.set_direction(self.swdio, self.swdio)
-
-        for bit in bits:
-            # Pull the clock HIGH.
-            self.state |= self.swclk
-            self.gpio.write_port(self.state)
-            time.sleep(self.clock)
-
-            # Check whether we need to write a HIGH or LOW for the bit to be
-            # transmitted (where HIGH is 1).
-            if bit == 1:
-                self.state |= self.swdio
-            else:
-                self.state &= ~self.swdio
-
-            # Send data via SWDIO on the FALLING-edge of the clock.
-            self.state &= ~self.swclk
-            self.gpio.write_port(self.state)
-            time.sleep(self.clock)
-
-        # If there's not a Logic Analyser connected, determining when all
-        # data has been sent is a pain. Thus, this.
-        self.log.debug("Finished banging bits")
-
-    def _read_bits(self, count):
-        ''' Reads N bits from the wire (Target to Master) communication. '''
-        self.log.debug("Reading %s bits", count)
-
-        # First, ensure that the SWDIO pin is set to IN, rather than OUT, and
-        # leave it the fuck alone.
-        self.gpio.set_direction(self.swdio, 0x0)
-
-        result = []
+        self._exchange(bytes([self.state]))
+        self.set_clock(self.clock)
+
+    def set_clock(self, interval):
+        ''' Changes the clock interval, and measures the rate achieved. '''
+        self.clock = interval
+        self.timing.interval = interval or 0.0
+        self.ftdi.set_baudrate(self.timing.rate())
+
+        # The rate actually achieved depends on the interface, and USB, so
+        # is measured with SWDIO driven LOW (idle).
+        self.timing.calibrate(
+            self._exchange,
+            self.compiler.clock(self.timing.cycles()),
+        )
+
+    def _errored(self, count, expected):
+        ''' Returns the number of N DP IDR reads which were not as expected. '''
+        errors = 0
+        self._execute(self._resync)
         for _ in range(count):
-            # Data will be banged onto the wire by the target device on the
-            # RISING edge.
-            self.state |= self.swclk
-            self.gpio.write_port(self.state)
-
-            # Finally, read the state of SWDIO to determine the value sent by
-            # the target.
-            if(self.gpio.read() & self.swdio) == self.swdio:
-                result.append(1)
-            else:
-                result.append(0)
-
-            # Sleep and then drive the clock LOW to complete the cycle.
-            time.sleep(self.clock)
-            self.state &= ~self.swclk
-            self.gpio.write_port(self.state)
-            time.sleep(self.clock)
+            try:
+                data = self._execute(self._idr)
+            except transport.AckError:
+                errors += 1
+                continue
+
+            value = data[0:32].value
+            if not swd.check_parity(data[32], value) or \
+                    (expected is not None and value != expected):
+                errors += 1
+
+        return errors
+
+    def tune(self, intervals=EXECUTOR_TUNE_INTERVALS,
+             count=EXECUTOR_TUNE_READS):
+        ''' Selects the fastest clock at which DP IDR reads are error free. '''
+        # DP IDR is first read at the slowest clock, and used as the known
+        # answer for every faster clock.
+        self._tuned = None
+        tuned = None
+        expected = None
+        for idx, interval in enumerate(intervals):
+            self.set_clock(interval)
+            if self._errored(1, expected):
+                break
+            if expected is None:
+                expected = self._execute(self._idr)[0:32].value
+            if self._errored(count, expected):
+                break
+            tuned = idx
+
+        if tuned is None:
+            raise Exception("Unable to read DP IDR at any clock rate")
+
+        self._tuned = tuned
+        self._intervals = intervals
+        self.set_clock(intervals[tuned])
+        self._execute(self._resync)
+        self._execute(self._abort)
+        self.log.info(
+            "SWCLK tuned to %.1f Hz (DP IDR 0x%08x)",
+            self.timing.calibrated,
+            expected,
+        )
+        return self.clock
+
+    def _monitor(self, error):
+        ''' Counts a transfer, returning whether the clock was slowed. '''
+        if self._tuned is None:
+            return False
+
+        self._transfers += 1
+        self._errors += error
+        if self._errors >= EXECUTOR_TUNE_ERRORS and self._tuned > 0:
+            self.log.warning(
+                "%d errors in %d transfers, slowing SWCLK",
+                self._errors,
+                self._transfers,
+            )
+            self._tuned -= 1
+            self._transfers = 0
+            self._errors = 0
+            self.set_clock(self._intervals[self._tuned])
+
+            # The target may have lost track of the protocol, so the line is
+            # reset - after which DPIDR must be read before anything else.
+            self._execute(self._resync)
+            self._execute(self._idr)
+            return True
+
+        if self._transfers >= EXECUTOR_TUNE_WINDOW:
+            self._transfers = 0
+            self._errors = 0
+        return False
+
+    def _set_direction(self, drive):
+        ''' Sets SWDIO to OUT when the host drives the wire, or IN if not. '''
+        if drive:
+            direction = self.direction | self.swdio
+        else:
+            direction = self.direction & ~self.swdio
+
+        # Changing direction requires a control transfer, so only do this if
+        # actually required.
+        if direction != self.direction:
+            self.direction = direction
+            self.ftdi.set_bitmode(self.direction, Ftdi.BITMODE_SYNCBB)
+
+    def _exchange(self, states):
+        ''' Bang port states onto the wire, returning the sampled states. '''
+        # Each chunk is paced against the deadline of the last, so SWCLK runs
+        # no faster than requested.
+        start = time.perf_counter()
+        result = bytearray()
+        for offset in range(0, len(states), CHUNK_SIZE):
+            chunk = states[offset:offset + CHUNK_SIZE]
+            self.timing.pace(len(chunk))
+            self.ftdi.write_data(chunk)
+            result.extend(self.ftdi.read_data_bytes(len(chunk), attempt=8))
+
+        self.timing.account(len(states), time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        ''' Returns transport stats, and the achieved SWCLK frequency. '''
+        stats = super(Executor, self).stats()
+        stats['frequency'] = self.timing.frequency()
+        stats['calibrated'] = self.timing.calibrated
+        return stats
+
+    def _execute(self, request):
+        ''' Bang a request onto the wire, and return any data read. '''
+        # The entire request is compiled up-front, so that each phase is a
+        # single bulk write rather than one write per edge.
+        try:
+            result = self._bang(self.compiler.compile(request))
+        except transport.AckError as err:
+            # WAITs are the target being busy, not a problem with the link.
+            self._monitor(err.ack != swd.SWD_ACK_WAIT)
+            raise
+
+        # Reads are checked for parity errors, but still returned - as it's
+        # up to the caller what to do about them. If the line was reset to
+        # slow the clock, the request fails so that the caller knows the
+        # state of the DAP is lost, rather than it being replayed.
+        if request['READ'] and request['ACK'] and len(result) == 33:
+            value = result[0:32].value
+            if self._monitor(not swd.check_parity(result[32], value)):
+                raise transport.ClockChanged()
+        return result
+
+    def _bang(self, phases):
+        ''' Bang compiled phases onto the wire, and return any data read. '''
+        result = helpers.Bits()
+        for idx, phase in enumerate(phases):
+            self._set_direction(phase.drive)
+            bits = self._sample(self._exchange(phase.states), phase.samples)
+
+            # ACKs are checked as soon as the phase they appear in has been
+            # banged, as a failure means any following phases are skipped.
+            if phase.ack:
+                try:
+                    self._check_ack(bits[0:phase.ack])
+                except transport.AckError:
+                    # A read ACK is followed by data, rather than 'turn-round',
+                    # so this is clocked before the host drives SWDIO again.
+                    if idx + 1 < len(phases) and not phases[idx + 1].drive:
+                        self._exchange(self.compiler.clock())
+                    raise
+            result += bits[phase.ack:phase.ack + phase.read]
 
         self.log.debug("Read %s", result)
         return result
 
+    def _sample(self, sampled, samples, offset=0):
+        ''' Extract the state of SWDIO from sampled port states. '''
+        value = 0x0
+        for bit, idx in enumerate(samples):
+            if sampled[offset + idx] & self.swdio:
+                value |= 1 << bit
+
+        return helpers.Bits(value, len(samples))
+
+    def _stream(self, requests):
+        ''' Bang requests onto the wire, returning the ACK and data of each. '''
+        # With ORUNDETECT set, every request has the same phases whatever the
+        # ACK, so all requests are compiled up-front and phases which drive
+        # SWDIO in the same direction are merged into a single exchange.
+        phases = []
+        owners = []
+        for idx, request in enumerate(requests):
+            for phase in self.compiler.compile(request):
+                phases.append(phase)
+                owners.append(idx)
+
+        acks = [swd.SWD_ACK_OK] * len(requests)
+        results = [helpers.Bits() for _ in requests]
+
+        start = 0
+        while start < len(phases):
+            drive = phases[start].drive
+            end = start
+            states = bytearray()
+            offsets = []
+            while end < len(phases) and phases[end].drive == drive:
+                offsets.append(len(states))
+                states.extend(phases[end].states)
+                end += 1
+
+            self._set_direction(drive)
+            sampled = self._exchange(states)
+            for phase, offset, owner in zip(
+                    phases[start:end], offsets, owners[start:end]):
+                bits = self._sample(sampled, phase.samples, offset)
+                if phase.ack:
+                    acks[owner] = bits[0:phase.ack].value
+                results[owner] += bits[phase.ack:phase.ack + phase.read]
+            start = end
+
+        return list(zip(acks, results))
+
     def _write_clock(self):
         ''' 'Write' a clock cycle without sending any data. '''
-        # Pull the clock HIGH.
-        self.state |= self.swclk
-        self.gpio.write_port(self.state)
-        time.sleep(self.clock)
-
-        # Pull the clock LOW.
-        self.state &= ~self.swclk
-        self.gpio.write_port(self.state)
-        time.sleep(self.clock)
-
-    def _check_ack(self):
-        ''' Convenience method to handle ACKs. '''
-        # TODO: Handle SWD_ACK_WAIT.
-        ack = helpers.bits_to_bytes(self._read_bits(3))
-        if ack != swd.SWD_ACK_OK:
-            raise Exception("SWD ACK response was NOT OK")
-
-    def run(self):
-        ''' Starts clocking SWCLK, and banging bits onto SWDIO as needed. '''
-        self.log.info("Bit banger clock and monitor started")
-        while True:
-            # Ensure data is sent, if there is anything in the queue.
-            if self._in.qsize() > 0:
-                request = self._in.get()
-                result = []
-
-                # Write the request, and read results - if required.
-                self._write_bits(request['CMD'])
-                if request['ACK']:
-                    # 'Turn-round' so the target can control SWDIO.
-                    self._write_clock()
-                    self._check_ack()
-
-                    # Reading data and writing data are mutually exclusive in
-                    # a single operation - with the exception of ACKs - so
-                    # we don't allow both.
-                    if request['DATA']:
-                        # 'Turn-round' so the host can again control SWDIO.
-                        self._write_clock()
-                        self._write_bits(request['DATA'])
-                    elif request['READ']:
-                        # 32-bits for the payload, plus the parity, and then
-                        # 'turn-round' again to return control of SWDIO to
-                        # the host.
-                        result = self._read_bits(33)
-                        self._read_bits(1)
-
-                    # Complete the operation by clocking out 8 more rising
-                    # edges.
-                    self._write_bits([0b0] * 8)
-
-                # A result is always sent back to the main thread, even if
-                # empty. This allows it to confirm requests were serviced.
-                self._out.put(result)
-            else:
-                # If no data is pending send, make sure we still drive the
-                # clock.
-                self._write_clock()
+        self._set_direction(True)
+        self._exchange(self.compiler.clock())
+
+    def _write_idle(self, count):
+        ''' 'Write' N clock cycles without sending any data. '''
+        self._set_direction(True)
+        self._exchange(self.compiler.clock(count))
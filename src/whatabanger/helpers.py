@@ -6,6 +6,94 @@ JDEC_JEP106 = {
 }
 
 
+class Bits(object):
+    '''
+    Provides a packed sequence of bits - stored as an integer and a length,
+    with the first bit on the wire being the LSb. This compares equal to, and
+    can be iterated and sliced like, a list of bits (LSb first) but without
+    allocating one.
+    '''
+
+    __slots__ = ('value', 'length')
+
+    def __init__(self, value=0x0, length=0):
+        ''' Ensure the value is masked to the length. '''
+        self.value = value & ((1 << length) - 1)
+        self.length = length
+
+    @classmethod
+    def of(cls, bits):
+        ''' Returns Bits for a list of bits (LSb first), or Bits as-is. '''
+        if isinstance(bits, cls):
+            return bits
+
+        value = 0x0
+        length = 0
+        for bit in bits:
+            value |= bit << length
+            length += 1
+
+        return cls(value, length)
+
+    def __len__(self):
+        ''' Returns the number of bits. '''
+        return self.length
+
+    def __bool__(self):
+        ''' Bits are only false if empty, as with a list. '''
+        return self.length > 0
+
+    def __iter__(self):
+        ''' Yields each bit, LSb first. '''
+        for idx in range(self.length):
+            yield (self.value >> idx) & 0b1
+
+    def __getitem__(self, key):
+        ''' Returns a bit, or a contiguous slice of Bits. '''
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step != 1:
+                raise Exception("Bits can only be sliced contiguously")
+            stop = max(start, stop)
+            return Bits(self.value >> start, stop - start)
+
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError("Bit index out of range")
+
+        return (self.value >> key) & 0b1
+
+    def __add__(self, other):
+        ''' Concatenates bits, with other following self. '''
+        other = Bits.of(other)
+        return Bits(
+            self.value | (other.value << self.length),
+            self.length + other.length,
+        )
+
+    def __eq__(self, other):
+        ''' Compares against Bits, or a list of bits. '''
+        if not isinstance(other, (Bits, list, tuple)):
+            return NotImplemented
+
+        other = Bits.of(other)
+        return (self.value, self.length) == (other.value, other.length)
+
+    def __hash__(self):
+        ''' Allows Bits to be used as a key. '''
+        return hash((self.value, self.length))
+
+    def __repr__(self):
+        ''' Returns a compact representation of the bits. '''
+        return 'Bits(0x{:x}, {})'.format(self.value, self.length)
+
+    def count(self, bit):
+        ''' Returns the number of bits set to the given value (popcount). '''
+        ones = bin(self.value).count('1')
+        return ones if bit else self.length - ones
+
+
 def to_bit_list(entries, width=8, bitflip=False):
     ''' Convert interger list to a list of bits. '''
     result = []
@@ -24,6 +112,9 @@ def to_bit_list(entries, width=8, bitflip=False):
 
 def bits_to_bytes(data):
     ''' Convert a list of bits to bytes - also flips LSb to MSb. '''
+    if isinstance(data, Bits):
+        return data.value
+
     result = 0x0
     for idx, bit in enumerate(data):
         result |= bit << idx
@@ -0,0 +1,232 @@
+'''
+Provides an MPSSE based executor - which uses the FT2232H MPSSE engine to
+clock data onto and off of the wire, rather than bit banging. This allows
+SWCLK to be generated by hardware, in the MHz range, without jitter.
+'''
+
+from whatabanger import swd
+from whatabanger import helpers
+from whatabanger import executor
+from whatabanger import transport
+
+from pyftdi.ftdi import Ftdi
+
+# MPSSE pins are fixed in hardware. SWDIO must be connected to TDI via a
+# series resistor (~470R) and directly to TDO, so that the target is able to
+# drive the line when TDI is switched to an input during 'turn-round'.
+#     Pin D0 - 0x01 - OUT (TCK / SWCLK)
+#     Pin D1 - 0x02 - OUT (TDI / SWDIO)
+#     Pin D2 - 0x04 - IN  (TDO / SWDIO)
+MPSSE_SWCLK = 0x01
+MPSSE_SWDIO = 0x02
+MPSSE_SWDI = 0x04
+
+
+class MpsseExecutor(executor.Executor):
+    '''
+    Provides an MPSSE based executor - which uses the FT2232H MPSSE engine to
+    clock data onto and off of the wire. This accepts the same requests as the
+    bit banged executor, so callers do not need to change.
+    '''
+
+    def __init__(self, req, res, frequency=1.0E6, keepalive=None,
+                 retries=transport.TRANSPORT_RETRIES,
+                 url=executor.EXECUTOR_URL):
+        ''' Ensure the MPSSE clock frequency is known before setup. '''
+        self.frequency = frequency
+        super(MpsseExecutor, self).__init__(
+            req,
+            res,
+            swclk=MPSSE_SWCLK,
+            swdio=MPSSE_SWDIO,
+            clock=1.0 / (frequency * 2),
+            keepalive=keepalive,
+            retries=retries,
+            url=url,
+        )
+
+    def _open(self):
+        ''' Setup the interface for MPSSE, with SWCLK LOW and SWDIO OUT. '''
+        self.direction = MPSSE_SWCLK | MPSSE_SWDIO
+        self.ftdi = Ftdi()
+        self.log.debug("Setting up FT2232 for MPSSE")
+        self.frequency = self.ftdi.open_mpsse_from_url(
+            url=self.url,
+            direction=self.direction,
+            initial=self.state,
+            frequency=self.frequency,
+        )
+        self.log.debug("MPSSE clock set to %s Hz", self.frequency)
+
+    def stats(self):
+        ''' Returns transport stats, and the SWCLK frequency. '''
+        # SWCLK is generated by the MPSSE, so runs at the programmed rate.
+        stats = super(MpsseExecutor, self).stats()
+        stats['frequency'] = self.frequency
+        stats['calibrated'] = self.frequency
+        return stats
+
+    def _direction(self, drive):
+        ''' Returns MPSSE commands to drive, or release, SWDIO. '''
+        if drive:
+            direction = MPSSE_SWCLK | MPSSE_SWDIO
+        else:
+            direction = MPSSE_SWCLK
+
+        return bytearray([Ftdi.SET_BITS_LOW, self.state, direction])
+
+    def _write(self, bits):
+        ''' Returns MPSSE commands to clock bits out onto the wire. '''
+        bits = helpers.Bits.of(bits)
+        cmd = bytearray()
+        whole = bits.length // 8
+
+        # Whole bytes are clocked out in a single command, LSb first, with
+        # data changed on the FALLING edge.
+        if whole:
+            cmd.extend([Ftdi.WRITE_BYTES_NVE_LSB, (whole - 1) & 0xFF,
+                        ((whole - 1) >> 8) & 0xFF])
+            cmd.extend((bits.value & ((1 << (whole * 8)) - 1)).to_bytes(
+                whole,
+                'little',
+            ))
+
+        # Any remaining bits must be clocked out separately.
+        remain = bits.length - (whole * 8)
+        if remain:
+            cmd.extend([Ftdi.WRITE_BITS_NVE_LSB, remain - 1,
+                        bits.value >> (whole * 8)])
+
+        return cmd
+
+    def _read(self, count):
+        ''' Returns MPSSE commands, and their widths, to clock N bits in. '''
+        cmd = bytearray()
+        widths = []
+        while count > 0:
+            # Only up to 8 bits can be clocked in by a single command.
+            width = min(count, 8)
+            cmd.extend([Ftdi.READ_BITS_PVE_LSB, width - 1])
+            widths.append(width)
+            count -= width
+
+        return cmd, widths
+
+    def _transfer(self, cmd, widths):
+        ''' Send MPSSE commands to the FT2232H, and read back all bits. '''
+        cmd.append(Ftdi.SEND_IMMEDIATE)
+        self.ftdi.write_data(cmd)
+        if not widths:
+            return helpers.Bits()
+
+        # Each read command returns a byte, with partial bytes shifted in
+        # from the MSb - so these need realigning.
+        result = helpers.Bits()
+        data = self.ftdi.read_data_bytes(len(widths), attempt=8)
+        for byte, width in zip(data, widths):
+            result += helpers.Bits(byte >> (8 - width), width)
+
+        return result
+
+    def _execute(self, request):
+        ''' Clock a request onto the wire, and return any data read. '''
+        cmd = self._write(request['CMD'])
+        if not request['ACK']:
+            self._transfer(cmd, [])
+            return helpers.Bits()
+
+        # Release SWDIO for the 'turn-round', and read the ACK.
+        read, widths = self._read(4)
+        cmd.extend(self._direction(False))
+        cmd.extend(read)
+
+        # The ACK must be checked before anything more is clocked, as data
+        # clocked for a request which was not ACKed as OK would be seen by
+        # the target as the start of another request. This means every
+        # request takes two USB round trips.
+        ack = self._transfer(cmd, widths)
+        try:
+            self._check_ack(ack[1:4])
+        except transport.AckError:
+            # 'Turn-round' so that a retry starts with the host driving the
+            # line.
+            cmd, widths = self._read(1)
+            cmd.extend(self._direction(True))
+            self._transfer(cmd, widths)
+            raise
+
+        result = helpers.Bits()
+        if request['DATA']:
+            # 'Turn-round' so the host can again control SWDIO.
+            cmd, widths = self._read(1)
+            cmd.extend(self._direction(True))
+            cmd.extend(self._write(request['DATA']))
+        else:
+            # For a READ, 32-bits for the payload, plus the parity, and then
+            # 'turn-round' again to return control of SWDIO to the host.
+            cmd, widths = self._read(34 if request['READ'] else 1)
+            cmd.extend(self._direction(True))
+        cmd.extend(self._write(helpers.Bits(0x0, 8)))
+
+        bits = self._transfer(cmd, widths)
+        if request['READ'] and not request['DATA']:
+            result = bits[0:33]
+
+        self.log.debug("Read %s", result)
+        return result
+
+    def _stream(self, requests):
+        ''' Clock requests onto the wire, returning the ACK and data of each. '''
+        # With ORUNDETECT set, the data phase of a write is clocked whatever
+        # the ACK, so every request can be sent in a single round trip.
+        cmd = bytearray()
+        widths = []
+        layout = []
+        for request in requests:
+            cmd.extend(self._write(request['CMD']))
+            if not request['ACK']:
+                layout.append(0)
+                continue
+
+            read, more = self._read(4)
+            cmd.extend(self._direction(False))
+            cmd.extend(read)
+            if request['DATA']:
+                extra, count = self._read(1)
+                cmd.extend(extra)
+                cmd.extend(self._direction(True))
+                cmd.extend(self._write(request['DATA']))
+            else:
+                extra, count = self._read(34 if request['READ'] else 1)
+                cmd.extend(extra)
+                cmd.extend(self._direction(True))
+            cmd.extend(self._write(helpers.Bits(0x0, 8)))
+
+            widths.extend(more + count)
+            layout.append(sum(more + count))
+
+        # Split the bits read back between the requests which read them.
+        bits = self._transfer(cmd, widths)
+        results = []
+        offset = 0
+        for request, width in zip(requests, layout):
+            if not width:
+                results.append((swd.SWD_ACK_OK, helpers.Bits()))
+                continue
+
+            ack = bits[offset + 1:offset + 4].value
+            data = helpers.Bits()
+            if request['READ'] and not request['DATA']:
+                data = bits[offset + 4:offset + 37]
+            results.append((ack, data))
+            offset += width
+
+        return results
+
+    def _write_clock(self):
+        ''' 'Write' a clock cycle without sending any data. '''
+        self._transfer(self._write(helpers.Bits(0x0, 1)), [])
+
+    def _write_idle(self, count):
+        ''' 'Write' N clock cycles without sending any data. '''
+        self._transfer(self._write(helpers.Bits(0x0, count)), [])
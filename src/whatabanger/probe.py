@@ -0,0 +1,174 @@
+'''
+Provides a probe manager - which finds every attached FTDI interface, runs an
+executor for each, and shards work across them. This allows many boards to
+be programmed, or dumped, at once from a single process.
+'''
+
+import os
+import shutil
+import logging
+
+from concurrent import futures
+
+from whatabanger import dump
+from whatabanger import ring
+from whatabanger import session
+from whatabanger import executor
+
+from pyftdi.ftdi import Ftdi
+
+# The vendor and product IDs of supported devices, and their interfaces.
+PROBE_DEVICES = {
+    (0x0403, 0x6010): 2,  # FT2232H
+    (0x0403, 0x6011): 4,  # FT4232H
+    (0x0403, 0x6014): 1,  # FT232H
+}
+
+# Shards are aligned to this, so that no 1KB TAR auto-increment block is
+# split between probes.
+PROBE_SHARD_ALIGN = 0x400
+
+
+def find(devices=PROBE_DEVICES):
+    ''' Returns the URL of every interface of every attached device. '''
+    urls = []
+    for found in Ftdi.find_all(list(devices)):
+        # pyftdi prior to 0.30 returns (vid, pid, serial, interfaces, name),
+        # while later versions return (UsbDeviceDescriptor, interfaces).
+        if len(found) == 2:
+            descriptor, interfaces = found
+            vid, pid, serial = descriptor.vid, descriptor.pid, descriptor.sn
+        else:
+            vid, pid, serial, interfaces, _ = found
+
+        # Serial numbers are used, so that URLs are stable across reboots.
+        for interface in range(1, min(interfaces, devices[(vid, pid)]) + 1):
+            urls.append('ftdi://0x{:04x}:0x{:04x}:{}/{}'.format(
+                vid,
+                pid,
+                serial,
+                interface,
+            ))
+
+    return urls
+
+
+def shard(addr, length, count, align=PROBE_SHARD_ALIGN):
+    ''' Splits a range into up to N aligned (address, length) shards. '''
+    size = -(-length // count)
+    size = -(-size // align) * align
+
+    shards = []
+    end = addr + length
+    while addr < end:
+        shards.append((addr, min(size, end - addr)))
+        addr += size
+
+    return shards
+
+
+class Probe(object):
+    '''
+    Provides a single probe - an executor servicing requests for a session,
+    connected by a pair of shared memory rings.
+    '''
+
+    def __init__(self, url, factory=None):
+        ''' Ensure the rings are setup, and the executor is created. '''
+        self.url = url
+        self.request = ring.Ring()
+        self.response = ring.Ring()
+
+        if factory is None:
+            factory = self._executor
+        self.transport = factory(url, self.request, self.response)
+        self.transport.daemon = True
+        self.session = session.Session(self.request, self.response)
+
+    def _executor(self, url, req, res):
+        ''' Returns the default transport for a probe - a bit-bang executor. '''
+        return executor.Executor(req, res, url=url)
+
+    def start(self):
+        ''' Starts the executor. '''
+        self.transport.start()
+
+    def stop(self):
+        ''' Stops the executor, and releases the rings. '''
+        if self.transport.is_alive():
+            self.transport.terminate()
+            self.transport.join()
+
+        self.request.close()
+        self.response.close()
+
+
+class Manager(object):
+    '''
+    Provides a probe manager - running a probe per interface, and a job for
+    each probe in parallel. Sessions spend almost all of their time waiting
+    on their executor, so each is driven from a thread.
+    '''
+
+    def __init__(self, urls=None, factory=None):
+        ''' Ensure a logger is setup, and a probe exists for every URL. '''
+        self.log = logging.getLogger(__name__)
+        if urls is None:
+            urls = find()
+        if not urls:
+            raise Exception("No probes found")
+
+        self.probes = [Probe(url, factory=factory) for url in urls]
+
+    def start(self):
+        ''' Starts all probes, and connects to their targets. '''
+        for probe in self.probes:
+            probe.start()
+
+        for probe, idr in zip(self.probes, self.map(lambda s: s.connect())):
+            self.log.info("Connected to DP IDR 0x%08x via %s", idr, probe.url)
+
+    def stop(self):
+        ''' Stops all probes. '''
+        for probe in self.probes:
+            probe.stop()
+
+    def map(self, job, *args):
+        ''' Runs a job against every probe's session, returning each result. '''
+        with futures.ThreadPoolExecutor(len(self.probes)) as pool:
+            pending = [
+                pool.submit(job, probe.session, *args)
+                for probe in self.probes
+            ]
+            return [future.result() for future in pending]
+
+    def dump(self, addr, length, path, interval=5.0):
+        ''' Dumps memory sharded across all probes, returning the total rate. '''
+        shards = shard(addr, length, len(self.probes))
+        parts = ['{}.{}'.format(path, idx) for idx in range(len(shards))]
+
+        # Each probe dumps its own shard to a part file, which are then
+        # joined in address order.
+        with futures.ThreadPoolExecutor(len(shards)) as pool:
+            pending = [
+                pool.submit(
+                    dump.dump,
+                    probe.session,
+                    start,
+                    count,
+                    part,
+                    interval=interval,
+                )
+                for probe, (start, count), part in zip(
+                    self.probes, shards, parts)
+            ]
+            rate = sum(future.result() for future in pending)
+
+        with open(path, 'wb') as handle:
+            for part in parts:
+                with open(part, 'rb') as source:
+                    shutil.copyfileobj(source, handle)
+                os.remove(part)
+
+        self.log.info("Dumped %d bytes at %.1f KB/s", length, rate / 1024)
+        return rate
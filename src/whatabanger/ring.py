@@ -0,0 +1,185 @@
+'''
+Provides a shared memory ring buffer - a drop-in replacement for the request
+and response queues passed to a transport, which passes compact fixed-layout
+records rather than pickling every request and response.
+'''
+
+import queue
+import struct
+import multiprocessing
+
+from multiprocessing import shared_memory
+
+from whatabanger import helpers
+from whatabanger import transport
+
+# Each record is a kind, flags, a correlation ID, a target, the length of two
+# bit fields, and the fields themselves (LSb first). Requests use both fields
+# for CMD and DATA, while responses only use the first. The first field is
+# large enough for the dormant state wake-up sequence.
+RING_RECORD = struct.Struct('<BBIIHH24s8s')
+RING_CMD_BITS = 24 * 8
+RING_DATA_BITS = 8 * 8
+
+# Record kinds.
+RING_KIND_REQUEST = 0x0
+RING_KIND_RESPONSE = 0x1
+RING_KIND_ERROR = 0x2
+
+# Request flags.
+RING_FLAG_ACK = 1 << 0
+RING_FLAG_READ = 1 << 1
+RING_FLAG_DATA = 1 << 2
+RING_FLAG_ID = 1 << 3
+RING_FLAG_TARGET = 1 << 4
+
+
+def _pack(bits, limit):
+    ''' Returns the length and bytes of a field, checking it fits. '''
+    bits = helpers.Bits.of(bits)
+    if bits.length > limit:
+        raise Exception("Field is too large for a ring record")
+
+    return bits.length, bits.value.to_bytes(limit // 8, 'little')
+
+
+def _unpack(length, data):
+    ''' Returns Bits for a field. '''
+    return helpers.Bits(int.from_bytes(data, 'little'), length)
+
+
+def encode(obj):
+    ''' Encodes a request, or a response, into a ring record. '''
+    if isinstance(obj, dict):
+        flags = 0x0
+        flags |= RING_FLAG_ACK if obj['ACK'] else 0x0
+        flags |= RING_FLAG_READ if obj['READ'] else 0x0
+        flags |= RING_FLAG_DATA if obj['DATA'] is not None else 0x0
+        flags |= RING_FLAG_ID if 'ID' in obj else 0x0
+        flags |= RING_FLAG_TARGET if 'TARGET' in obj else 0x0
+
+        cmd_len, cmd = _pack(obj['CMD'], RING_CMD_BITS)
+        data_len, data = _pack(obj['DATA'] or [], RING_DATA_BITS)
+        return (
+            RING_KIND_REQUEST,
+            flags,
+            obj.get('ID', 0),
+            obj.get('TARGET', 0),
+            cmd_len,
+            data_len,
+            cmd,
+            data,
+        )
+
+    # Responses to requests with a correlation ID are (ID, result) tuples.
+    flags = 0x0
+    ident = 0
+    if isinstance(obj, tuple):
+        flags |= RING_FLAG_ID
+        ident, obj = obj
+
+    # Errors only carry the ACK which caused them - or the pseudo-ACK, which
+    # needs a fourth bit.
+    if isinstance(obj, transport.AckError):
+        ack_len, ack = _pack(helpers.Bits(obj.ack, 4), RING_CMD_BITS)
+        return (RING_KIND_ERROR, flags, ident, 0, ack_len, 0, ack, b'')
+
+    result_len, result = _pack(obj, RING_CMD_BITS)
+    return (RING_KIND_RESPONSE, flags, ident, 0, result_len, 0, result, b'')
+
+
+def decode(record):
+    ''' Decodes a ring record into a request, or a response. '''
+    kind, flags, ident, target, cmd_len, data_len, cmd, data = record
+    if kind in (RING_KIND_RESPONSE, RING_KIND_ERROR):
+        result = _unpack(cmd_len, cmd)
+        if kind == RING_KIND_ERROR:
+            result = transport.error(result.value)
+        if flags & RING_FLAG_ID:
+            return (ident, result)
+        return result
+
+    request = {
+        'CMD': _unpack(cmd_len, cmd),
+        'DATA': _unpack(data_len, data) if flags & RING_FLAG_DATA else None,
+        'ACK': bool(flags & RING_FLAG_ACK),
+        'READ': bool(flags & RING_FLAG_READ),
+    }
+    if flags & RING_FLAG_ID:
+        request['ID'] = ident
+    if flags & RING_FLAG_TARGET:
+        request['TARGET'] = target
+    return request
+
+
+class Ring(object):
+    '''
+    Provides a shared memory ring buffer with a queue-like interface. Each
+    ring is intended to have a single producer and a single consumer, with
+    the slot indexes tracked separately by each side.
+    '''
+
+    def __init__(self, slots=256):
+        ''' Ensure the shared memory, and semaphores, are setup. '''
+        self.slots = slots
+        self._shm = shared_memory.SharedMemory(
+            create=True,
+            size=slots * RING_RECORD.size,
+        )
+        self._owner = True
+
+        # Semaphores track the number of records, and free slots, so both
+        # sides are able to block without polling.
+        self._items = multiprocessing.Semaphore(0)
+        self._spaces = multiprocessing.Semaphore(slots)
+
+        # The next slot to write, and the next slot to read.
+        self._head = 0
+        self._tail = 0
+
+    def __getstate__(self):
+        ''' Ensure only the name of the shared memory is pickled. '''
+        state = self.__dict__.copy()
+        state['_shm'] = self._shm.name
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        ''' Re-attach to the shared memory after unpickling. '''
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=state['_shm'])
+
+    def qsize(self):
+        ''' Returns the number of records pending. '''
+        return self._items.get_value()
+
+    def empty(self):
+        ''' Returns whether there are no records pending. '''
+        return self.qsize() == 0
+
+    def put(self, obj, block=True, timeout=None):
+        ''' Encodes a request, or response, into the next free slot. '''
+        if not self._spaces.acquire(block, timeout):
+            raise queue.Full
+
+        offset = (self._head % self.slots) * RING_RECORD.size
+        RING_RECORD.pack_into(self._shm.buf, offset, *encode(obj))
+        self._head += 1
+        self._items.release()
+
+    def get(self, block=True, timeout=None):
+        ''' Decodes, and returns, the oldest pending record. '''
+        if not self._items.acquire(block, timeout):
+            raise queue.Empty
+
+        offset = (self._tail % self.slots) * RING_RECORD.size
+        record = RING_RECORD.unpack_from(self._shm.buf, offset)
+        self._tail += 1
+        self._spaces.release()
+        return decode(record)
+
+    def close(self):
+        ''' Detaches from the shared memory, removing it if the owner. '''
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
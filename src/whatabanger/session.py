@@ -0,0 +1,572 @@
+'''
+Provides a session with a DAP - wrapping the request and response queues of a
+transport, and building higher level operations from swd.Protocol requests.
+'''
+
+import queue
+import logging
+import itertools
+import collections
+
+from concurrent import futures
+
+from whatabanger import swd
+from whatabanger import helpers
+
+# TAR auto-increment is only guaranteed for the bottom 10-bits of the address,
+# so TAR must be re-written when crossing a 1KB boundary.
+SESSION_TAR_WRAP = 0x400
+
+# The maximum number of requests in flight. This must be smaller than the
+# number of requests, and responses, which can be queued without blocking.
+SESSION_WINDOW = 64
+
+
+def unpack(addr, step, values):
+    ''' Returns the data of a block of memory, from the DRW values read. '''
+    # Sub-word transfers are returned in the byte lanes addressed by TAR,
+    # which are fixed for packed transfers as they are aligned.
+    result = bytearray()
+    for idx, word in enumerate(values):
+        word >>= ((addr + idx * step) & 0x3) * 8
+        result.extend((word & ((1 << (step * 8)) - 1)).to_bytes(
+            step,
+            'little',
+        ))
+    return bytes(result)
+
+
+class Future(futures.Future):
+    '''
+    Provides the future result of a request submitted to a session. Results
+    are collected from the session when required, rather than by a separate
+    thread, so that a session can be used without one.
+    '''
+
+    def __init__(self, session):
+        ''' Ensure the session which owns this future is accessible. '''
+        super(Future, self).__init__()
+        self._session = session
+
+    def result(self, timeout=None):
+        ''' Waits for, and returns, the result of the request. '''
+        self._session.wait(self, timeout)
+        return super(Future, self).result(timeout)
+
+
+class Session(object):
+    '''
+    Provides a session with a DAP - wrapping the request and response queues
+    of a transport. Register addresses are byte addresses, per ARM IHI0031C,
+    rather than the A[2:3] field of a request.
+    '''
+
+    def __init__(self, req, res, apsel=0x00, window=SESSION_WINDOW,
+                 target=None):
+        ''' Ensure the work queues are accessible, and a protocol is setup. '''
+        self.log = logging.getLogger(__name__)
+        self.protocol = swd.Protocol()
+
+        self._in = req
+        self._out = res
+
+        # Requests are tagged with a correlation ID when submitted, which is
+        # used to match the response to the future for it.
+        self.window = window
+        self._ids = itertools.count()
+        self._pending = {}
+
+        # The MEM-AP to use for memory accesses.
+        self.apsel = apsel
+
+        # The TARGETSEL value of the target, if on a multi-drop bus. Requests
+        # are tagged with this, and the transport selects the target.
+        self.target = target
+
+        # Shadows of DAP registers, so that writes of values already in
+        # effect can be dropped. CSW and TAR are kept per AP.
+        self.invalidate()
+
+    def invalidate(self):
+        ''' Forgets the shadowed DAP registers, as their state is unknown. '''
+        self._select = None
+        self._ctrl = None
+        self._csw = {}
+        self._tar = {}
+
+    def _value(self, data):
+        ''' Checks the parity of a response, and returns its value. '''
+        data = helpers.Bits.of(data)
+        value = data.value & 0xFFFFFFFF
+        if swd.calculate_parity(value) != data[32]:
+            raise Exception("Response failed parity check!")
+
+        return value
+
+    def submit(self, request):
+        ''' Sends a request to the transport, returning a future result. '''
+        # Ensure that the number of requests in flight is bounded, otherwise
+        # both sides could block on full queues.
+        while len(self._pending) >= self.window:
+            self._collect()
+
+        ident = next(self._ids) & 0xFFFFFFFF
+        future = Future(self)
+        self._pending[ident] = future
+
+        # Line resets, and other sequences, may reset the DAP.
+        if not request['ACK']:
+            self.invalidate()
+
+        # The request is copied, as requests may be shared.
+        request = dict(request)
+        request['ID'] = ident
+        if self.target is not None:
+            request['TARGET'] = self.target
+        self._in.put(request)
+        return future
+
+    def _collect(self, timeout=None, block=True):
+        ''' Waits for the next response, and resolves the future for it. '''
+        ident, result = self._out.get(block=block, timeout=timeout)
+
+        # Requests which the transport was unable to complete, even after
+        # retrying, are answered with the error instead.
+        future = self._pending.pop(ident)
+        if isinstance(result, Exception):
+            # Whatever failed may have left the DAP in an unknown state. The
+            # future may belong to another session sharing the transport.
+            # Requests still in flight are collected first, as shadows they
+            # updated would otherwise be trusted. When not blocking, those
+            # not yet received are left to later polls - the shadows are
+            # forgotten now, so nothing submitted after relies on them.
+            future.set_exception(result)
+            if block:
+                while self._pending:
+                    self._collect(timeout)
+            else:
+                self.poll()
+            future._session.invalidate()
+        else:
+            future.set_result(result)
+
+    def space(self):
+        ''' Returns the number of requests which can be submitted at once. '''
+        return max(0, self.window - len(self._pending))
+
+    def poll(self):
+        ''' Collects any responses already received, without waiting. '''
+        count = 0
+        while self._pending:
+            try:
+                self._collect(block=False)
+            except queue.Empty:
+                break
+            count += 1
+        return count
+
+    def wait(self, future, timeout=None):
+        ''' Collects responses until the given future is resolved. '''
+        while not future.done():
+            self._collect(timeout)
+
+    def transact(self, request):
+        ''' Sends a request to the transport, and waits for the result. '''
+        return self.submit(request).result()
+
+    def connect(self):
+        ''' Resets the line, clears errors, and returns the DP IDR. '''
+        # Targets on a multi-drop bus are selected by the transport, which
+        # resets the line itself.
+        if self.target is None:
+            self.transact(self.protocol.resync())
+        idr = self.read_dp(0x0)
+        self.transact(self.protocol.abort())
+        return idr
+
+    def _sticky(self, future):
+        ''' Forgets TAR if a read of CTRL/STAT shows sticky errors. '''
+        # Sticky errors mean that MEM-AP accesses may not have completed, so
+        # TAR can't be trusted.
+        if not future.exception() and \
+                self._value(future.result()) & swd.SWD_CTRL_STICKY:
+            self._tar = {}
+
+    def submit_read_dp(self, addr):
+        ''' Submits a DP register read, returning a future. '''
+        future = self.submit(self.protocol.read(addr=addr >> 2))
+        if addr == 0x4:
+            future.add_done_callback(self._sticky)
+        return future
+
+    def read_dp(self, addr):
+        ''' Reads a DP register, returning its value. '''
+        return self.result(self.submit_read_dp(addr))
+
+    def submit_dp(self, addr, value):
+        ''' Submits a DP register write, unless the value is in effect. '''
+        if (addr == 0x4 and value == self._ctrl) or \
+                (addr == 0x8 and value == self._select):
+            return None
+
+        future = self.submit(self.protocol.write(addr=addr >> 2, value=value))
+        if addr == 0x4:
+            self._ctrl = value
+        elif addr == 0x8:
+            self._select = value
+        return future
+
+    def write_dp(self, addr, value):
+        ''' Writes a DP register, unless the value is already in effect. '''
+        future = self.submit_dp(addr, value)
+        if future is not None:
+            future.result()
+
+    def overrun_detect(self, enable=True):
+        ''' Enables, or disables, ORUNDETECT - keeping power-up requests. '''
+        # Once set, the transport streams requests without waiting on each
+        # ACK, and checks for an overrun after each batch.
+        ctrl = self._ctrl
+        if ctrl is None:
+            ctrl = self.read_dp(0x4)
+
+        ctrl &= swd.SWD_CTRL_CDBGPWRUPREQ | swd.SWD_CTRL_CSYSPWRUPREQ
+        if enable:
+            ctrl |= swd.SWD_CTRL_ORUNDETECT
+        self.write_dp(0x4, ctrl)
+
+    def select(self, reg=0x00, apsel=None):
+        ''' Selects the AP, and AP register bank, for a register. '''
+        if apsel is None:
+            apsel = self.apsel
+
+        self.write_dp(0x8, apsel << 24 | ((reg >> 4) & 0xF) << 4)
+
+    def result(self, future):
+        ''' Waits for a read, checking parity and returning its value. '''
+        return self._value(future.result())
+
+    def submit_ap(self, accesses, apsel=None):
+        '''
+        Submits reads, and writes, of AP registers in one bank - as pairs of
+        register and value, with a value of None to read - returning a
+        future per access.
+        '''
+        if apsel is None:
+            apsel = self.apsel
+        if len(set(reg & 0xF0 for reg, _ in accesses)) != 1:
+            raise Exception("AP registers must all be in the same bank")
+
+        # SELECT is submitted rather than waited on, so that the accesses
+        # which follow are pipelined behind it.
+        self.submit_dp(0x8, apsel << 24 | ((accesses[0][0] >> 4) & 0xF) << 4)
+        if any(reg == swd.SWD_AP_DRW for reg, _ in accesses):
+            self._tar.pop(apsel, None)
+
+        futures = []
+        reads = []
+        for reg, value in accesses:
+            if value is None:
+                reads.append(len(futures))
+                request = self.protocol.read(addr=(reg >> 2) & 0b11, apndp=0b1)
+            else:
+                request = self.protocol.write(
+                    addr=(reg >> 2) & 0b11,
+                    apndp=0b1,
+                    value=value,
+                )
+            futures.append(self.submit(request))
+
+        # AP reads are posted, so the result of each read is returned by
+        # the next - and the last by RDBUFF. Writes between them don't
+        # disturb the posted result.
+        if reads:
+            results = [futures[idx] for idx in reads[1:]]
+            results.append(self.submit(self.protocol.rdbuff()))
+            for idx, result in zip(reads, results):
+                futures[idx] = result
+        return futures
+
+    def submit_read_ap(self, regs, apsel=None):
+        ''' Submits reads of AP registers in one bank, returning futures. '''
+        return self.submit_ap([(reg, None) for reg in regs], apsel)
+
+    def read_ap(self, reg, apsel=None):
+        ''' Reads an AP register, returning its value. '''
+        return self.result(self.submit_read_ap([reg], apsel)[0])
+
+    def submit_write_ap(self, reg, value, apsel=None):
+        ''' Submits an AP register write, unless the value is in effect. '''
+        if apsel is None:
+            apsel = self.apsel
+
+        # The bank is selected even if the write is dropped, as whatever
+        # follows may rely on it.
+        pending = []
+        future = self.submit_dp(0x8, apsel << 24 | ((reg >> 4) & 0xF) << 4)
+        if future is not None:
+            pending.append(future)
+
+        # Only CSW and TAR are shadowed, and any DRW access moves TAR.
+        shadows = {swd.SWD_AP_CSW: self._csw, swd.SWD_AP_TAR: self._tar}
+        if reg in shadows and shadows[reg].get(apsel) == value:
+            return pending
+        if reg == swd.SWD_AP_DRW:
+            self._tar.pop(apsel, None)
+
+        pending.append(self.submit(self.protocol.write(
+            addr=(reg >> 2) & 0b11,
+            apndp=0b1,
+            value=value,
+        )))
+        if reg in shadows:
+            shadows[reg][apsel] = value
+        return pending
+
+    def write_ap(self, reg, value, apsel=None):
+        ''' Writes an AP register, unless the value is already in effect. '''
+        for future in self.submit_write_ap(reg, value, apsel):
+            future.result()
+
+    def _configure(self, addr, length, size, packed):
+        ''' Submits CSW for a transfer, returning the bytes per DRW access. '''
+        width = 1 << size
+        if addr % width or length % width:
+            raise Exception("Address and length must be aligned to the size")
+
+        # Packed transfers move a word per DRW access, whatever the size.
+        step = width
+        addrinc = swd.SWD_CSW_ADDRINC_SINGLE
+        if packed and width < 4:
+            if addr % 4 or length % 4:
+                raise Exception("Packed transfers must be word aligned")
+            step = 4
+            addrinc = swd.SWD_CSW_ADDRINC_PACKED
+
+        return step, self.submit_write_ap(
+            swd.SWD_AP_CSW,
+            swd.SWD_CSW_PROT | addrinc | size,
+        )
+
+    def _tar_write(self, addr, count):
+        ''' Submits a TAR write for a block, unless TAR is already there. '''
+        pending = []
+        # The transfers in the block leave TAR incremented, within the 1KB
+        # auto-increment range, so contiguous blocks need no TAR write.
+        apsel = self.apsel
+        if self._tar.get(apsel) != addr:
+            pending.append(self.submit(self.protocol.tar(addr=addr)))
+
+        # Whether TAR carries out of the 1KB range when a block ends on the
+        # boundary is IMPLEMENTATION DEFINED, so it is no longer known.
+        end = (addr + count) & 0x3FF
+        if end == 0:
+            self._tar.pop(apsel, None)
+        else:
+            self._tar[apsel] = (addr & ~0x3FF) | end
+        return pending
+
+    def _runs(self, addr, length):
+        ''' Splits a range into runs of the largest aligned transfer size. '''
+        runs = []
+        end = addr + length
+        while addr < end:
+            # Only the head and tail of an unaligned range need sub-word
+            # transfers, so these are at most a byte and a half-word each.
+            for size in (swd.SWD_CSW_SIZE_WORD, swd.SWD_CSW_SIZE_HALF,
+                         swd.SWD_CSW_SIZE_BYTE):
+                width = 1 << size
+                if addr % width == 0 and addr + width <= end:
+                    break
+
+            count = (end - addr) - (end - addr) % width
+            if size != swd.SWD_CSW_SIZE_WORD:
+                count = width
+            runs.append((addr, count, size))
+            addr += count
+
+        return runs
+
+    def submit_read_memory(self, addr, length, size=None, packed=False):
+        '''
+        Submits reads of memory via the MEM-AP, yielding the address, bytes
+        per DRW access, and futures of each block - the writes to set it up,
+        along with the first posted read, and the reads - without waiting.
+        Each block is only submitted once the one before has been taken.
+        '''
+        # Without a size, unaligned ranges are read using sub-word transfers
+        # for the head and tail only. As these are single items, packing is
+        # not used.
+        if size is None:
+            for start, count, size in self._runs(addr, length):
+                yield from self.submit_read_memory(start, count, size)
+            return
+
+        step, writes = self._configure(addr, length, size, packed)
+        while length > 0:
+            # Only read up to the next 1KB boundary, before re-writing TAR.
+            count = min(length, SESSION_TAR_WRAP - (addr % SESSION_TAR_WRAP))
+            writes.extend(self._tar_write(addr, count))
+
+            # DRW reads are posted, so the result of each read is that of the
+            # previous word. The value of the first is thrown away - but not
+            # its future, as it may fail - and the last word is read from
+            # RDBUFF.
+            # All reads are submitted without waiting, so that the transport
+            # is never idle while waiting for the next request.
+            reads = []
+            writes.append(self.submit(self.protocol.drw()))
+            for _ in range(count // step - 1):
+                reads.append(self.submit(self.protocol.drw()))
+            reads.append(self.submit(self.protocol.rdbuff()))
+            yield addr, step, writes, reads
+
+            writes = []
+            addr += count
+            length -= count
+
+    def stream_memory(self, addr, length, size=swd.SWD_CSW_SIZE_WORD,
+                      packed=False):
+        ''' Reads memory via the MEM-AP, yielding data as it is read. '''
+        blocks = self.submit_read_memory(addr, length, size, packed)
+        for start, step, writes, reads in blocks:
+            # Writes return nothing, but errors must still be raised.
+            for future in writes:
+                future.result()
+            yield unpack(start, step, [self.result(read) for read in reads])
+
+    def read_memory(self, addr, length, size=None, packed=False):
+        ''' Reads memory via the MEM-AP, using TAR auto-increment. '''
+        return b''.join(self.stream_memory(addr, length, size, packed))
+
+    def write_memory(self, addr, data, size=None, packed=False):
+        ''' Writes memory via the MEM-AP, using TAR auto-increment. '''
+        if size is None:
+            # Without a size, unaligned ranges are written using sub-word
+            # transfers for the head and tail only - avoiding the need to
+            # read-modify-write any words.
+            for start, count, size in self._runs(addr, len(data)):
+                offset = start - addr
+                self.write_memory(start, data[offset:offset + count], size)
+            return
+
+        step, pending = self._configure(addr, len(data), size, packed)
+        offset = 0
+        while offset < len(data):
+            # Only write up to the next 1KB boundary, before re-writing TAR.
+            count = min(
+                len(data) - offset,
+                SESSION_TAR_WRAP - (addr % SESSION_TAR_WRAP),
+            )
+            pending.extend(self._tar_write(addr, count))
+
+            # Sub-word transfers are placed in the byte lanes addressed by
+            # TAR, which are fixed for packed transfers as they are aligned.
+            for idx in range(0, count, step):
+                value = int.from_bytes(
+                    data[offset + idx:offset + idx + step],
+                    'little',
+                )
+                value <<= ((addr + idx) & 0x3) * 8
+                pending.append(self.submit(self.protocol.drw(value=value)))
+
+            # An error left by the last write would only FAULT whatever comes
+            # next, so RDBUFF is read - which also waits for the write to
+            # complete. Writes return nothing, but errors must still be
+            # raised.
+            pending.append(self.submit(self.protocol.rdbuff()))
+            for future in pending:
+                future.result()
+
+            pending = []
+            addr += count
+            offset += count
+
+    def submit_banked(self, accesses):
+        '''
+        Submits reads, and writes, of scattered words of memory via the
+        banked data registers - as pairs of address and value, with a value
+        of None to read. Returns the futures of the writes to set the MEM-AP
+        up, and a future per access.
+        '''
+        # TAR is only written once per 16 byte window, and all accesses are
+        # pipelined rather than waiting on each word in turn.
+        _, writes = self._configure(0x0, 0x0, swd.SWD_CSW_SIZE_WORD, False)
+
+        futures = []
+        for window, group in itertools.groupby(
+                accesses, lambda access: access[0] & ~0xF):
+            group = list(group)
+            if any(addr % 4 for addr, _ in group):
+                raise Exception("Address must be word aligned")
+
+            writes.extend(self.submit_write_ap(swd.SWD_AP_TAR, window))
+            futures.extend(self.submit_ap([
+                (swd.SWD_AP_BD0 | (addr & 0xC), value)
+                for addr, value in group
+            ]))
+
+        return writes, futures
+
+    def read_words(self, addrs):
+        ''' Reads scattered words of memory, returning their values. '''
+        writes, pending = self.submit_banked([(addr, None) for addr in addrs])
+        for future in writes:
+            future.result()
+        return [self.result(future) for future in pending]
+
+    def read_word(self, addr):
+        ''' Reads a single word of memory, returning its value. '''
+        return int.from_bytes(self.read_memory(addr, 4), 'little')
+
+    def write_word(self, addr, value):
+        ''' Writes a single word of memory. '''
+        self.write_memory(addr, value.to_bytes(4, 'little'))
+
+
+class Multidrop(object):
+    '''
+    Provides sessions with each target on a DPv2 multi-drop bus, sharing the
+    request and response queues of a single transport. Requests submitted
+    to several targets before waiting are interleaved by the transport, so
+    a target which WAITs does not stall the others.
+    '''
+
+    def __init__(self, req, res, targets, window=SESSION_WINDOW):
+        ''' Ensure a session exists for the bus, and for each target. '''
+        self.log = logging.getLogger(__name__)
+        self.protocol = swd.Protocol()
+
+        # Responses for all sessions arrive on the same queue, so correlation
+        # IDs and pending futures are shared - allowing any session to
+        # collect a response for another.
+        self.bus = Session(req, res, window=window)
+        self.sessions = collections.OrderedDict()
+        for target in targets:
+            session = Session(req, res, window=window, target=target)
+            session._ids = self.bus._ids
+            session._pending = self.bus._pending
+            self.sessions[target] = session
+
+    def __getitem__(self, target):
+        ''' Returns the session for a target. '''
+        return self.sessions[target]
+
+    def wakeup(self):
+        ''' Wakes all targets from the dormant state, deselecting them. '''
+        self.bus.transact(self.protocol.wakeup())
+        self.bus.transact(self.protocol.line_reset())
+        for session in self.sessions.values():
+            session.invalidate()
+
+    def connect(self):
+        ''' Wakes the bus, and returns the DP IDR of each target. '''
+        self.wakeup()
+
+        idrs = collections.OrderedDict()
+        for target, session in self.sessions.items():
+            idrs[target] = session.connect()
+            self.log.info("Connected to target 0x%08x with DP IDR 0x%08x",
+                          target, idrs[target])
+
+        return idrs
@@ -0,0 +1,590 @@
+'''
+Provides a simulated SWD target - a DP and MEM-AP backed by a memory image -
+which implements the transport interface. This allows everything above the
+transport to be tested and benchmarked without an FT2232H attached.
+'''
+
+import random
+
+from whatabanger import swd
+from whatabanger import helpers
+from whatabanger import cortexm
+from whatabanger import transport
+
+# Defaults are those of an STM32F103x.
+SIM_DP_IDR = 0x1BA01477
+SIM_AP_IDR = 0x14770011
+SIM_AP_BASE = 0xE00FF003
+
+# TARGETID of an RP2040 core, for simulated multi-drop targets.
+SIM_TARGET_ID = 0x01002927
+
+# Fields of CTRL/STAT which can be written by the host.
+SIM_CTRL_WRITABLE = 0x54FFFF0D
+
+# The number of instructions executed by a simulated core per request.
+SIM_CORE_STEPS = 4
+
+# Number of clock cycles used by a single transfer: 8 for the request, one
+# 'turn-round', 3 for the ACK, 33 for the data and parity, one 'turn-round'
+# and 8 idle cycles.
+SIM_TRANSFER_CYCLES = 54
+
+
+class Simulator(transport.Transport):
+    '''
+    Provides a simulated SWD target - a DP and MEM-AP backed by a memory
+    image. Memory is provided as a dictionary of base address to bytes, and
+    WAITs can be injected at random for a given fraction of AP accesses.
+    '''
+
+    def __init__(self, req=None, res=None, memory=None, idr=SIM_DP_IDR,
+                 aps=None, wait=0.0, seed=0, keepalive=None,
+                 retries=transport.TRANSPORT_RETRIES, targetid=SIM_TARGET_ID,
+                 instance=0x0):
+        ''' Ensure the target is setup, and in its reset state. '''
+        super(Simulator, self).__init__(
+            req,
+            res,
+            keepalive=keepalive,
+            retries=retries,
+        )
+        self.idr = idr
+
+        # TARGETID and TINSTANCE, which select this target on a multi-drop
+        # bus (see Bus).
+        self.targetid = targetid
+        self.instance = instance
+
+        # APs are a dictionary of APSEL to (IDR, BASE), all of which are
+        # treated as MEM-APs onto the same memory.
+        if aps is None:
+            aps = {0x00: (SIM_AP_IDR, SIM_AP_BASE)}
+        self.aps = aps
+
+        # Copy the memory image, so that writes don't modify the original.
+        self.memory = {}
+        for base, data in (memory or {}).items():
+            self.memory[base] = bytearray(data)
+
+        # WAITs are injected using a seeded generator, so that runs can be
+        # reproduced.
+        self.wait = wait
+        self.random = random.Random(seed)
+
+        # A Cortex-M core, which only executes anything if '_core_run' is
+        # implemented by a subclass. Core registers are transferred
+        # immediately.
+        self.dhcsr = 0x0
+        self.dcrdr = 0x0
+        self.core = {}
+
+        # Track what has been done, for reporting.
+        self.transactions = 0
+        self.cycles = 0
+        self.waits = 0
+        self.faults = 0
+
+        self.reset()
+
+    def reset(self):
+        ''' Places the DP and MEM-AP into their reset state. '''
+        self.ctrl = 0x0
+        self.select = 0x0
+        self.rdbuff = 0x0
+        self.csw = swd.SWD_CSW_SIZE_WORD
+        self.tar = 0x0
+
+    def _find(self, addr):
+        ''' Returns the memory region, and offset into it, for an address. '''
+        for base, data in self.memory.items():
+            if base <= addr < base + len(data):
+                return data, addr - base
+
+        raise KeyError("No memory mapped at 0x{:08x}".format(addr))
+
+    def _size(self):
+        ''' Returns the size of the current MEM-AP transfer, in bytes. '''
+        return 1 << (self.csw & swd.SWD_CSW_SIZE)
+
+    def halted(self):
+        ''' Returns whether the simulated core is halted. '''
+        return bool(self.dhcsr & cortexm.CORTEXM_DHCSR_C_HALT)
+
+    def _core_run(self):
+        ''' Executes the core for a while, called for every request. '''
+        pass
+
+    def _core_step(self):
+        ''' Executes a single instruction on the core. '''
+        pass
+
+    def _debug_load(self, addr):
+        ''' Performs a read of a Debug Control Block register. '''
+        if addr == cortexm.CORTEXM_DHCSR:
+            status = self.dhcsr | cortexm.CORTEXM_DHCSR_S_REGRDY
+            if self.halted():
+                status |= cortexm.CORTEXM_DHCSR_S_HALT
+            return status
+        if addr == cortexm.CORTEXM_DCRDR:
+            return self.dcrdr
+        return 0x0
+
+    def _debug_store(self, addr, value):
+        ''' Performs a write of a Debug Control Block register. '''
+        if addr == cortexm.CORTEXM_DHCSR:
+            if value & 0xFFFF0000 != cortexm.CORTEXM_DHCSR_DBGKEY:
+                return
+            # Stepping is performed on leaving halt, and halts again after.
+            value &= 0xFFFF
+            if self.halted() and value & cortexm.CORTEXM_DHCSR_C_STEP and \
+                    not value & cortexm.CORTEXM_DHCSR_C_HALT:
+                self._core_step()
+                value |= cortexm.CORTEXM_DHCSR_C_HALT
+            self.dhcsr = value
+        elif addr == cortexm.CORTEXM_DCRDR:
+            self.dcrdr = value
+        elif addr == cortexm.CORTEXM_DCRSR and self.halted():
+            reg = value & 0x7F
+            if value & cortexm.CORTEXM_DCRSR_REGWNR:
+                self.core[reg] = self.dcrdr
+            else:
+                self.dcrdr = self.core.get(reg, 0x0)
+
+    def _load(self, addr):
+        ''' Performs a MEM-AP read from memory, placing data in byte lanes. '''
+        size = self._size()
+        addr &= ~(size - 1)
+
+        if cortexm.CORTEXM_DHCSR <= addr <= cortexm.CORTEXM_DEMCR:
+            return self._debug_load(addr & ~0x3)
+
+        data, offset = self._find(addr)
+        value = int.from_bytes(data[offset:offset + size], 'little')
+        return value << ((addr & 0x3) * 8)
+
+    def _store(self, addr, value):
+        ''' Performs a MEM-AP write to memory, taking data from byte lanes. '''
+        size = self._size()
+        addr &= ~(size - 1)
+
+        if cortexm.CORTEXM_DHCSR <= addr <= cortexm.CORTEXM_DEMCR:
+            self._debug_store(addr & ~0x3, value)
+            return
+
+        data, offset = self._find(addr)
+        value = (value >> ((addr & 0x3) * 8)) & ((1 << (size * 8)) - 1)
+        data[offset:offset + size] = value.to_bytes(size, 'little')
+
+    def _transfers(self):
+        ''' Returns the number of transfers made by a single DRW access. '''
+        if self.csw & swd.SWD_CSW_ADDRINC == swd.SWD_CSW_ADDRINC_PACKED:
+            return 4 // self._size()
+        return 1
+
+    def _increment(self):
+        ''' Increments TAR, if enabled, wrapping at the 1KB boundary. '''
+        if self.csw & swd.SWD_CSW_ADDRINC == swd.SWD_CSW_ADDRINC_OFF:
+            return
+
+        # Auto-increment is only guaranteed to operate on the bottom 10-bits
+        # of TAR, so the simulated target wraps here to catch host bugs.
+        tar = (self.tar & 0x3FF) + self._size()
+        self.tar = (self.tar & ~0x3FF) | (tar & 0x3FF)
+
+    def _memory(self, addr, value=None):
+        ''' Performs a MEM-AP access, setting STICKYERR on a bus error. '''
+        try:
+            if value is None:
+                return self._load(addr)
+            self._store(addr, value)
+        except KeyError:
+            self.ctrl |= swd.SWD_CTRL_STICKYERR
+        return 0x0
+
+    def _ack(self, apndp, rnw, addr):
+        ''' Determines the ACK for a request, prior to it being performed. '''
+        # IDR and CTRL/STAT reads, and ABORT writes, are always permitted.
+        if not apndp and (addr == 0x0 or (rnw and addr == 0x4)):
+            return swd.SWD_ACK_OK
+
+        if self.ctrl & swd.SWD_CTRL_STICKY:
+            self.faults += 1
+            return swd.SWD_ACK_FAULT
+
+        # Only AP accesses and RDBUFF reads are able to stall.
+        if (apndp or addr == 0xC) and self.random.random() < self.wait:
+            self.waits += 1
+            if self.ctrl & swd.SWD_CTRL_ORUNDETECT:
+                self.ctrl |= swd.SWD_CTRL_STICKYORUN
+            return swd.SWD_ACK_WAIT
+
+        return swd.SWD_ACK_OK
+
+    def _read_dp(self, addr):
+        ''' Performs a DP register read. '''
+        if addr == 0x0:
+            return self.idr
+        if addr == 0x4 and self.select & 0xF == 0x2:
+            return self.targetid
+        if addr == 0x4 and self.select & 0xF == 0x3:
+            # DLPIDR - TINSTANCE, and protocol version 1.
+            return self.instance << 28 | 0x1
+        if addr == 0x4:
+            # Power-up ACKs are mirrored from their requests.
+            return self.ctrl | ((self.ctrl & (
+                swd.SWD_CTRL_CDBGPWRUPREQ | swd.SWD_CTRL_CSYSPWRUPREQ
+            )) << 1)
+
+        # Both RESEND and RDBUFF return the result of the last AP read.
+        return self.rdbuff
+
+    def _write_dp(self, addr, value):
+        ''' Performs a DP register write. '''
+        if addr == 0x0:
+            # ABORT - clearing sticky flags as requested.
+            if value & (1 << 1):
+                self.ctrl &= ~swd.SWD_CTRL_STICKYCMP
+            if value & (1 << 2):
+                self.ctrl &= ~swd.SWD_CTRL_STICKYERR
+            if value & (1 << 3):
+                self.ctrl &= ~swd.SWD_CTRL_WDATAERR
+            if value & (1 << 4):
+                self.ctrl &= ~swd.SWD_CTRL_STICKYORUN
+        elif addr == 0x4:
+            self.ctrl &= ~SIM_CTRL_WRITABLE
+            self.ctrl |= value & SIM_CTRL_WRITABLE
+        elif addr == 0x8:
+            self.select = value
+
+    def _read_ap(self, reg):
+        ''' Performs an AP register read, returning the posted result. '''
+        value = 0x0
+        apsel = self.select >> 24
+        if apsel in self.aps:
+            if reg == swd.SWD_AP_CSW:
+                value = self.csw | swd.SWD_CSW_DEVICEEN
+            elif reg == swd.SWD_AP_TAR:
+                value = self.tar
+            elif reg == swd.SWD_AP_DRW:
+                # Packed transfers place each item into the byte lanes
+                # addressed by TAR, as it is incremented.
+                for _ in range(self._transfers()):
+                    value |= self._memory(self.tar)
+                    self._increment()
+            elif swd.SWD_AP_BD0 <= reg < swd.SWD_AP_BD0 + 0x10:
+                value = self._memory((self.tar & ~0xF) | (reg & 0xC))
+            elif reg == swd.SWD_AP_BASE:
+                value = self.aps[apsel][1]
+            elif reg == swd.SWD_AP_IDR:
+                value = self.aps[apsel][0]
+
+        # AP reads are posted, so return the result of the previous read.
+        result = self.rdbuff
+        self.rdbuff = value
+        return result
+
+    def _write_ap(self, reg, value):
+        ''' Performs an AP register write. '''
+        if (self.select >> 24) not in self.aps:
+            return
+
+        if reg == swd.SWD_AP_CSW:
+            self.csw = value & ~swd.SWD_CSW_DEVICEEN
+        elif reg == swd.SWD_AP_TAR:
+            self.tar = value
+        elif reg == swd.SWD_AP_DRW:
+            # Packed transfers take each item from the byte lanes addressed
+            # by TAR, as it is incremented.
+            for _ in range(self._transfers()):
+                self._memory(self.tar, value)
+                self._increment()
+        elif swd.SWD_AP_BD0 <= reg < swd.SWD_AP_BD0 + 0x10:
+            self._memory((self.tar & ~0xF) | (reg & 0xC), value)
+
+    def _execute(self, request):
+        ''' Services a request against the simulated target. '''
+        bits = helpers.Bits.of(request['CMD'])
+        self.transactions += 1
+
+        # The core runs alongside the debug port, for as long as each request
+        # takes.
+        if not self.halted():
+            self._core_run()
+
+        # Requests without an ACK are line resets, or other sequences, which
+        # do not address a register.
+        if not request['ACK']:
+            self.cycles += len(bits)
+            if bits.count(1) >= 50:
+                self.reset()
+            return helpers.Bits()
+
+        self.cycles += SIM_TRANSFER_CYCLES
+
+        # Decode the request header. A malformed request is not responded to,
+        # which looks like all ones to the host.
+        header = bits.value
+        apndp = (header >> 1) & 0b1
+        rnw = (header >> 2) & 0b1
+        if header & 0b11000001 != 0b10000001 or \
+                swd.calculate_parity((header >> 1) & 0xF) != (header >> 5) & 0b1:
+            self._check_ack(helpers.Bits(0b111, 3))
+
+        addr = (header >> 1) & 0xC
+        self._check_ack(helpers.Bits(self._ack(apndp, rnw, addr), 3))
+
+        # Register accesses are addressed by the bank in SELECT, for APs.
+        reg = ((self.select >> 4) & 0xF) << 4 | addr
+        if rnw:
+            if apndp:
+                value = self._read_ap(reg)
+            else:
+                value = self._read_dp(addr)
+            return swd.payload(value)
+
+        # Writes with bad parity are dropped, and flagged as an error.
+        data = helpers.Bits.of(request['DATA'])
+        value = data.value & 0xFFFFFFFF
+        if swd.calculate_parity(value) != data.value >> 32:
+            self.ctrl |= swd.SWD_CTRL_WDATAERR
+            return helpers.Bits()
+
+        if apndp:
+            self._write_ap(reg, value)
+        else:
+            self._write_dp(addr, value)
+        return helpers.Bits()
+
+    def _write_clock(self):
+        ''' 'Write' a clock cycle without sending any data. '''
+        self.cycles += 1
+
+    def _write_idle(self, count):
+        ''' 'Write' N clock cycles without sending any data. '''
+        self.cycles += count
+
+
+class CoreSimulator(Simulator):
+    '''
+    Extends the simulated target with a Cortex-M core, which interprets the
+    16-bit Thumb instructions used by the routines run on targets by this
+    package - a few per request. The core starts halted, and an undefined
+    instruction raises rather than being emulated.
+    '''
+
+    def __init__(self, req=None, res=None, steps=SIM_CORE_STEPS, **kwargs):
+        ''' Ensure the target is setup, and the core halted. '''
+        super(CoreSimulator, self).__init__(req, res, **kwargs)
+        self.dhcsr = cortexm.CORTEXM_DHCSR_C_DEBUGEN | \
+            cortexm.CORTEXM_DHCSR_C_HALT
+        self.steps = steps
+
+        # Track what has been done, for reporting.
+        self.instructions = 0
+
+    def _access(self, addr, size, value=None):
+        ''' Performs a core access to memory, of the given size in bytes. '''
+        # Accesses are made via the MEM-AP path, so that memory mapped
+        # peripherals behave the same for the core as for the host.
+        csw = self.csw
+        self.csw = (csw & ~swd.SWD_CSW_SIZE) | (size >> 1)
+        try:
+            shift = (addr & 0x3) * 8
+            if value is None:
+                return (self._load(addr) >> shift) & ((1 << (size * 8)) - 1)
+            self._store(addr, value << shift)
+        finally:
+            self.csw = csw
+
+    def _reg(self, reg):
+        ''' Returns the value of a core register. '''
+        return self.core.get(reg, 0x0)
+
+    def _flags(self, result, carry=None, overflow=None):
+        ''' Sets the N and Z, and optionally C and V, flags in xPSR. '''
+        xpsr = self._reg(cortexm.CORTEXM_REG_XPSR)
+        for bit, flag in ((31, result >> 31), (30, int(result == 0)),
+                          (29, carry), (28, overflow)):
+            if flag is not None:
+                xpsr = (xpsr & ~(1 << bit)) | (flag << bit)
+        self.core[cortexm.CORTEXM_REG_XPSR] = xpsr
+
+    def _add(self, a, b, subtract=False):
+        ''' Returns a + b (or a - b), setting all flags. '''
+        if subtract:
+            result = (a - b) & 0xFFFFFFFF
+            carry = int(a >= b)
+            overflow = (((a ^ b) & (a ^ result)) >> 31) & 0b1
+        else:
+            result = (a + b) & 0xFFFFFFFF
+            carry = int(a + b > 0xFFFFFFFF)
+            overflow = ((~(a ^ b) & (a ^ result)) >> 31) & 0b1
+        self._flags(result, carry, overflow)
+        return result
+
+    def _logical(self, rd, result, carry=None):
+        ''' Sets a register to the result of a logical operation. '''
+        self.core[rd] = result & 0xFFFFFFFF
+        self._flags(self.core[rd], carry)
+
+    def _condition(self, cond):
+        ''' Returns whether a condition code passes, per the flags. '''
+        xpsr = self._reg(cortexm.CORTEXM_REG_XPSR)
+        n, z, c, v = [(xpsr >> bit) & 0b1 for bit in (31, 30, 29, 28)]
+        result = {
+            0x0: z, 0x2: c, 0x4: n, 0x6: v,
+            0x8: c and not z, 0xA: n == v, 0xC: not z and n == v,
+        }[cond & 0xE]
+
+        # Odd conditions are the inverse of the even one before.
+        return bool(result) != bool(cond & 0b1)
+
+    def _branch(self, pc, offset, bits):
+        ''' Branches by a signed offset, in half-words, from the PC. '''
+        if offset & (1 << (bits - 1)):
+            offset -= 1 << bits
+        self.core[cortexm.CORTEXM_REG_PC] = pc + 4 + offset * 2
+
+    def _core_step(self):
+        ''' Executes a single Thumb instruction. '''
+        pc = self._reg(cortexm.CORTEXM_REG_PC) & ~0b1
+        op = self._access(pc, 2)
+        self.core[cortexm.CORTEXM_REG_PC] = pc + 2
+        self.instructions += 1
+
+        rd = op & 0x7
+        rn = (op >> 3) & 0x7
+        rdn = (op >> 8) & 0x7
+        imm5 = (op >> 6) & 0x1F
+        if op & 0xF800 == 0x0000:
+            # LSLS (immediate), including MOVS between low registers.
+            value = self._reg(rn)
+            carry = (value >> (32 - imm5)) & 0b1 if imm5 else None
+            self._logical(rd, value << imm5, carry)
+        elif op & 0xF800 == 0x0800:
+            value = self._reg(rn)
+            imm5 = imm5 or 32
+            self._logical(rd, value >> imm5, (value >> (imm5 - 1)) & 0b1)
+        elif op & 0xFC00 == 0x1800:
+            self.core[rd] = self._add(
+                self._reg(rn),
+                self._reg((op >> 6) & 0x7),
+                subtract=bool(op & (1 << 9)),
+            )
+        elif op & 0xFC00 == 0x1C00:
+            self.core[rd] = self._add(
+                self._reg(rn),
+                (op >> 6) & 0x7,
+                subtract=bool(op & (1 << 9)),
+            )
+        elif op & 0xF800 == 0x2000:
+            self._logical(rdn, op & 0xFF)
+        elif op & 0xF800 == 0x2800:
+            self._add(self._reg(rdn), op & 0xFF, subtract=True)
+        elif op & 0xF000 == 0x3000:
+            self.core[rdn] = self._add(
+                self._reg(rdn),
+                op & 0xFF,
+                subtract=bool(op & (1 << 11)),
+            )
+        elif op & 0xFFC0 == 0x4040:
+            self._logical(rd, self._reg(rd) ^ self._reg(rn))
+        elif op & 0xFFC0 == 0x4200:
+            self._flags(self._reg(rd) & self._reg(rn))
+        elif op & 0xFFC0 == 0x4280:
+            self._add(self._reg(rd), self._reg(rn), subtract=True)
+        elif op & 0xFFC0 == 0x43C0:
+            self._logical(rd, ~self._reg(rn))
+        elif op & 0xF800 == 0x4800:
+            # LDR (literal), relative to the word aligned PC.
+            addr = ((pc + 4) & ~0x3) + (op & 0xFF) * 4
+            self.core[rdn] = self._access(addr, 4)
+        elif op & 0xE000 == 0x6000 or op & 0xF000 == 0x8000:
+            size = {0x6000: 4, 0x7000: 1, 0x8000: 2}[op & 0xF000]
+            addr = (self._reg(rn) + imm5 * size) & 0xFFFFFFFF
+            if op & (1 << 11):
+                self.core[rd] = self._access(addr, size)
+            else:
+                self._access(addr, size, self._reg(rd) & ((1 << size * 8) - 1))
+        elif op & 0xFF00 == 0xBE00:
+            # BKPT halts the core, as if debug had requested it.
+            self.core[cortexm.CORTEXM_REG_PC] = pc
+            self.dhcsr |= cortexm.CORTEXM_DHCSR_C_HALT
+        elif op & 0xF000 == 0xD000 and op & 0x0F00 < 0x0E00:
+            if self._condition((op >> 8) & 0xF):
+                self._branch(pc, op & 0xFF, 8)
+        elif op & 0xF800 == 0xE000:
+            self._branch(pc, op & 0x7FF, 11)
+        else:
+            raise Exception("Undefined instruction 0x{:04x}".format(op))
+
+    def _core_run(self):
+        ''' Executes a few instructions, or until halted. '''
+        for _ in range(self.steps):
+            if self.halted():
+                break
+            self._core_step()
+
+
+class Bus(transport.Transport):
+    '''
+    Provides a simulated DPv2 multi-drop bus - several simulated targets on
+    one SWDIO / SWCLK pair. Targets start dormant, and once woken only the
+    target selected by TARGETSEL responds. Requests to anything else are not
+    responded to, which looks like all ones to the host.
+    '''
+
+    def __init__(self, req=None, res=None, targets=None, keepalive=None,
+                 retries=transport.TRANSPORT_RETRIES):
+        ''' Ensure the targets are setup, and dormant. '''
+        super(Bus, self).__init__(
+            req,
+            res,
+            keepalive=keepalive,
+            retries=retries,
+        )
+        self.targets = targets or []
+        self.awake = False
+        self.selected = None
+
+    def _targetsel(self, bits):
+        ''' Selects the target addressed by a TARGETSEL, if any. '''
+        # The payload follows the header, and the cycles ignored in place of
+        # the ACK.
+        start = 8 + swd.SWD_TARGETSEL_IGNORED
+        value = bits[start:start + 32].value
+        self.selected = None
+        for target in self.targets:
+            if value == (target.instance << 28 | (target.targetid & 0x0FFFFFFF)):
+                self.selected = target
+
+    def _execute(self, request):
+        ''' Services a request against the selected target. '''
+        bits = helpers.Bits.of(request['CMD'])
+        if not request['ACK']:
+            # A line reset deselects every target, but only a wake-up brings
+            # them out of the dormant state.
+            if bits == swd.SWD_SEQ_WAKEUP:
+                self.awake = True
+                self.selected = None
+            elif bits.count(1) >= 50:
+                self.selected = None
+            elif self.awake and len(bits) > 8 and \
+                    bits[0:8] == swd.SWD_HEADERS[(0b0, 0b0, 0b11)]:
+                self._targetsel(bits)
+            return helpers.Bits()
+
+        if not self.awake or self.selected is None:
+            self._check_ack(helpers.Bits(0b111, 3))
+        return self.selected._execute(request)
+
+    def _write_clock(self):
+        ''' 'Write' a clock cycle without sending any data. '''
+        for target in self.targets:
+            target._write_clock()
+
+    def _write_idle(self, count):
+        ''' 'Write' N clock cycles without sending any data. '''
+        for target in self.targets:
+            target._write_idle(count)
@@ -0,0 +1,236 @@
+'''
+Provides incremental memory snapshots - keeping the CRC32 of each block of a
+dump in an on-disk index, so that later snapshots only fetch the blocks which
+changed, and record them as a compact delta.
+'''
+
+import os
+import json
+import zlib
+import struct
+import logging
+
+from whatabanger import dump
+
+# The size of each block tracked by the index. This matches the 1KB TAR
+# auto-increment range, so a changed block is read with a single TAR write.
+SNAPSHOT_BLOCK_SIZE = 0x400
+
+# The number of words of each block sampled per diff, when the core isn't
+# used to checksum blocks. The sampled words move on with each diff, so that
+# every word is eventually checked.
+SNAPSHOT_SAMPLES = 4
+
+# The number of blocks sampled with each batch of scattered reads.
+SNAPSHOT_BATCH = 0x100
+
+# Where snapshots are stored by default.
+SNAPSHOT_STORE = os.path.join(
+    os.path.expanduser('~'),
+    '.cache',
+    'whatabanger',
+    'snapshots',
+)
+
+# A delta is a header - the magic, address, block size and number of blocks
+# which follow - then each changed block. Blocks are stored as the XOR of the
+# old and new data, compressed, so that small changes cost a few bytes.
+SNAPSHOT_MAGIC = b'WABD'
+SNAPSHOT_HEADER = struct.Struct('<4sIII')
+SNAPSHOT_BLOCK = struct.Struct('<II')
+
+
+def _xor(old, new):
+    ''' Returns the XOR of two equally sized byte strings. '''
+    value = int.from_bytes(old, 'little') ^ int.from_bytes(new, 'little')
+    return value.to_bytes(len(new), 'little')
+
+
+def apply(path, image):
+    ''' Applies a delta to an image, which must be the snapshot it follows. '''
+    image = bytearray(image)
+    with open(path, 'rb') as handle:
+        magic, addr, block_size, count = SNAPSHOT_HEADER.unpack(
+            handle.read(SNAPSHOT_HEADER.size)
+        )
+        if magic != SNAPSHOT_MAGIC:
+            raise Exception("Not a snapshot delta")
+
+        for _ in range(count):
+            idx, length = SNAPSHOT_BLOCK.unpack(
+                handle.read(SNAPSHOT_BLOCK.size)
+            )
+            data = zlib.decompress(handle.read(length))
+            offset = idx * block_size
+            image[offset:offset + len(data)] = _xor(
+                image[offset:offset + len(data)],
+                data,
+            )
+
+    return bytes(image)
+
+
+class Store(object):
+    '''
+    Provides a store of memory snapshots. Each range has an index of block
+    CRCs, and the image as last read - which is only ever accessed a block
+    at a time, so that memory use is constant regardless of its size. A diff finds the blocks which changed -
+    via CRCs computed on the core, if a cortexm.Checksum is given, otherwise
+    by sampling a few words of each block - and only reads those.
+    '''
+
+    def __init__(self, session, path=SNAPSHOT_STORE, checksum=None,
+                 block_size=SNAPSHOT_BLOCK_SIZE, samples=SNAPSHOT_SAMPLES):
+        ''' Ensure a logger is setup, and the session is accessible. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+        self.path = path
+        self.checksum = checksum
+        self.block_size = block_size
+        self.samples = samples
+
+    def _paths(self, addr, length):
+        ''' Returns the path of the index, and image, for a range. '''
+        base = os.path.join(self.path, '{:08x}-{:08x}'.format(addr, length))
+        return base + '.json', base + '.bin'
+
+    def _blocks(self, length):
+        ''' Returns the number of blocks in a range. '''
+        return -(-length // self.block_size)
+
+    def _crcs(self, path):
+        ''' Returns the CRC32 of each block of an image, a block at a time. '''
+        crcs = []
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(self.block_size), b''):
+                crcs.append(zlib.crc32(block))
+        return crcs
+
+    def _save(self, addr, length, index):
+        ''' Writes the index for a range. '''
+        index_path, _ = self._paths(addr, length)
+        os.makedirs(self.path, exist_ok=True)
+        with open(index_path, 'w') as handle:
+            json.dump(index, handle, indent=2)
+
+    def load(self, addr, length):
+        '''
+        Returns the index, and path of the image, of a range - or None if not
+        taken. The image isn't read, as a range may be far larger than memory.
+        '''
+        index_path, image_path = self._paths(addr, length)
+        if not os.path.exists(index_path):
+            return None, None
+
+        with open(index_path) as handle:
+            index = json.load(handle)
+        return index, image_path
+
+    def snapshot(self, addr, length):
+        ''' Dumps a range in full, replacing any previous snapshot of it. '''
+        _, image_path = self._paths(addr, length)
+        os.makedirs(self.path, exist_ok=True)
+        dump.dump(self.session, addr, length, image_path)
+
+        index = {
+            'addr': addr,
+            'length': length,
+            'block_size': self.block_size,
+            'generation': 0,
+            'crcs': self._crcs(image_path),
+        }
+        self._save(addr, length, index)
+        return index
+
+    def _sampled(self, addr, length, handle, generation):
+        ''' Yields the blocks in which any sampled word has changed. '''
+        # Words are sampled at the same offsets in every block, spread over
+        # the block and moved on by one word each generation.
+        words = self.block_size // 4
+        offsets = sorted(set(
+            ((generation + idx * words // self.samples) % words) * 4
+            for idx in range(self.samples)
+        ))
+
+        # Blocks are sampled in batches, so that neither the words read nor
+        # the image are ever held whole.
+        batch = SNAPSHOT_BATCH * self.block_size
+        for start in range(0, length, batch):
+            samples = []
+            for offset in range(start, min(length, start + batch),
+                                self.block_size):
+                for sample in offsets:
+                    if offset + sample + 4 <= length:
+                        samples.append(offset + sample)
+
+            values = self.session.read_words([
+                addr + offset for offset in samples
+            ])
+            changed = set()
+            for offset, value in zip(samples, values):
+                handle.seek(offset)
+                if handle.read(4) != value.to_bytes(4, 'little'):
+                    changed.add(offset // self.block_size)
+            yield from sorted(changed)
+
+    def _changed(self, addr, length, index, handle):
+        ''' Returns the blocks which have changed since the snapshot. '''
+        if self.checksum is not None:
+            crcs = self.checksum.crc32(addr, length, self.block_size)
+            return [
+                idx for idx, (old, new) in enumerate(zip(index['crcs'], crcs))
+                if old != new
+            ]
+        return list(self._sampled(addr, length, handle, index['generation']))
+
+    def diff(self, addr, length, path):
+        ''' Writes a delta of the blocks changed since the last snapshot. '''
+        index, image_path = self.load(addr, length)
+        fresh = index is None or index['block_size'] != self.block_size
+        if fresh:
+            # Without a snapshot, every block has changed - from zeros.
+            self.log.info("No snapshot of 0x%08x, taking one", addr)
+            index = self.snapshot(addr, length)
+            _, image_path = self.load(addr, length)
+
+        # Only a block at a time is held - read from the target, compared
+        # against the image, written to the delta and back to the image.
+        with open(image_path, 'r+b') as image, open(path, 'wb') as handle:
+            if fresh:
+                changed = list(range(self._blocks(length)))
+            else:
+                changed = self._changed(addr, length, index, image)
+
+            handle.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC,
+                addr,
+                self.block_size,
+                len(changed),
+            ))
+            for idx in changed:
+                offset = idx * self.block_size
+                count = min(self.block_size, length - offset)
+                image.seek(offset)
+                old = image.read(count)
+                if fresh:
+                    new, old = old, bytes(count)
+                else:
+                    new = self.session.read_memory(addr + offset, count)
+                    image.seek(offset)
+                    image.write(new)
+                    index['crcs'][idx] = zlib.crc32(new)
+
+                data = zlib.compress(_xor(old, new))
+                handle.write(SNAPSHOT_BLOCK.pack(idx, len(data)))
+                handle.write(data)
+
+        self.log.info(
+            "%d of %d blocks changed at 0x%08x",
+            len(changed),
+            self._blocks(length),
+            addr,
+        )
+
+        index['generation'] += 1
+        self._save(addr, length, index)
+        return [addr + idx * self.block_size for idx in changed]
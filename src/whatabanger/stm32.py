@@ -0,0 +1,355 @@
+'''
+Provides flash programming for STM32F103x targets - driving the flash program
+and erase controller (FPEC) via a session, per PM0075.
+'''
+
+import time
+import zlib
+import struct
+import logging
+
+from whatabanger import swd
+from whatabanger import cortexm
+
+# The main flash block, and the FPEC registers, per section 2.3 of PM0075.
+STM32_FLASH_BASE = 0x08000000
+STM32_FLASH_ACR = 0x40022000
+STM32_FLASH_KEYR = 0x40022004
+STM32_FLASH_SR = 0x4002200C
+STM32_FLASH_CR = 0x40022010
+STM32_FLASH_AR = 0x40022014
+
+# Keys which must be written to KEYR, in order, to unlock the FPEC.
+STM32_FLASH_KEY1 = 0x45670123
+STM32_FLASH_KEY2 = 0xCDEF89AB
+
+# Define known FLASH_SR fields.
+STM32_SR_BSY = 1 << 0
+STM32_SR_PGERR = 1 << 2
+STM32_SR_WRPRTERR = 1 << 4
+STM32_SR_EOP = 1 << 5
+
+# Define known FLASH_CR fields.
+STM32_CR_PG = 1 << 0
+STM32_CR_PER = 1 << 1
+STM32_CR_MER = 1 << 2
+STM32_CR_STRT = 1 << 6
+STM32_CR_LOCK = 1 << 7
+
+# Pages are 1KB on low and medium density devices, and 2KB on high density.
+STM32_PAGE_SIZE = 0x400
+
+# The erased state of flash.
+STM32_ERASED = 0xFF
+
+# SRAM, which holds the flash loader and its buffers.
+STM32_SRAM_BASE = 0x20000000
+
+# A flash loader, in Thumb code, which programs flash from two buffers in
+# turn. Each buffer is described by a destination, source and byte count -
+# with the count written last by the host, and cleared by the loader once the
+# buffer is programmed. On entry, R0 is the control block (a status word and
+# both descriptors) and R1 the FPEC, which must be unlocked with PG set.
+#
+#     00: adds r3, r0, #4        ; Start with the first descriptor.
+#     02: ldr  r4, [r3, #8]      ; Wait for the buffer to be filled.
+#     04: cmp  r4, #0
+#     06: beq  0x02
+#     08: ldr  r5, [r3, #0]      ; Destination.
+#     0a: ldr  r6, [r3, #4]      ; Source.
+#     0c: ldrh r7, [r6, #0]      ; Program a half-word.
+#     0e: strh r7, [r5, #0]
+#     10: ldr  r7, [r1, #12]     ; Wait while FLASH_SR.BSY.
+#     12: lsrs r7, r7, #1
+#     14: bcs  0x10
+#     16: ldr  r7, [r1, #12]     ; Stop on PGERR or WRPRTERR.
+#     18: movs r2, #0x14
+#     1a: tst  r7, r2
+#     1c: bne  0x36
+#     1e: adds r5, #2
+#     20: adds r6, #2
+#     22: subs r4, #2
+#     24: bgt  0x0c
+#     26: movs r4, #0            ; Mark the buffer as free.
+#     28: str  r4, [r3, #8]
+#     2a: adds r3, #12           ; Move to the other descriptor.
+#     2c: subs r7, r3, r0
+#     2e: cmp  r7, #0x1c
+#     30: bne  0x02
+#     32: adds r3, r0, #4
+#     34: b    0x02
+#     36: str  r7, [r0, #0]      ; Report FLASH_SR as the status, and stop.
+#     38: bkpt #0
+#
+STM32_LOADER = struct.pack(
+    '<30H',
+    0x1D03, 0x689C, 0x2C00, 0xD0FC, 0x681D, 0x685E, 0x8837, 0x802F,
+    0x68CF, 0x087F, 0xD2FC, 0x68CF, 0x2214, 0x4217, 0xD10B, 0x3502,
+    0x3602, 0x3C02, 0xDCF2, 0x2400, 0x609C, 0x330C, 0x1A1F, 0x2F1C,
+    0xD1E7, 0x1D03, 0xE7E5, 0x6007, 0xBE00, 0xBE00,
+)
+
+# The layout of the loader in SRAM - code, control block and buffers - and
+# of the control block itself.
+STM32_LOADER_CONTROL = 0x40
+STM32_LOADER_BUFFERS = 0x100
+STM32_LOADER_BLOCK = struct.Struct('<7I')
+STM32_LOADER_DESCRIPTOR = struct.Struct('<3I')
+
+
+class Flash(object):
+    '''
+    Provides flash programming for STM32F103x targets. Pages are erased and
+    programmed one at a time, with each page streamed as half-word writes -
+    the FPEC stalls the bus until each half-word is programmed, which the
+    transport sees as WAIT.
+    '''
+
+    def __init__(self, session, page_size=STM32_PAGE_SIZE, timeout=1.0,
+                 packed=False, checksum=None):
+        ''' Ensure the session is accessible, and the page size is known. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+        self.page_size = page_size
+
+        # The time, in seconds, to wait for the FPEC to complete an operation.
+        self.timeout = timeout
+
+        # Packed transfers halve the number of DRW writes, but are optional
+        # for a MEM-AP - and not supported by the Cortex-M3 AHB-AP.
+        self.packed = packed
+
+        # Pages are checksummed by the core, if a cortexm.Checksum is given,
+        # rather than being read back. Pages which already match are then
+        # skipped when writing.
+        self.checksum = checksum
+
+    def _wait(self):
+        ''' Polls FLASH_SR until the FPEC is not busy, checking for errors. '''
+        deadline = time.monotonic() + self.timeout
+        while True:
+            status = self.session.read_word(STM32_FLASH_SR)
+            if not status & STM32_SR_BSY:
+                break
+            if time.monotonic() > deadline:
+                raise Exception("Timed out waiting for flash operation")
+
+        # Errors, and EOP, are cleared by writing them back.
+        self.session.write_word(STM32_FLASH_SR, status)
+        if status & STM32_SR_PGERR:
+            raise Exception("Flash programming error (not erased?)")
+        if status & STM32_SR_WRPRTERR:
+            raise Exception("Flash is write protected")
+
+    def unlock(self):
+        ''' Unlocks the FPEC, if locked. '''
+        if not self.session.read_word(STM32_FLASH_CR) & STM32_CR_LOCK:
+            return
+
+        self.session.write_word(STM32_FLASH_KEYR, STM32_FLASH_KEY1)
+        self.session.write_word(STM32_FLASH_KEYR, STM32_FLASH_KEY2)
+        if self.session.read_word(STM32_FLASH_CR) & STM32_CR_LOCK:
+            raise Exception("Unable to unlock flash")
+
+    def lock(self):
+        ''' Locks the FPEC, until the next unlock. '''
+        self.session.write_word(STM32_FLASH_CR, STM32_CR_LOCK)
+
+    def erase_page(self, addr):
+        ''' Erases the page containing the given address. '''
+        self.session.write_word(STM32_FLASH_CR, STM32_CR_PER)
+        self.session.write_word(STM32_FLASH_AR, addr)
+        self.session.write_word(STM32_FLASH_CR, STM32_CR_PER | STM32_CR_STRT)
+        self._wait()
+        self.session.write_word(STM32_FLASH_CR, 0x0)
+
+    def program_page(self, addr, data):
+        ''' Programs erased flash, streaming data as half-word writes. '''
+        self.session.write_word(STM32_FLASH_CR, STM32_CR_PG)
+        self.session.write_memory(
+            addr,
+            data,
+            size=swd.SWD_CSW_SIZE_HALF,
+            packed=self.packed,
+        )
+        self._wait()
+        self.session.write_word(STM32_FLASH_CR, 0x0)
+
+    def _pages(self, addr, data):
+        ''' Yields the address, and data, of each page to be written. '''
+        if addr % self.page_size:
+            raise Exception("Address must be page aligned")
+
+        # The last page is padded to a whole word with the erased state, so
+        # that it can be written with any transfer size.
+        data = bytes(data)
+        if len(data) % 4:
+            data += bytes([STM32_ERASED] * (4 - len(data) % 4))
+
+        for offset in range(0, len(data), self.page_size):
+            yield addr + offset, data[offset:offset + self.page_size]
+
+    def _checksums(self, addr, data):
+        ''' Yields the CRC32 of each page, as currently programmed. '''
+        if self.checksum is not None:
+            length = len(data) + (-len(data) % 4)
+            yield from self.checksum.crc32(addr, length, self.page_size)
+            return
+
+        # Pages are read back one at a time, and only their checksums are
+        # kept, so memory use is constant regardless of the image size.
+        for page, chunk in self._pages(addr, data):
+            actual = 0
+            for block in self.session.stream_memory(page, len(chunk)):
+                actual = zlib.crc32(block, actual)
+            yield actual
+
+    def changed(self, addr, data):
+        ''' Yields the address, and data, of each page which differs. '''
+        pages = zip(self._pages(addr, data), self._checksums(addr, data))
+        for (page, chunk), actual in pages:
+            if actual != zlib.crc32(chunk):
+                yield page, chunk
+
+    def _outdated(self, addr, data):
+        ''' Returns the pages to be programmed, skipping any which match. '''
+        if self.checksum is None:
+            return list(self._pages(addr, data))
+
+        pages = list(self.changed(addr, data))
+        self.log.info(
+            "%d of %d pages need programming",
+            len(pages),
+            len(range(0, len(data), self.page_size)),
+        )
+        return pages
+
+    def write(self, addr, data):
+        ''' Erases, and programs, flash with the given data page by page. '''
+        pages = self._outdated(addr, data)
+        if not pages:
+            return
+
+        self.unlock()
+        try:
+            for page, chunk in pages:
+                self.log.debug("Programming page at 0x%08x", page)
+                self.erase_page(page)
+                self.program_page(page, chunk)
+        finally:
+            self.lock()
+
+    def verify(self, addr, data):
+        ''' Compares page checksums, returning the address of bad pages. '''
+        bad = []
+        for page, _ in self.changed(addr, data):
+            self.log.warning("Page at 0x%08x failed verification", page)
+            bad.append(page)
+
+        return bad
+
+
+class Loader(object):
+    '''
+    Provides flash programming for STM32F103x targets via a loader in SRAM.
+    The core programs one buffer while the host fills the other, so the host
+    only writes data - and polls the control block between buffers - rather
+    than driving the FPEC for every half-word.
+    '''
+
+    def __init__(self, session, flash=None, base=STM32_SRAM_BASE,
+                 buffer_size=STM32_PAGE_SIZE, timeout=1.0):
+        ''' Ensure the session, flash and core are accessible. '''
+        self.log = logging.getLogger(__name__)
+        self.session = session
+        self.flash = flash or Flash(session, timeout=timeout)
+        self.core = cortexm.Core(session, timeout=timeout)
+
+        # Where the loader, its control block and its buffers are placed.
+        self.base = base
+        self.control = base + STM32_LOADER_CONTROL
+        self.buffers = base + STM32_LOADER_BUFFERS
+        self.buffer_size = buffer_size
+
+        # The time, in seconds, to wait for the loader to free a buffer.
+        self.timeout = timeout
+
+    def _descriptor(self, idx):
+        ''' Returns the address of a buffer's descriptor. '''
+        return self.control + 4 + idx * STM32_LOADER_DESCRIPTOR.size
+
+    def _wait(self, idx):
+        ''' Polls the control block until a buffer is free. '''
+        deadline = time.monotonic() + self.timeout
+        while True:
+            # The status, and both descriptors, are read in one burst.
+            block = STM32_LOADER_BLOCK.unpack(self.session.read_memory(
+                self.control,
+                STM32_LOADER_BLOCK.size,
+            ))
+            if block[0]:
+                raise Exception(
+                    "Flash loader stopped (FLASH_SR 0x{:08x})".format(block[0])
+                )
+            if not block[3 + idx * 3]:
+                return
+            if time.monotonic() > deadline:
+                raise Exception("Timed out waiting for flash loader")
+
+    def _start(self):
+        ''' Uploads the loader, with empty buffers, and starts the core. '''
+        self.session.write_memory(self.base, STM32_LOADER)
+        self.session.write_memory(
+            self.control,
+            bytes(STM32_LOADER_BLOCK.size),
+        )
+        self.session.write_word(STM32_FLASH_CR, STM32_CR_PG)
+        self.core.run(self.base, {0: self.control, 1: STM32_FLASH_ACR})
+
+    def write(self, addr, data):
+        ''' Erases, and programs, flash with the given data via the loader. '''
+        pages = self.flash._outdated(addr, data)
+        if not pages:
+            return
+
+        self.core.halt()
+        self.flash.unlock()
+        try:
+            # Pages are erased by the host up-front, as erasing is a single
+            # FPEC operation per page anyway.
+            for page, _ in pages:
+                self.flash.erase_page(page)
+            self._start()
+
+            # Each buffer carries its own destination, so pages need not be
+            # contiguous.
+            idx = 0
+            for page, data in pages:
+                for offset in range(0, len(data), self.buffer_size):
+                    chunk = data[offset:offset + self.buffer_size]
+                    source = self.buffers + idx * self.buffer_size
+                    self._wait(idx)
+                    self.log.debug("Programming 0x%08x", page + offset)
+
+                    # The count is written last, as this hands the buffer
+                    # over.
+                    self.session.write_memory(source, chunk)
+                    self.session.write_memory(
+                        self._descriptor(idx),
+                        STM32_LOADER_DESCRIPTOR.pack(
+                            page + offset,
+                            source,
+                            len(chunk),
+                        ),
+                    )
+                    idx ^= 1
+
+            self._wait(0)
+            self._wait(1)
+
+            # Errors are also checked, and EOP cleared, by the host once done.
+            self.flash._wait()
+        finally:
+            self.core.halt()
+            self.session.write_word(STM32_FLASH_CR, 0x0)
+            self.flash.lock()
@@ -10,6 +10,56 @@ SWD_ACK_FAULT = 0x4
 # Define known SWD commands.
 SWD_CMD_JTAG_TO_SWD = [0x79, 0xE7]
 
+# Define the dormant state wake-up, per section B5.3.4 of ARM IHI0031E. The
+# selection alert is sent LSb first, and followed by the SWD activation code.
+SWD_SELECTION_ALERT = 0x19BC0EA2E3DDAFE986852D956209F392
+SWD_ACTIVATION_SWD = 0x1A
+
+# DPv2 multi-drop TARGETSEL, per section B4.3.4 of ARM IHI0031E. The target
+# does not drive the ACK, so the host clocks 5 cycles for the 'turn-round',
+# ACK and 'turn-round' without looking at them.
+SWD_TARGETSEL_IGNORED = 5
+
+# Define known DP CTRL/STAT fields, per section 2.3.2 of ARM IHI0031C.
+SWD_CTRL_ORUNDETECT = 1 << 0
+SWD_CTRL_STICKYORUN = 1 << 1
+SWD_CTRL_STICKYCMP = 1 << 4
+SWD_CTRL_STICKYERR = 1 << 5
+SWD_CTRL_WDATAERR = 1 << 7
+SWD_CTRL_CDBGPWRUPREQ = 1 << 28
+SWD_CTRL_CDBGPWRUPACK = 1 << 29
+SWD_CTRL_CSYSPWRUPREQ = 1 << 30
+SWD_CTRL_CSYSPWRUPACK = 1 << 31
+SWD_CTRL_STICKY = (
+    SWD_CTRL_STICKYORUN |
+    SWD_CTRL_STICKYCMP |
+    SWD_CTRL_STICKYERR |
+    SWD_CTRL_WDATAERR
+)
+
+# Define known MEM-AP registers, per section 7.2 of ARM IHI0031C.
+SWD_AP_CSW = 0x00
+SWD_AP_TAR = 0x04
+SWD_AP_DRW = 0x0C
+SWD_AP_BD0 = 0x10
+SWD_AP_CFG = 0xF4
+SWD_AP_BASE = 0xF8
+SWD_AP_IDR = 0xFC
+
+# Define known MEM-AP CSW fields, per section 7.2.1 of ARM IHI0031C.
+SWD_CSW_SIZE_BYTE = 0b000
+SWD_CSW_SIZE_HALF = 0b001
+SWD_CSW_SIZE_WORD = 0b010
+SWD_CSW_SIZE = 0b111
+SWD_CSW_ADDRINC_OFF = 0b00 << 4
+SWD_CSW_ADDRINC_SINGLE = 0b01 << 4
+SWD_CSW_ADDRINC_PACKED = 0b10 << 4
+SWD_CSW_ADDRINC = 0b11 << 4
+SWD_CSW_DEVICEEN = 1 << 6
+
+# HPROT and master type bits to set in CSW, as reset by a Cortex-M AHB-AP.
+SWD_CSW_PROT = 0x23000000
+
 
 def check_parity(parity, data):
     ''' Implements an SWD parity check. '''
@@ -20,62 +70,123 @@ def check_parity(parity, data):
 
 
 def calculate_parity(data):
-    ''' Implements a parity bit 'generator'. '''
-    cnt = data.count(1)
+    ''' Implements a parity bit 'generator' - for bits, or an integer. '''
+    if isinstance(data, int):
+        cnt = bin(data).count('1')
+    else:
+        cnt = data.count(1)
+
     if cnt % 2 == 0:
         return 0b0
     else:
         return 0b1
 
 
+def payload(value):
+    ''' Constructs a 32-bit payload, LSb first, with trailing parity. '''
+    value &= 0xFFFFFFFF
+    return helpers.Bits(value | (calculate_parity(value) << 32), 33)
+
+
+def build_request(apndp=0b0, rnw=0b1, addr=0b00):
+    ''' Constructs an SWD Request header. '''
+    request = 0b0
+    if addr > 3:
+        raise Exception("Address can only be two bits")
+
+    # Parity is constructed based on the number of HIGH (1) bits in the
+    # APnDP, RnW, and A[2:3] fields.
+    parity = calculate_parity(apndp | rnw << 1 | addr << 2)
+
+    # Construct the SWD Request header.
+    request |= 0b1          # Start Bit
+    request |= apndp << 1   # APnDP Bit
+    request |= rnw << 2     # RnW Bit
+    request |= addr << 3    # Address
+    request |= parity << 5  # Parity
+    request |= 0b0 << 6     # Stop Bit
+    request |= 0b1 << 7     # Park Bit
+
+    # The first bit on the wire is the LSb.
+    return helpers.Bits(request, 8)
+
+
+def build_wakeup():
+    ''' Constructs an SWD dormant state wake-up sequence. '''
+    # At least 8 cycles HIGH, the selection alert, 4 cycles LOW and then the
+    # activation code. A line reset must follow.
+    request = helpers.Bits(0xFF, 8)
+    request += helpers.Bits(SWD_SELECTION_ALERT, 128)
+    request += helpers.Bits(0x0, 4)
+    request += helpers.Bits(SWD_ACTIVATION_SWD, 8)
+    return request
+
+
+def build_line_reset():
+    ''' Constructs an SWD line reset, without the JTAG-to-SWD sequence. '''
+    request = helpers.Bits((1 << 50) - 1, 50)
+    request += helpers.Bits(0b00, 2)
+    return request
+
+
+def build_resync():
+    ''' Constructs an SWD 'reset' sequence. '''
+    request = helpers.Bits((1 << 50) - 1, 50)
+    request += helpers.Bits(
+        helpers.bits_to_bytes(
+            helpers.to_bit_list(SWD_CMD_JTAG_TO_SWD, bitflip=True)
+        ),
+        16,
+    )
+    request += helpers.Bits((1 << 50) - 1, 50)
+    request += helpers.Bits(0b00, 2)
+    return request
+
+
+# Only 16 request headers are possible, so these are all built once - keyed
+# by (APnDP, RnW, A[2:3]).
+SWD_HEADERS = {}
+for _apndp in (0b0, 0b1):
+    for _rnw in (0b0, 0b1):
+        for _addr in range(4):
+            SWD_HEADERS[(_apndp, _rnw, _addr)] = build_request(
+                apndp=_apndp,
+                rnw=_rnw,
+                addr=_addr,
+            )
+del _apndp, _rnw, _addr
+
+# Constant sequences, and payloads, are also only built once.
+SWD_SEQ_RESYNC = build_resync()
+SWD_SEQ_WAKEUP = build_wakeup()
+SWD_SEQ_LINE_RESET = build_line_reset()
+# ABORT sets ORUNERRCLR, WDERRCLR, STKERRCLR and STKCMPCLR - but not DAPABORT.
+SWD_PAYLOAD_ABORT = payload(0b11110)
+
+
 class Protocol(object):
     ''' Provides a very rudimentary SWD protocol implementation. '''
 
     def _request(self, apndp=0b0, rnw=0b1, addr=0b00):
-        ''' Constructs an SWD Request. '''
-        request = 0b0
-        if addr > 3:
+        ''' Returns a pre-built SWD Request header. '''
+        try:
+            return SWD_HEADERS[(apndp, rnw, addr)]
+        except KeyError:
             raise Exception("Address can only be two bits")
 
-        # Parity is constructed based on the number of HIGH (1) bits in the
-        # APnDP APnDP, RnW, and A[2:3] fields.
-        bitcount = 0
-        bitcount += 1 if(rnw == 0b1) else 0
-        bitcount += 1 if(apndp == 0b1) else 0
-
-        # Look-up SHOULD be quickest here.
-        if addr > 0b0:
-            bitcount += 1 if addr == 0b01 else 0
-            bitcount += 1 if addr == 0b10 else 0
-            bitcount += 2 if addr == 0b11 else 0
-
-        # Parity here is a PITA, as we need to check bitcount in a number
-        # of fields.
-        if bitcount % 2 == 0:
-            parity = 0b0
-        else:
-            parity = 0b1
-
-        # Construct the SWD Request header.
-        request |= 0b1          # Start Bit
-        request |= apndp << 1   # APnDP Bit
-        request |= rnw << 2     # RnW Bit
-        request |= addr << 3    # Address
-        request |= parity << 5  # Parity
-        request |= 0b0 << 6     # Stop Bit
-        request |= 0b1 << 7     # Park Bit
-
-        # Convert to a list of bits before returning.
-        return helpers.to_bit_list([request], bitflip=True)
-
     def read(self, addr=0b00, apndp=0b0):
         ''' Wrapper for constructing SWD READ packets. '''
-        data = None
-        request = []
-        request.extend(self._request(addr=addr, apndp=apndp))
+        request = self._request(addr=addr, apndp=apndp)
 
         # ACK and READ is required, so make sure both flags are set.
-        return {'CMD': request, 'DATA': data, 'ACK': True, 'READ': True}
+        return {'CMD': request, 'DATA': None, 'ACK': True, 'READ': True}
+
+    def write(self, addr=0b00, apndp=0b0, value=0x0):
+        ''' Wrapper for constructing SWD WRITE packets. '''
+        sequence = self._request(addr=addr, rnw=0b0, apndp=apndp)
+
+        # ACK is required, as is data, so make sure those fields are set.
+        return  {'CMD': sequence, 'DATA': payload(value), 'ACK': True, 'READ': False}
 
     def idr(self):
         ''' Returns an SWD DP IDR request packet. '''
@@ -87,116 +198,87 @@ class Protocol(object):
 
     def resync(self):
         ''' Returns an SWD 'reset' sequence. '''
-        data = None
-        request = []
-        request.extend([0b1] * 50)
-        request.extend(helpers.to_bit_list(SWD_CMD_JTAG_TO_SWD, bitflip=True))
-        request.extend([0b1] * 50)
-        request.extend([0b0] * 2)
-
         # No ACK or READ required after a resync.
-        return {'CMD': request, 'DATA': data, 'ACK': False, 'READ': False}
-
-    def drw(self):
-        ''' Returns an SWD DRW READ packet (WRITE unsupported right now). '''
-        sequence = []
-        sequence.extend(self._request(addr=0b11, rnw=0b1, apndp=0b1))
-
-        # ACK and READ is required, so make sure both flags are set.
-        return  {'CMD': sequence, 'DATA': None, 'ACK': True, 'READ': True}
+        return {'CMD': SWD_SEQ_RESYNC, 'DATA': None, 'ACK': False, 'READ': False}
+
+    def wakeup(self):
+        ''' Returns an SWD dormant state wake-up sequence. '''
+        # No ACK or READ required, but a line reset must follow.
+        return {'CMD': SWD_SEQ_WAKEUP, 'DATA': None, 'ACK': False, 'READ': False}
+
+    def line_reset(self):
+        ''' Returns an SWD line reset sequence. '''
+        return {
+            'CMD': SWD_SEQ_LINE_RESET,
+            'DATA': None,
+            'ACK': False,
+            'READ': False,
+        }
+
+    def targetsel(self, target):
+        ''' Returns an SWD TARGETSEL write - TINSTANCE and TARGETID. '''
+        # No ACK is driven by any target, so this is sent as a sequence.
+        sequence = self._request(addr=0b11, rnw=0b0)
+        sequence += helpers.Bits(
+            (1 << SWD_TARGETSEL_IGNORED) - 1,
+            SWD_TARGETSEL_IGNORED,
+        )
+        sequence += payload(target)
+        return {'CMD': sequence, 'DATA': None, 'ACK': False, 'READ': False}
+
+    def drw(self, value=None):
+        ''' Returns an SWD DRW READ packet, or WRITE packet if given a value. '''
+        if value is None:
+            return self.read(addr=0b11, apndp=0b1)
+        return self.write(addr=0b11, apndp=0b1, value=value)
 
     def tar(self, addr=0b00000000000000000000000000000000):
         ''' Returns an SWD TAR write packet. '''
-        sequence = []
-        sequence.extend(self._request(addr=0b01, rnw=0b0, apndp=0b1))
-
-        # Construct the TAR request.
-        data = []
-        data.extend(helpers.to_bit_list([addr], 32))  # ADDR
-        data.reverse()
-
-        # Parity always trails.
-        data.append(calculate_parity(data))
+        return self.write(addr=0b01, apndp=0b1, value=addr)
 
-        # ACK is required, as is data, so make sure those fields are set.
-        return  {'CMD': sequence, 'DATA': data, 'ACK': True, 'READ': False}
+    def csw(self, size=SWD_CSW_SIZE_WORD, addrinc=SWD_CSW_ADDRINC_SINGLE):
+        ''' Returns an SWD CSW write packet (AP register 0x00, bank 0x0). '''
+        return self.write(
+            addr=0b00,
+            apndp=0b1,
+            value=SWD_CSW_PROT | addrinc | size,
+        )
 
     def select(self, apsel=0b00000000, apbanksel=0b0000, dpbanksel=0b0000, apndp=0b0):
         ''' Returns an SWD SELECT request packet. '''
-        sequence = []
-        sequence.extend(self._request(addr=0b10, rnw=0b0, apndp=apndp))
+        sequence = self._request(addr=0b10, rnw=0b0, apndp=apndp)
 
         # Construct the SELECT request.
-        data = []
-        data.extend(helpers.to_bit_list([apsel]))         # APSEL.
-        data.extend([0b0] * 16)                           # RESERVED.
-        data.extend(helpers.to_bit_list([apbanksel], 4))  # APBANKSEL.
-        data.extend(helpers.to_bit_list([dpbanksel], 4))  # DPBANKSEL.
-        data.reverse()                                    # Bitflip (MSb/LSb)
-
-        # Parity always trails.
-        data.append(calculate_parity(data))
+        data = 0x0
+        data |= apsel << 24         # APSEL.
+        data |= 0x0000 << 8         # RESERVED.
+        data |= apbanksel << 4      # APBANKSEL.
+        data |= dpbanksel << 0      # DPBANKSEL.
 
         # ACK is required, as is data, so make sure those fields are set.
-        return  {'CMD': sequence, 'DATA': data, 'ACK': True, 'READ': False}
+        return  {'CMD': sequence, 'DATA': payload(data), 'ACK': True, 'READ': False}
 
     def abort(self):
         ''' Returns an SWD ABORT request packet. '''
-        sequence = []
-        sequence.extend(self._request(addr=0b00, rnw=0b0))
-
-        # Reserved to 0b0 * N. Clear all, no DAPABORT.
-        data = [0b0] * 27
-        data.extend([0b1])  # ORUNERRCLR
-        data.extend([0b1])  # WDERRCLR
-        data.extend([0b1])  # STKERRCLR
-        data.extend([0b1])  # STKCMPCLR
-        data.extend([0b0])  # DAPABORT
-        data.reverse()      # Bitflip (MSb/LSb)
-
-        # Parity always trails.
-        data.append(calculate_parity(data))
+        sequence = self._request(addr=0b00, rnw=0b0)
 
         # ACK is required, as is data, so make sure those fields are set.
-        return  {'CMD': sequence, 'DATA': data, 'ACK': True, 'READ': False}
+        return  {'CMD': sequence, 'DATA': SWD_PAYLOAD_ABORT, 'ACK': True, 'READ': False}
 
     def stat(self):
         ''' Returns an SWD CTRL/STAT READ request packet. '''
-        sequence = []
-        sequence.extend(self._request(addr=0b01))
-
-        # ACK is required.
-        return  {'CMD': sequence, 'DATA': None, 'ACK': True, 'READ': True}
+        return self.read(addr=0b01)
 
-    def ctrl(self, cdbgpweupreq=0b0, csyspwrupreq=0b0):
+    def ctrl(self, cdbgpweupreq=0b0, csyspwrupreq=0b0, orundetect=0b0):
         ''' Returns an SWD CTRL/STAT WRITE request packet. '''
-        sequence = []
-        sequence.extend(self._request(addr=0b01, rnw=0b0))
-
-        # Set only required CTRL fields.
-        data = []
-        data.extend([0b0])           # CSYSPWRUPACK
-        data.extend([csyspwrupreq])  # CSYSPWRUPREQ
-        data.extend([0b0])           # CDBGPWRUPACK
-        data.extend([cdbgpweupreq])  # CDBGPWRUPREQ
-        data.extend([0b0])           # CDBGSTACK
-        data.extend([0b0])           # CDBGSTREQ
-        data.extend([0b0])           # RESERVED
-        data.extend([0b0])           #
-        data.extend([0b0] * 12)      # TRNCNT
-        data.extend([0b0] * 4)       # MASKLANE
-        data.extend([0b0])           # WDATAERR
-        data.extend([0b0])           # READOK
-        data.extend([0b0])           # STICKYERR
-        data.extend([0b0])           # STICKYCMP
-        data.extend([0b0])           # TRNMODE
-        data.extend([0b0])           #
-        data.extend([0b0])           # STICKYORUN
-        data.extend([0b0])           # ORUNDETECT
-        data.reverse()               # Bitflip (MSb/LSb)
-
-        # Parity always trails.
-        data.append(calculate_parity(data))
+        # Set only required CTRL fields - everything else, including TRNCNT,
+        # MASKLANE and the sticky flags, is zero.
+        data = 0x0
+        data |= 0b0 << 31           # CSYSPWRUPACK
+        data |= csyspwrupreq << 30  # CSYSPWRUPREQ
+        data |= 0b0 << 29           # CDBGPWRUPACK
+        data |= cdbgpweupreq << 28  # CDBGPWRUPREQ
+        data |= orundetect << 0     # ORUNDETECT
 
         # ACK is required, as is data, so make sure those fields are set.
-        return  {'CMD': sequence, 'DATA': data, 'ACK': True, 'READ': False}
+        return self.write(addr=0b01, value=data)
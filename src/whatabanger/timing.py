@@ -0,0 +1,112 @@
+'''
+Provides SWCLK timing for bit-bang executors - pacing port states onto the
+wire against a monotonic deadline, rather than sleeping per edge, and
+measuring the clock rate actually achieved.
+'''
+
+import time
+import logging
+import multiprocessing
+
+# The number of clock cycles banged at start-up to measure the achieved rate,
+# limited so that calibrating a slow clock takes about the given time.
+TIMING_CALIBRATION_CYCLES = 4096
+TIMING_CALIBRATION_TIME = 0.05
+
+# The port state rate used in zero-delay mode, the highest standard baudrate
+# of the FT2232H. In practice, USB transfers are the limit.
+TIMING_ZERO_DELAY_RATE = 3000000
+
+# If pacing falls further behind than this, such as after the transport has
+# been idle, the deadline is restarted rather than trying to catch up.
+TIMING_SLACK = 0.01
+
+
+class Clock(object):
+    '''
+    Provides SWCLK timing for bit-bang executors. Each write of port states is
+    scheduled against the deadline of the previous write, so that the time
+    lost to USB transfers and sleeping is absorbed rather than accumulated.
+    An interval of zero, or None, runs as fast as the interface allows.
+    '''
+
+    def __init__(self, interval=0.001):
+        ''' Ensure a logger is setup, and the deadline is unset. '''
+        self.log = logging.getLogger(__name__)
+
+        # The interval between port states - half the SWCLK cycle time.
+        self.interval = interval or 0.0
+        self._deadline = None
+
+        # The rate measured by calibration, in Hz.
+        self.calibrated = None
+
+        # Edges banged, and the time spent doing so, are shared as the clock
+        # is used from the transport process, but reported from the main.
+        self._edges = multiprocessing.Value('Q', 0)
+        self._elapsed = multiprocessing.Value('d', 0.0)
+
+    def rate(self):
+        ''' Returns the rate to program the interface for, in states/s. '''
+        if not self.interval:
+            return TIMING_ZERO_DELAY_RATE
+        return int(1 / self.interval)
+
+    def cycles(self, duration=TIMING_CALIBRATION_TIME):
+        ''' Returns the number of calibration cycles, taking about N seconds. '''
+        if not self.interval:
+            return TIMING_CALIBRATION_CYCLES
+        return max(1, min(
+            TIMING_CALIBRATION_CYCLES,
+            int(duration / (self.interval * 2)),
+        ))
+
+    def pace(self, edges):
+        ''' Waits for the deadline of the last write, before N more edges. '''
+        if not self.interval:
+            return
+
+        now = time.monotonic()
+        if self._deadline is None or now - self._deadline > TIMING_SLACK:
+            self._deadline = now
+        elif self._deadline > now:
+            time.sleep(self._deadline - now)
+
+        # The next deadline follows on from this one, not from when this
+        # write actually happened, so errors don't build up.
+        self._deadline += edges * self.interval
+
+    def account(self, edges, elapsed):
+        ''' Records N edges banged over the given time, in seconds. '''
+        with self._edges.get_lock():
+            self._edges.value += edges
+        with self._elapsed.get_lock():
+            self._elapsed.value += elapsed
+
+    def reset(self):
+        ''' Forgets all edges banged, and the deadline. '''
+        self._deadline = None
+        with self._edges.get_lock():
+            self._edges.value = 0
+        with self._elapsed.get_lock():
+            self._elapsed.value = 0.0
+
+    def frequency(self):
+        ''' Returns the achieved SWCLK frequency, in Hz, or 0 if unknown. '''
+        if not self._elapsed.value:
+            return 0.0
+        return self._edges.value / 2 / self._elapsed.value
+
+    def calibrate(self, exchange, states):
+        ''' Measures the SWCLK frequency achieved by banging idle states. '''
+        self.reset()
+        exchange(states)
+        self.calibrated = self.frequency()
+        self.reset()
+
+        self.log.info(
+            "SWCLK calibrated at %.1f Hz (requested %.1f Hz)",
+            self.calibrated,
+            self.rate() / 2,
+        )
+        return self.calibrated
@@ -0,0 +1,509 @@
+'''
+Provides the transport interface - implemented by everything which is able to
+service requests from swd.Protocol, whether that be real hardware or not.
+'''
+
+import time
+import queue
+import collections
+import logging
+import multiprocessing
+
+from whatabanger import swd
+from whatabanger import helpers
+
+# The number of times a request is retried after a WAIT, or replayed after a
+# FAULT, before giving up.
+TRANSPORT_RETRIES = 16
+
+# The bounds of the number of idle cycles clocked between retries after a WAIT.
+# This is doubled after every WAIT, and halved after every OK, so that it
+# tracks how long the target is taking to complete accesses.
+TRANSPORT_BACKOFF_MIN = 8
+TRANSPORT_BACKOFF_MAX = 4096
+
+# The maximum number of requests streamed back-to-back, without waiting on
+# each ACK, when the target has ORUNDETECT set.
+TRANSPORT_BATCH = 64
+
+# Not an ACK from the target, but outside the range of one - used to fail
+# requests which completed, but after which the line was reset to change the
+# SWCLK rate, losing the state of the DAP.
+TRANSPORT_ACK_CLOCK = 0b1000
+
+
+class AckError(Exception):
+    '''
+    Raised when a request was not ACKed as OK. The ACK received is kept, so
+    that callers are able to tell a WAIT from a FAULT, or no response at all.
+    '''
+
+    def __init__(self, ack):
+        ''' Ensure the ACK received is accessible. '''
+        super(AckError, self).__init__(
+            "SWD ACK response was NOT OK (0b{:03b})".format(ack)
+        )
+        self.ack = ack
+
+    def __reduce__(self):
+        ''' Ensure the ACK survives pickling onto a response queue. '''
+        return (self.__class__, (self.ack,))
+
+
+class ClockChanged(AckError):
+    '''
+    Raised when a request completed, but the line was then reset to change
+    the SWCLK rate. This isn't an error from the target, but the state of
+    the DAP is lost, so the caller must set it up again.
+    '''
+
+    def __init__(self, ack=TRANSPORT_ACK_CLOCK):
+        ''' Ensure the pseudo-ACK is accessible, as for other errors. '''
+        Exception.__init__(self, "SWCLK rate changed, DAP state was lost")
+        self.ack = ack
+
+
+def error(ack):
+    ''' Returns the error for a request which was not ACKed as OK. '''
+    if ack == TRANSPORT_ACK_CLOCK:
+        return ClockChanged()
+    return AckError(ack)
+
+
+class Transport(multiprocessing.Process):
+    '''
+    Provides the transport interface - implemented by everything which is able
+    to service requests from swd.Protocol. Transports are intended to be run
+    in a separate process, servicing requests from the 'req' queue and placing
+    results onto the 'res' queue, but may also be called directly via
+    execute().
+    '''
+
+    def __init__(self, req=None, res=None, keepalive=None,
+                 retries=TRANSPORT_RETRIES, batch=TRANSPORT_BATCH):
+        ''' Ensure a logger is setup, and the work queues are accessible. '''
+        super(Transport, self).__init__()
+        self.log = logging.getLogger(self.__class__.__module__)
+
+        # Ensure the work queue is accessible - this is used for the parent
+        # to push request to bang onto the wire.
+        self._in = req
+        self._out = res
+
+        # The interval, in seconds, after which an idle clock cycle is sent
+        # if no requests are pending. If None, the clock is left alone while
+        # idle.
+        self.keepalive = keepalive
+
+        # Track time spent idle and servicing requests. These are shared, so
+        # that they can be read by the parent while the transport is running.
+        self._idle = multiprocessing.Value('d', 0.0)
+        self._busy = multiprocessing.Value('d', 0.0)
+        self._serviced = multiprocessing.Value('L', 0)
+
+        # WAITs are retried, and FAULTs are cleared and replayed, up to the
+        # given number of times per request. The backoff is carried between
+        # requests, as a slow target is likely to stay slow.
+        self.retries = retries
+        self._backoff = TRANSPORT_BACKOFF_MIN
+        self._abort = swd.Protocol().abort()
+        self._waits = multiprocessing.Value('L', 0)
+        self._faults = multiprocessing.Value('L', 0)
+        self._retried = multiprocessing.Value('L', 0)
+
+        # Writes to CTRL/STAT are followed to know whether ORUNDETECT is set,
+        # in which case requests are streamed in batches, and CTRL/STAT is
+        # checked for an overrun after each.
+        self.batch = batch
+        self._orundetect = False
+        self._stat = swd.Protocol().stat()
+        self._ctrl = swd.SWD_HEADERS[(0b0, 0b0, 0b01)]
+
+        # Requests may be addressed to one of several targets on a multi-drop
+        # bus, by TARGETSEL. These are queued per target, so that when one
+        # target WAITs, requests for another are serviced in the meantime.
+        self._target = None
+        self._targets = collections.OrderedDict()
+        self._attempts = {}
+        self._line_reset = swd.Protocol().line_reset()
+        self._idr = swd.Protocol().idr()
+
+    def _execute(self, request):
+        ''' Put a request onto the wire, and return any data read. '''
+        raise NotImplementedError
+
+    def _write_clock(self):
+        ''' 'Write' a clock cycle without sending any data. '''
+        raise NotImplementedError
+
+    def _stream(self, requests):
+        ''' Put requests onto the wire, returning the ACK and data of each. '''
+        # Transports which are unable to stream requests just perform them
+        # one at a time, which has the same result.
+        results = []
+        for request in requests:
+            try:
+                results.append((swd.SWD_ACK_OK, self._execute(request)))
+            except AckError as err:
+                results.append((err.ack, helpers.Bits()))
+
+        return results
+
+    def _write_idle(self, count):
+        ''' 'Write' N clock cycles without sending any data. '''
+        for _ in range(count):
+            self._write_clock()
+
+    def _check_ack(self, bits):
+        ''' Convenience method to handle ACKs. '''
+        ack = helpers.bits_to_bytes(bits)
+        if ack != swd.SWD_ACK_OK:
+            raise AckError(ack)
+
+    def _count(self, counter):
+        ''' Increments a shared counter. '''
+        with counter.get_lock():
+            counter.value += 1
+
+    def _select(self, request):
+        ''' Selects the target of a request, if not already selected. '''
+        target = request.get('TARGET')
+        if target is None or target == self._target:
+            return
+
+        # A line reset deselects every target, which then listen for a
+        # TARGETSEL. DPIDR must be read before anything else.
+        self._target = None
+        self._execute(self._line_reset)
+        self._execute(swd.Protocol().targetsel(target))
+        self._execute(self._idr)
+        self._target = target
+
+    def _fault(self):
+        ''' Clears the sticky flags after a FAULT, so the caller can recover. '''
+        # A FAULT reports an error left by an earlier access - which may have
+        # been posted - so replaying this request would hide it. The error is
+        # passed back to the caller instead. ABORT is never WAITed or FAULTed.
+        self._count(self._faults)
+        self.log.warning("FAULT, clearing sticky flags")
+        self._execute(self._abort)
+
+    def _transact(self, request):
+        ''' Performs a request, retrying on WAIT and recovering from FAULT. '''
+        self._select(request)
+        attempt = 0
+        while True:
+            try:
+                result = self._execute(request)
+            except AckError as err:
+                if err.ack == swd.SWD_ACK_FAULT:
+                    self._fault()
+                    raise
+                if err.ack != swd.SWD_ACK_WAIT:
+                    # No response, or a protocol error, is not recoverable
+                    # here - the line needs to be reset by the caller.
+                    raise
+
+                self._count(self._waits)
+                if attempt >= self.retries:
+                    self.log.error("Giving up after %d retries: %s", attempt, err)
+                    raise
+
+                # Give the target time to complete the access, backing off
+                # further for every consecutive WAIT.
+                attempt += 1
+                self._count(self._retried)
+                self._write_idle(self._backoff)
+                self._backoff = min(self._backoff * 2, TRANSPORT_BACKOFF_MAX)
+                continue
+
+            self._backoff = max(self._backoff // 2, TRANSPORT_BACKOFF_MIN)
+            return result
+
+    def _overrun(self, requests):
+        ''' Streams requests without checking each ACK, replaying on overrun. '''
+        results = []
+        attempt = 0
+        while len(results) < len(requests):
+            # Nothing following a request which was not OK is performed by the
+            # target, so everything before it is known-good.
+            ack = swd.SWD_ACK_OK
+            for ack, result in self._stream(requests[len(results):]):
+                if ack != swd.SWD_ACK_OK:
+                    break
+                results.append(result)
+
+            # An overrun is confirmed from CTRL/STAT, which is always readable.
+            # Any other sticky flags are left to FAULT the next request, as
+            # they would when not streaming.
+            stat = self._execute(self._stat).value
+            if ack == swd.SWD_ACK_OK:
+                if stat & swd.SWD_CTRL_STICKYORUN:
+                    # There's nothing to rewind to if every ACK was OK, so
+                    # the flag is just cleared.
+                    self.log.warning("Overrun without a failed ACK, clearing")
+                    self._execute(self._abort)
+                self._backoff = max(self._backoff // 2, TRANSPORT_BACKOFF_MIN)
+                continue
+
+            # Only WAITs are replayed. A FAULT is an error left by an earlier
+            # access, so it - and everything not performed after it - is
+            # answered with the error.
+            if ack == swd.SWD_ACK_FAULT:
+                self._fault()
+            elif ack == swd.SWD_ACK_WAIT:
+                self._count(self._waits)
+
+            if ack != swd.SWD_ACK_WAIT or attempt >= self.retries:
+                if ack != swd.SWD_ACK_FAULT:
+                    self.log.error(
+                        "Giving up after %d retries: 0b%03b",
+                        attempt,
+                        ack,
+                    )
+                while len(results) < len(requests):
+                    results.append(error(ack))
+                break
+
+            # Clear STICKYORUN, then rewind to the request which WAITed.
+            attempt += 1
+            self._count(self._retried)
+            self._execute(self._abort)
+            self._write_idle(self._backoff)
+            self._backoff = min(self._backoff * 2, TRANSPORT_BACKOFF_MAX)
+
+        for request in requests:
+            self._track(request)
+        return results
+
+    def _track(self, request):
+        ''' Follows writes to CTRL/STAT, to know whether ORUNDETECT is set. '''
+        # Line resets, and other sequences, deselect multi-drop targets.
+        if not request['ACK']:
+            self._target = None
+        elif request['DATA'] and helpers.Bits.of(request['CMD']) == self._ctrl:
+            data = helpers.Bits.of(request['DATA'])
+            self._orundetect = bool(data.value & swd.SWD_CTRL_ORUNDETECT)
+
+    def _complete(self, requests):
+        ''' Performs requests, returning the result, or error, of each. '''
+        # Streaming is only used when there's a single target on the bus.
+        if self._orundetect and 'TARGET' not in requests[0]:
+            return self._overrun(requests)
+
+        results = []
+        for request in requests:
+            try:
+                results.append(self._transact(request))
+            except AckError as err:
+                results.append(err)
+            self._track(request)
+
+        return results
+
+    def _gather(self, request):
+        ''' Returns the given request, and any pending which can be batched. '''
+        requests = [request]
+        while self._orundetect and len(requests) < self.batch:
+            # A change to CTRL/STAT always ends a batch, as it may change how
+            # following requests are put onto the wire.
+            if helpers.Bits.of(requests[-1]['CMD']) == self._ctrl:
+                break
+            try:
+                requests.append(self._in.get(block=False))
+            except queue.Empty:
+                break
+
+        return requests
+
+    def _reply(self, request, result):
+        ''' Sends the response to a request back to the main thread. '''
+        self._out.put(self._respond(request, result))
+        with self._serviced.get_lock():
+            self._serviced.value += 1
+
+    def _enqueue(self, request):
+        ''' Queues a request, behind others for the same target. '''
+        self._targets.setdefault(
+            request['TARGET'],
+            collections.deque(),
+        ).append(request)
+
+    def _queue(self):
+        ''' Queues all pending requests, behind others for the same target. '''
+        # Requests without a target are left for the caller, as they must be
+        # performed in order - after everything already queued.
+        while True:
+            try:
+                request = self._in.get(block=False)
+            except queue.Empty:
+                return None
+            if 'TARGET' not in request:
+                return request
+            self._enqueue(request)
+
+    def _retry(self, target, err):
+        ''' Returns an error if a request should not be retried, or None. '''
+        if err.ack != swd.SWD_ACK_WAIT:
+            if err.ack == swd.SWD_ACK_FAULT:
+                self._fault()
+            self._attempts.pop(target, None)
+            return err
+
+        self._count(self._waits)
+
+        attempt = self._attempts.get(target, 0)
+        if attempt >= self.retries:
+            self.log.error("Giving up after %d retries: %s", attempt, err)
+            self._attempts.pop(target, None)
+            return err
+
+        self._attempts[target] = attempt + 1
+        self._count(self._retried)
+        return None
+
+    def _interleave(self):
+        ''' Services queued requests, moving to another target on WAIT. '''
+        # The selected target is serviced first, as switching targets costs
+        # a line reset, TARGETSEL and DPIDR read.
+        waited = True
+        for target in sorted(self._targets, key=lambda t: t != self._target):
+            pending = self._targets[target]
+            while pending:
+                request = pending[0]
+                try:
+                    self._select(request)
+                    result = self._execute(request)
+                except AckError as err:
+                    # The request is retried on the next pass, after any
+                    # other targets have had a turn.
+                    result = self._retry(target, err)
+                    if result is None:
+                        break
+                else:
+                    waited = False
+                    self._attempts.pop(target, None)
+
+                pending.popleft()
+                self._reply(request, result)
+
+            if not pending:
+                del self._targets[target]
+
+        # Only back off once every target with requests queued has WAITed.
+        if waited and self._targets:
+            self._write_idle(self._backoff)
+            self._backoff = min(self._backoff * 2, TRANSPORT_BACKOFF_MAX)
+        elif not waited:
+            self._backoff = max(self._backoff // 2, TRANSPORT_BACKOFF_MIN)
+
+    def stats(self):
+        ''' Returns time spent idle and servicing requests, and retries. '''
+        idle = self._idle.value
+        busy = self._busy.value
+        return {
+            'idle': idle,
+            'busy': busy,
+            'serviced': self._serviced.value,
+            'waits': self._waits.value,
+            'faults': self._faults.value,
+            'retries': self._retried.value,
+            'utilisation': busy / (idle + busy) if (idle + busy) else 0.0,
+        }
+
+    def execute(self, request):
+        ''' Services a request in-process, returning any data read. '''
+        result = self._complete([request])[0]
+        if isinstance(result, AckError):
+            raise result
+        return result
+
+    def _respond(self, request, result):
+        ''' Returns the response to send back for a request. '''
+        # If the request carries a correlation ID, this is returned with the
+        # result so that requests can be pipelined.
+        if 'ID' in request:
+            return (request['ID'], result)
+        return result
+
+    def service(self, request):
+        ''' Services a request, returning the response to send back. '''
+        # A request which could not be completed is answered with the error,
+        # rather than stopping the transport, so that the caller can decide
+        # what to do about it.
+        return self._respond(request, self._complete([request])[0])
+
+    def run(self):
+        ''' Starts servicing requests, clocking SWCLK only when required. '''
+        self.log.info("Transport clock and monitor started")
+        while True:
+            # Block until a request is pending, rather than polling the queue,
+            # so that requests are serviced as soon as they arrive. If any
+            # targets have requests queued, these are serviced instead.
+            start = time.perf_counter()
+            request = None
+            if self._targets:
+                request = self._queue()
+            else:
+                try:
+                    request = self._in.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # Nothing arrived within the keep-alive interval, so make
+                    # sure the clock is still driven.
+                    self._write_clock()
+                    with self._idle.get_lock():
+                        self._idle.value += time.perf_counter() - start
+                    continue
+
+                with self._idle.get_lock():
+                    self._idle.value += time.perf_counter() - start
+
+            start = time.perf_counter()
+            if request is not None and 'TARGET' in request:
+                self._enqueue(request)
+                request = self._queue()
+
+            # Requests without a target are performed in order, once all
+            # requests queued for targets are complete.
+            if request is None:
+                self._interleave()
+            else:
+                while self._targets:
+                    self._interleave()
+
+                # A result is always sent back to the main thread, even if
+                # empty. This allows it to confirm requests were serviced.
+                requests = self._gather(request)
+                for request, result in zip(requests, self._complete(requests)):
+                    self._reply(request, result)
+
+            with self._busy.get_lock():
+                self._busy.value += time.perf_counter() - start
+
+
+class Loopback(object):
+    '''
+    Provides queue-like access to a transport, servicing requests in-process
+    as soon as they are put. This allows anything written against the request
+    and response queues to be used without a separate process.
+    '''
+
+    def __init__(self, transport):
+        ''' Ensure the transport is accessible, and results can be held. '''
+        self.transport = transport
+        self._results = collections.deque()
+
+    def qsize(self):
+        ''' Returns the number of results pending. '''
+        return len(self._results)
+
+    def put(self, request):
+        ''' Services a request, holding the result until retrieved. '''
+        self._results.append(self.transport.service(request))
+
+    def get(self, block=True, timeout=None):
+        ''' Returns the oldest result. '''
+        try:
+            return self._results.popleft()
+        except IndexError:
+            raise queue.Empty
@@ -0,0 +1,147 @@
+'''
+Provides a waveform compiler - responsible for turning a request into a
+precomputed sequence of GPIO port states which can be pushed onto the wire in
+bulk, rather than one edge at a time.
+'''
+
+from collections import namedtuple
+
+from whatabanger import helpers
+
+# A phase is a run of port states which can be banged onto the wire without
+# changing the direction of SWDIO. 'samples' are the indexes of the port states
+# which were read while SWCLK was HIGH, the first 'ack' of which are the ACK
+# and the following 'read' of which are the data read from the target.
+Phase = namedtuple('Phase', ['drive', 'states', 'samples', 'ack', 'read'])
+
+
+class Compiler(object):
+    '''
+    Provides a waveform compiler - responsible for turning a request into a
+    precomputed sequence of GPIO port states. Every clock cycle is made of two
+    port states, with data being set while SWCLK is LOW and sampled on the
+    RISING edge. All phases finish with SWCLK pulled LOW.
+    '''
+
+    def __init__(self, swclk=0x01, swdio=0x02):
+        ''' Ensure the pins used for SWCLK and SWDIO are known. '''
+        self.swclk = swclk
+        self.swdio = swdio
+
+        # The port states for every possible byte are built once, so that
+        # writes are a concatenation of pre-built fragments.
+        self._fragments = []
+        for byte in range(256):
+            self._fragments.append(bytes(self._write_bits(byte, 8)))
+
+        # Requests without data are compiled once, and served from here.
+        self._compiled = {}
+
+    def _write_bits(self, value, count):
+        ''' Returns the port states to write N bits, without a trailing LOW. '''
+        states = bytearray()
+        for _ in range(count):
+            level = self.swdio if value & 0b1 else 0x0
+            states.append(level)
+            states.append(level | self.swclk)
+            value >>= 1
+
+        return states
+
+    def write(self, bits):
+        ''' Returns the port states required to write bits onto the wire. '''
+        bits = helpers.Bits.of(bits)
+        value = bits.value
+        whole = bits.length // 8
+
+        states = bytearray()
+        for _ in range(whole):
+            states.extend(self._fragments[value & 0xFF])
+            value >>= 8
+        states.extend(self._write_bits(value, bits.length - (whole * 8)))
+
+        # Pull the clock LOW again, without touching SWDIO.
+        states.append(states[-2] if states else 0x0)
+        return states
+
+    def read(self, count):
+        ''' Returns the port states, and sample indexes, to read N bits. '''
+        states = bytearray()
+        samples = []
+        for _ in range(count):
+            # The target drives SWDIO on the RISING edge, so the value is
+            # sampled while SWCLK is still HIGH. As the port is read before
+            # each state is applied, the sample is that of the LOW state.
+            states.append(self.swclk)
+            samples.append(len(states))
+            states.append(0x0)
+
+        return states, samples
+
+    def clock(self, count=1):
+        ''' Returns the port states to 'write' N clock cycles without data. '''
+        return bytearray([self.swclk, 0x0] * count)
+
+    def compile(self, request):
+        ''' Compiles a request into a list of phases to bang onto the wire. '''
+        if request['DATA']:
+            return self._compile(request)
+
+        # Everything other than data comes from a small set of pre-built
+        # headers and sequences, so the result can be cached.
+        key = (helpers.Bits.of(request['CMD']), request['ACK'], request['READ'])
+        try:
+            return self._compiled[key]
+        except KeyError:
+            pass
+
+        phases = []
+        for phase in self._compile(request):
+            phases.append(phase._replace(states=bytes(phase.states)))
+        self._compiled[key] = phases
+        return phases
+
+    def _compile(self, request):
+        ''' Compiles a request into a list of phases to bang onto the wire. '''
+        phases = []
+
+        # Write the request, followed by a 'turn-round' so the target can
+        # control SWDIO - if a response is expected.
+        states = self.write(request['CMD'])
+        if not request['ACK']:
+            return [Phase(True, states, [], 0, 0)]
+
+        states.extend(self.clock())
+        phases.append(Phase(True, states, [], 0, 0))
+
+        # Reading data and writing data are mutually exclusive in a single
+        # operation - with the exception of ACKs - so we don't allow both.
+        states, samples = self.read(3)
+        if request['DATA']:
+            # 'Turn-round' so the host can again control SWDIO.
+            states.extend(self.clock())
+            phases.append(Phase(False, states, samples, 3, 0))
+
+            states = self.write(request['DATA'])
+            states.extend(self.write(helpers.Bits(0x0, 8)))
+            phases.append(Phase(True, states, [], 0, 0))
+            return phases
+
+        if request['READ']:
+            # The ACK is a phase of its own, so that it is checked before the
+            # data is clocked - otherwise a request which was not ACKed as OK
+            # would have the target see the data as another request.
+            phases.append(Phase(False, states, samples, 3, 0))
+
+            # 32-bits for the payload, plus the parity, and then 'turn-round'
+            # again to return control of SWDIO to the host.
+            states, samples = self.read(33)
+            states.extend(self.clock())
+            phases.append(Phase(False, states, samples, 0, 33))
+        else:
+            states.extend(self.clock())
+            phases.append(Phase(False, states, samples, 3, 0))
+
+        # Complete the operation by clocking out 8 more rising edges.
+        phases.append(Phase(True, self.write(helpers.Bits(0x0, 8)), [], 0, 0))
+        return phases
@@ -0,0 +1,195 @@
+''' Implements tests for the AIO module. '''
+
+import os
+import queue
+import asyncio
+import unittest
+import coverage
+
+import whatabanger
+
+
+class Gate(whatabanger.transport.Loopback):
+    '''
+    Provides a loopback which holds all results while closed, or once a
+    limited number have been returned.
+    '''
+
+    def __init__(self, transport):
+        ''' Ensure the gate starts open. '''
+        super(Gate, self).__init__(transport)
+        self.open = True
+        self.limit = None
+        self.blocked = False
+
+    def get(self, block=True, timeout=None):
+        ''' Returns the oldest result, unless closed. '''
+        if not self.open or self.limit == 0:
+            # A queue would block here, until the result is received.
+            self.blocked |= block
+            raise queue.Empty
+        if self.limit is not None:
+            self.limit -= 1
+        return super(Gate, self).get(block, timeout)
+
+
+class WhatABangerAioTestCase(unittest.TestCase):
+    ''' Implements tests for the AIO module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.image = os.urandom(0x1000)
+        self.target = whatabanger.simulator.Simulator(
+            memory={0x20000000: self.image},
+            aps={
+                0x00: (0x24770011, 0xE00FF003),
+                0x01: (0x44770001, 0x00000002),
+            },
+        )
+        self.gate = Gate(self.target)
+        self.session = whatabanger.aio.Session(
+            whatabanger.session.Session(self.gate, self.gate),
+        )
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test_read_write(self):
+        ''' Ensures DP and AP registers can be read and written. '''
+        async def run():
+            self.assertEqual(
+                await self.session.connect(),
+                whatabanger.simulator.SIM_DP_IDR,
+            )
+            await self.session.write(
+                whatabanger.swd.SWD_AP_TAR,
+                0x20000010,
+                ap=True,
+            )
+            self.assertEqual(
+                await self.session.read(whatabanger.swd.SWD_AP_TAR, ap=True),
+                0x20000010,
+            )
+            self.assertEqual(
+                await self.session.read(whatabanger.swd.SWD_AP_IDR, ap=True),
+                0x24770011,
+            )
+            return await self.session.read(0x0)
+
+        self.assertEqual(asyncio.run(run()), whatabanger.simulator.SIM_DP_IDR)
+
+    def test_read_memory(self):
+        ''' Ensures memory is read in chunks, across 1KB boundaries. '''
+        async def run():
+            return await self.session.read_memory(0x20000003, 0xA01)
+
+        self.assertEqual(asyncio.run(run()), self.image[3:0xA04])
+
+    def test_chunks(self):
+        ''' Ensures each chunk, and its setup, fits in half the window. '''
+        self.session.session.window = 16
+        for addr, length, size in ((0x20000003, 0xA01, None),
+                                   (0x200003F1, 0x1D, None),
+                                   (0x20000002, 0x40, 0x1)):
+            chunks = list(self.session._chunks(addr, length, size, False))
+            self.assertEqual(chunks[0][0], addr)
+            self.assertEqual(sum(count for _, count in chunks), length)
+            for start, count in chunks:
+                self.assertLessEqual(
+                    self.session._requests(start, count, size, False),
+                    8,
+                )
+
+        async def run():
+            return await self.session.read_memory(0x200003F1, 0x1D)
+
+        self.assertEqual(asyncio.run(run()), self.image[0x3F1:0x40E])
+
+    def test_error(self):
+        ''' Ensures an error doesn't wait on responses not yet received. '''
+        session = self.session.session
+        session.connect()
+
+        # The FAULT is received alone, so the responses which follow are
+        # left to later polls rather than waited on.
+        self.target.ctrl |= whatabanger.swd.SWD_CTRL_STICKYERR
+        failed = session.submit(session.protocol.drw())
+        pending = [session.submit(session.protocol.idr()) for _ in range(4)]
+        self.gate.limit = 1
+        self.assertEqual(session.poll(), 1)
+        self.assertFalse(self.gate.blocked)
+        self.assertIsInstance(
+            failed.exception(),
+            whatabanger.transport.AckError,
+        )
+        self.assertFalse(any(future.done() for future in pending))
+
+        self.gate.limit = None
+        async def run():
+            return await self.session.read(0x0)
+
+        self.assertEqual(asyncio.run(run()), whatabanger.simulator.SIM_DP_IDR)
+        self.assertEqual(
+            [session.result(future) for future in pending],
+            [whatabanger.simulator.SIM_DP_IDR] * 4,
+        )
+
+    def test_enumerate_aps(self):
+        ''' Ensures APs are enumerated, as by discovery. '''
+        async def run():
+            return await self.session.enumerate_aps()
+
+        self.assertEqual(asyncio.run(run()), [
+            {'apsel': 0x00, 'idr': 0x24770011, 'base': 0xE00FF003},
+            {'apsel': 0x01, 'idr': 0x44770001, 'base': 0x00000002},
+        ])
+
+    def test_deadline(self):
+        ''' Ensures an operation which stalls is timed out. '''
+        async def run():
+            self.gate.open = False
+            await self.session.read_memory(0x20000000, 0x400, timeout=0.05)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+
+    def test_cancel(self):
+        ''' Ensures a session is usable after an operation is cancelled. '''
+        async def run():
+            self.gate.open = False
+            task = asyncio.ensure_future(
+                self.session.read_memory(0x20000000, 0x1000)
+            )
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            # Responses to the cancelled operation are collected, and
+            # ignored, by the next.
+            self.gate.open = True
+            return await self.session.read_memory(0x20000800, 0x20)
+
+        self.assertEqual(asyncio.run(run()), self.image[0x800:0x820])
+
+    def test_concurrent(self):
+        ''' Ensures operations on several sessions are interleaved. '''
+        other = whatabanger.simulator.Simulator(
+            memory={0x20000000: bytes(reversed(self.image))},
+        )
+        loopback = whatabanger.transport.Loopback(other)
+        session = whatabanger.aio.Session(
+            whatabanger.session.Session(loopback, loopback),
+        )
+
+        async def run():
+            return await asyncio.gather(
+                self.session.read_memory(0x20000000, 0x1000),
+                session.read_memory(0x20000000, 0x1000),
+            )
+
+        self.assertEqual(
+            asyncio.run(run()),
+            [self.image, bytes(reversed(self.image))],
+        )
@@ -0,0 +1,146 @@
+''' Implements tests for the Cortex-M module. '''
+
+import os
+import zlib
+import struct
+import unittest
+import coverage
+
+import whatabanger
+
+from whatabanger import cortexm
+
+
+class DelayedSimulator(whatabanger.simulator.CoreSimulator):
+    ''' Extends the simulated core with register transfers which lag. '''
+
+    def __init__(self, memory, delay):
+        ''' Ensure the transfer of the given registers is delayed. '''
+        super(DelayedSimulator, self).__init__(memory=memory)
+        self.delay = set(delay)
+        self.pending = None
+
+    def _debug_load(self, addr):
+        ''' Clears S_REGRDY once after each delayed transfer. '''
+        status = super(DelayedSimulator, self)._debug_load(addr)
+        if addr == cortexm.CORTEXM_DHCSR and self.pending in self.delay:
+            self.delay.discard(self.pending)
+            status &= ~cortexm.CORTEXM_DHCSR_S_REGRDY
+        return status
+
+    def _debug_store(self, addr, value):
+        ''' Tracks the last register transferred. '''
+        super(DelayedSimulator, self)._debug_store(addr, value)
+        if addr == cortexm.CORTEXM_DCRSR:
+            self.pending = value & 0x7F
+
+
+class WhatABangerCortexmTestCase(unittest.TestCase):
+    ''' Implements tests for the Cortex-M module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        # A loop incrementing R0 forever.
+        #     adds r0, #1
+        #     b    0x0
+        self.program = struct.pack('<2H', 0x3001, 0xE7FD)
+        self.target = whatabanger.simulator.CoreSimulator(
+            memory={0x20000000: self.program + bytes(0xFFC)},
+        )
+        self._connect(self.target)
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def _connect(self, target):
+        ''' Sets up a session, and core, for a simulated target. '''
+        loopback = whatabanger.transport.Loopback(target)
+        self.session = whatabanger.session.Session(loopback, loopback)
+        self.core = cortexm.Core(self.session)
+
+    def test_halt_resume(self):
+        ''' Ensures the core runs once resumed, until halted. '''
+        self.assertTrue(self.core.halted())
+        self.core.run(0x20000000, {0: 0})
+        self.assertFalse(self.core.halted())
+
+        self.session.read_memory(0x20000000, 0x100)
+        self.core.halt()
+        self.assertTrue(self.core.halted())
+        self.assertGreater(self.core.read_register(0), 0)
+
+    def test_step(self):
+        ''' Ensures a single instruction is executed per step. '''
+        self.core.write_registers({
+            0: 0x10,
+            cortexm.CORTEXM_REG_PC: 0x20000000,
+            cortexm.CORTEXM_REG_XPSR: cortexm.CORTEXM_XPSR_THUMB,
+        })
+        self.core.step()
+        self.assertEqual(self.core.read_registers([0, 15]), {
+            0: 0x11,
+            15: 0x20000002,
+        })
+
+        self.core.step()
+        self.core.step()
+        self.assertTrue(self.core.halted())
+        self.assertEqual(self.target.instructions, 3)
+        self.assertEqual(self.core.read_registers([0, 15]), {
+            0: 0x12,
+            15: 0x20000002,
+        })
+
+    def test_register_file(self):
+        ''' Ensures the register file is transferred in a single burst. '''
+        values = {reg: zlib.crc32(bytes([reg])) for reg in cortexm.CORTEXM_REGS}
+        self.core.write_registers(values)
+        self.assertEqual(self.target.core, values)
+
+        # Each register needs only three transfers, with SELECT, CSW and TAR
+        # written once, and the last read from RDBUFF.
+        transactions = self.target.transactions
+        self.assertEqual(self.core.read_registers(), values)
+        self.assertLessEqual(
+            self.target.transactions - transactions,
+            len(values) * 3 + 4,
+        )
+
+    def test_regrdy(self):
+        ''' Ensures registers which weren't ready are transferred again. '''
+        target = DelayedSimulator(
+            {0x20000000: bytes(0x1000)},
+            [3, cortexm.CORTEXM_REG_PC],
+        )
+        self._connect(target)
+        target.core = {reg: reg * 0x1111 for reg in cortexm.CORTEXM_REGS}
+        self.assertEqual(self.core.read_registers(), target.core)
+        self.assertFalse(target.delay)
+
+        values = {reg: reg * 0x2222 for reg in cortexm.CORTEXM_REGS}
+        target.delay = set([5])
+        self.core.write_registers(values)
+        self.assertEqual(target.core, values)
+        self.assertFalse(target.delay)
+
+    def test_running(self):
+        ''' Ensures registers can't be accessed while the core is running. '''
+        self.core.run(0x20000000)
+        with self.assertRaises(Exception):
+            self.core.read_registers()
+
+    def test_checksum(self):
+        ''' Ensures the CRC32 routine matches zlib, for every block. '''
+        image = os.urandom(0x900)
+        target = whatabanger.simulator.CoreSimulator(
+            memory={0x20000000: bytes(0x800), 0x08000000: image},
+            steps=4096,
+        )
+        self._connect(target)
+        checksum = cortexm.Checksum(self.session, core=self.core)
+        self.assertEqual(
+            checksum.crc32(0x08000000, len(image), 0x200),
+            [zlib.crc32(image[i:i + 0x200]) for i in range(0, 0x900, 0x200)],
+        )
+        self.assertTrue(self.core.halted())
@@ -0,0 +1,101 @@
+''' Implements tests for the Discovery module. '''
+
+import shutil
+import struct
+import tempfile
+import unittest
+import coverage
+
+import whatabanger
+
+
+def _component(cls, part, entries=()):
+    ''' Returns a 4KB component, with the given ROM table entries. '''
+    data = bytearray(0x1000)
+    for idx, entry in enumerate(entries):
+        struct.pack_into('<I', data, idx * 4, entry)
+
+    # PIDR4-7, PIDR0-3 (ARM, with the given part number) and CIDR0-3.
+    pidr = [0x04, 0x00, 0x00, 0x00, part & 0xFF, 0xB0 | (part >> 8), 0x3B, 0x00]
+    cidr = [0x0D, (cls << 4), 0x05, 0xB1]
+    struct.pack_into('<12I', data, 0xFD0, *(pidr + cidr))
+    return bytes(data)
+
+
+class WhatABangerDiscoveryTestCase(unittest.TestCase):
+    ''' Implements tests for the Discovery module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.path = tempfile.mkdtemp()
+        memory = {
+            # The top-level ROM table refers to the SCS, the DWT, a missing
+            # component, one which doesn't respond, itself and a nested ROM
+            # table.
+            0xE00FF000: _component(0x1, 0x4C3, [
+                0xFFF0F003,
+                0xFFF02003,
+                0xFFF03002,
+                0xFFF05003,
+                0x00000003,
+                0xFFF41003,
+            ]),
+            0xE000E000: _component(0xE, 0x000),
+            0xE0001000: _component(0xE, 0x002),
+            0xE0040000: _component(0x1, 0x4C4, [0x00001003]),
+            0xE0041000: _component(0x9, 0x923),
+        }
+        aps = {
+            0x00: (whatabanger.simulator.SIM_AP_IDR, 0xE00FF003),
+            0x01: (0x04770002, 0xFFFFFFFF),
+            0x03: (whatabanger.simulator.SIM_AP_IDR, 0xE00FF003),
+        }
+        self.target = whatabanger.simulator.Simulator(memory=memory, aps=aps)
+        loopback = whatabanger.transport.Loopback(self.target)
+        self.session = whatabanger.session.Session(loopback, loopback)
+        self.discovery = whatabanger.discovery.Discovery(
+            self.session,
+            cache=self.path,
+        )
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        shutil.rmtree(self.path)
+
+    def test_enumerate_aps(self):
+        ''' Ensures enumeration stops at the first AP not implemented. '''
+        self.session.connect()
+        aps = self.discovery.enumerate_aps()
+        self.assertEqual([ap['apsel'] for ap in aps], [0x00, 0x01])
+        self.assertEqual(aps[0]['base'], 0xE00FF003)
+
+        aps = self.discovery.enumerate_aps(early_stop=False)
+        self.assertEqual([ap['apsel'] for ap in aps], [0x00, 0x01, 0x03])
+
+    def test_walk(self):
+        ''' Ensures ROM tables are walked recursively. '''
+        self.session.connect()
+        rom = self.discovery.walk(0xE00FF000)
+        self.assertEqual(rom['part'], 0x4C3)
+        self.assertEqual(rom['designer'], 0x23B)
+        self.assertEqual(
+            [child['address'] for child in rom['children']],
+            [0xE000E000, 0xE0001000, 0xE0040000],
+        )
+        nested = rom['children'][2]
+        self.assertEqual(
+            [child['address'] for child in nested['children']],
+            [0xE0041000],
+        )
+        self.assertEqual(nested['children'][0]['class'], 0x9)
+
+    def test_discover(self):
+        ''' Ensures the topology is cached, and used on the next connect. '''
+        topology = self.discovery.discover()
+        self.assertEqual(topology['dp'], whatabanger.simulator.SIM_DP_IDR)
+        self.assertEqual(topology['aps'][0]['rom']['part'], 0x4C3)
+        self.assertIsNone(topology['aps'][1]['rom'])
+
+        start = self.target.transactions
+        self.assertEqual(self.discovery.discover(), topology)
+        self.assertEqual(self.target.transactions - start, 3)
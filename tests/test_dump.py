@@ -0,0 +1,47 @@
+''' Implements tests for the Dump module. '''
+
+import os
+import shutil
+import tempfile
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerDumpTestCase(unittest.TestCase):
+    ''' Implements tests for the Dump module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.image = os.urandom(0x1000)
+        self.target = whatabanger.simulator.Simulator(
+            memory={0x20000000: self.image}
+        )
+        loopback = whatabanger.transport.Loopback(self.target)
+        self.session = whatabanger.session.Session(loopback, loopback)
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        shutil.rmtree(self.path)
+
+    def test_dump(self):
+        ''' Ensures memory is streamed to file. '''
+        path = os.path.join(self.path, 'sram.bin')
+        whatabanger.dump.dump(self.session, 0x20000000, 0x1000, path)
+        with open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), self.image)
+
+    def test_dump_mmap(self):
+        ''' Ensures memory is streamed to a pre-sized mmap. '''
+        path = os.path.join(self.path, 'sram.bin')
+        whatabanger.dump.dump(
+            self.session,
+            0x20000400,
+            0x800,
+            path,
+            use_mmap=True,
+        )
+        with open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), self.image[0x400:0xC00])
@@ -0,0 +1,122 @@
+''' Implements tests for the Executor module. '''
+
+import unittest
+import coverage
+
+import whatabanger
+
+
+class FakeFtdi(object):
+    ''' Provides just enough of an FTDI device to echo port states back. '''
+
+    def __init__(self):
+        ''' Ensure the baudrate is tracked. '''
+        self.baudrate = None
+        self._pending = b''
+
+    def set_baudrate(self, baudrate):
+        ''' Tracks the baudrate. '''
+        self.baudrate = baudrate
+
+    def write_data(self, data):
+        ''' Holds port states, to be read back. '''
+        self._pending = bytes(data)
+
+    def read_data_bytes(self, size, attempt=1):
+        ''' Returns the port states last written. '''
+        return self._pending[:size]
+
+
+class FakeExecutor(whatabanger.executor.Executor):
+    '''
+    Provides an executor whose link corrupts reads when the clock is faster
+    than a limit, rather than banging onto a wire.
+    '''
+
+    def __init__(self, limit, **kwargs):
+        ''' Ensure the limit is known before setup. '''
+        self.limit = limit
+        super(FakeExecutor, self).__init__(None, None, **kwargs)
+
+    def _open(self):
+        ''' Setup a fake interface. '''
+        self.ftdi = FakeFtdi()
+        self.set_clock(self.clock)
+
+    def _bang(self, phases):
+        ''' Returns DP IDR for reads, with bad parity if too fast. '''
+        if not sum(phase.read for phase in phases):
+            return whatabanger.helpers.Bits()
+
+        data = whatabanger.swd.payload(whatabanger.simulator.SIM_DP_IDR)
+        if self.clock < self.limit:
+            data = whatabanger.helpers.Bits(data.value ^ (1 << 32), 33)
+        return data
+
+
+class WhatABangerExecutorTestCase(unittest.TestCase):
+    ''' Implements tests for the Executor module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.protocol = whatabanger.swd.Protocol()
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test_set_clock(self):
+        ''' Ensures the interface is reprogrammed for a new clock. '''
+        executor = FakeExecutor(0.0)
+        self.assertEqual(executor.ftdi.baudrate, 1000)
+
+        executor.set_clock(0.0)
+        self.assertEqual(
+            executor.ftdi.baudrate,
+            whatabanger.timing.TIMING_ZERO_DELAY_RATE,
+        )
+        self.assertGreater(executor.timing.calibrated, 0.0)
+
+    def test_tune(self):
+        ''' Ensures the fastest error free clock is selected. '''
+        executor = FakeExecutor(1.0E-5, autotune=True)
+        self.assertEqual(executor.clock, 1.0E-5)
+
+        # Nothing is selected if the link never works.
+        with self.assertRaises(Exception):
+            FakeExecutor(1.0, autotune=True)
+
+    def test_fallback(self):
+        ''' Ensures the clock is slowed when parity errors increase. '''
+        executor = FakeExecutor(1.0E-5, autotune=True)
+        executor.limit = 2.0E-5
+
+        # Reads with bad parity are still returned to the caller, until the
+        # clock is slowed - which fails the read, as the line was reset.
+        for _ in range(whatabanger.executor.EXECUTOR_TUNE_ERRORS - 1):
+            executor.execute(self.protocol.idr())
+        with self.assertRaises(whatabanger.transport.ClockChanged):
+            executor.execute(self.protocol.idr())
+        self.assertEqual(executor.clock, 2.0E-5)
+
+        for _ in range(whatabanger.executor.EXECUTOR_TUNE_WINDOW):
+            data = executor.execute(self.protocol.idr())
+            self.assertTrue(whatabanger.swd.check_parity(
+                data[32],
+                data[0:32].value,
+            ))
+        self.assertEqual(executor.clock, 2.0E-5)
+
+    def test_fallback_session(self):
+        ''' Ensures a session forgets its shadows when the clock is slowed. '''
+        executor = FakeExecutor(1.0E-5, autotune=True)
+        loopback = whatabanger.transport.Loopback(executor)
+        session = whatabanger.session.Session(loopback, loopback)
+        session.write_dp(0x8, 0x0)
+        executor.limit = 2.0E-5
+
+        for _ in range(whatabanger.executor.EXECUTOR_TUNE_ERRORS - 1):
+            session.transact(self.protocol.idr())
+        with self.assertRaises(whatabanger.transport.ClockChanged):
+            session.transact(self.protocol.idr())
+        self.assertIsNone(session._select)
@@ -52,3 +52,27 @@ class WhatABangerHelpersTestCase(unittest.TestCase):
             whatabanger.helpers.bits_to_bytes([0, 0, 0, 0, 0, 0, 0, 1]),
             0x80,
         )
+
+    def test_bits(self):
+        ''' Ensures packed bits behave like a list of bits, LSb first. '''
+        candidate = whatabanger.helpers.Bits(0b10000101, 8)
+        desired = [1, 0, 1, 0, 0, 0, 0, 1]
+        self.assertEqual(candidate, desired)
+        self.assertEqual(list(candidate), desired)
+        self.assertEqual(len(candidate), 8)
+        self.assertEqual(candidate.count(1), 3)
+        self.assertEqual(candidate[0], 1)
+        self.assertEqual(candidate[-1], 1)
+        self.assertEqual(candidate[2:4], [1, 0])
+
+        # Concatenation places the following bits after the last.
+        candidate += whatabanger.helpers.Bits(0b11, 2)
+        self.assertEqual(candidate, desired + [1, 1])
+        self.assertEqual(whatabanger.helpers.bits_to_bytes(candidate), 0x385)
+
+    def test_bits_of(self):
+        ''' Ensures lists of bits are packed. '''
+        candidate = whatabanger.helpers.Bits.of([1, 0, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(candidate.value, 0x81)
+        self.assertEqual(candidate.length, 8)
+        self.assertEqual(whatabanger.helpers.Bits.of([]).length, 0)
@@ -0,0 +1,87 @@
+''' Implements tests for the MPSSE module. '''
+
+import logging
+import unittest
+import coverage
+
+import whatabanger
+
+from pyftdi.ftdi import Ftdi
+
+
+class WhatABangerMpsseTestCase(unittest.TestCase):
+    ''' Implements tests for the MPSSE module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        # The executor is not initialised, as that requires an FT2232H.
+        klass = whatabanger.mpsse.MpsseExecutor
+        self.executor = klass.__new__(klass)
+        self.executor.state = 0x0
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test__write(self):
+        ''' Ensures bits are packed LSb first into MPSSE write commands. '''
+        candidate = self.executor._write([1, 0, 1, 0, 0, 1, 0, 1, 1, 1])
+        desired = bytearray([
+            Ftdi.WRITE_BYTES_NVE_LSB, 0x00, 0x00, 0xA5,
+            Ftdi.WRITE_BITS_NVE_LSB, 0x01, 0x03,
+        ])
+        self.assertEqual(candidate, desired)
+
+    def test__read(self):
+        ''' Ensures reads are split into commands of up to 8 bits. '''
+        cmd, widths = self.executor._read(10)
+        desired = bytearray([
+            Ftdi.READ_BITS_PVE_LSB, 0x07,
+            Ftdi.READ_BITS_PVE_LSB, 0x01,
+        ])
+        self.assertEqual(cmd, desired)
+        self.assertEqual(widths, [8, 2])
+
+    def test__direction(self):
+        ''' Ensures SWDIO is released during 'turn-round'. '''
+        candidate = self.executor._direction(False)
+        self.assertEqual(candidate, bytearray([Ftdi.SET_BITS_LOW, 0x0, 0x01]))
+
+        candidate = self.executor._direction(True)
+        self.assertEqual(candidate, bytearray([Ftdi.SET_BITS_LOW, 0x0, 0x03]))
+
+    def test__stream(self):
+        ''' Ensures streamed requests are split back into ACKs and data. '''
+        protocol = whatabanger.swd.Protocol()
+        requests = [protocol.idr(), protocol.tar(addr=0x20000000)]
+
+        # 'turn-round', OK, the payload and 'turn-round' for the read, and
+        # 'turn-round', WAIT and 'turn-round' for the write.
+        bits = whatabanger.helpers.Bits(0b0010, 4)
+        bits += whatabanger.swd.payload(0x1BA01477)
+        bits += whatabanger.helpers.Bits(0b0, 1)
+        bits += whatabanger.helpers.Bits(0b0100, 4)
+        bits += whatabanger.helpers.Bits(0b0, 1)
+
+        widths = []
+        self.executor._transfer = lambda cmd, more: widths.extend(more) or bits
+        results = self.executor._stream(requests)
+        self.assertEqual(sum(widths), len(bits))
+        self.assertEqual(results, [
+            (whatabanger.swd.SWD_ACK_OK, whatabanger.swd.payload(0x1BA01477)),
+            (whatabanger.swd.SWD_ACK_WAIT, []),
+        ])
+
+    def test__execute_wait(self):
+        ''' Ensures nothing but a 'turn-round' follows a read not ACKed OK. '''
+        transfers = []
+
+        def transfer(cmd, widths):
+            transfers.append(widths)
+            return whatabanger.helpers.Bits(0b0100, 4)
+
+        self.executor._transfer = transfer
+        self.executor.log = logging.getLogger(__name__)
+        with self.assertRaises(whatabanger.transport.AckError):
+            self.executor._execute(whatabanger.swd.Protocol().idr())
+        self.assertEqual(transfers, [[4], [1]])
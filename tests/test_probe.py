@@ -0,0 +1,96 @@
+''' Implements tests for the Probe module. '''
+
+import os
+import shutil
+import tempfile
+import unittest
+import collections
+import coverage
+
+from unittest import mock
+
+import whatabanger
+
+
+class WhatABangerProbeTestCase(unittest.TestCase):
+    ''' Implements tests for the Probe module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.image = os.urandom(0x2800)
+        self.path = tempfile.mkdtemp()
+
+        # Every 'probe' is a simulated target, with the same memory image.
+        def factory(url, req, res):
+            return whatabanger.simulator.Simulator(
+                req,
+                res,
+                memory={0x20000000: self.image},
+            )
+
+        self.manager = whatabanger.probe.Manager(
+            urls=['sim://{}'.format(idx) for idx in range(3)],
+            factory=factory,
+        )
+        self.manager.start()
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        self.manager.stop()
+        shutil.rmtree(self.path)
+
+    def test_shard(self):
+        ''' Ensures ranges are split into aligned shards. '''
+        self.assertEqual(
+            whatabanger.probe.shard(0x20000000, 0x2800, 3),
+            [(0x20000000, 0x1000), (0x20001000, 0x1000), (0x20002000, 0x800)],
+        )
+        self.assertEqual(
+            whatabanger.probe.shard(0x20000000, 0x100, 4),
+            [(0x20000000, 0x100)],
+        )
+
+    def test_find(self):
+        ''' Ensures interfaces are found, whichever form pyftdi returns. '''
+        descriptor = collections.namedtuple(
+            'UsbDeviceDescriptor',
+            'vid pid bus address sn index description',
+        )
+        expected = [
+            'ftdi://0x0403:0x6010:FT01/1',
+            'ftdi://0x0403:0x6010:FT01/2',
+            'ftdi://0x0403:0x6014:FT02/1',
+        ]
+        for found in (
+                [
+                    (0x0403, 0x6010, 'FT01', 2, 'Dual RS232-HS'),
+                    (0x0403, 0x6014, 'FT02', 4, 'Single RS232-HS'),
+                ],
+                [
+                    (descriptor(0x0403, 0x6010, 1, 2, 'FT01', None, ''), 2),
+                    (descriptor(0x0403, 0x6014, 1, 3, 'FT02', None, ''), 4),
+                ]):
+            with mock.patch.object(
+                    whatabanger.probe.Ftdi,
+                    'find_all',
+                    return_value=found):
+                self.assertEqual(whatabanger.probe.find(), expected)
+
+    def test_map(self):
+        ''' Ensures a job is run against every probe. '''
+        self.assertEqual(
+            self.manager.map(lambda session, addr: session.read_word(addr), 0x20000010),
+            [int.from_bytes(self.image[0x10:0x14], 'little')] * 3,
+        )
+
+    def test_dump(self):
+        ''' Ensures a dump is sharded across probes, and joined in order. '''
+        path = os.path.join(self.path, 'dump.bin')
+        self.manager.dump(0x20000000, len(self.image), path)
+        with open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), self.image)
+        self.assertEqual(os.listdir(self.path), ['dump.bin'])
+
+        # Every probe did its share.
+        for probe in self.manager.probes:
+            self.assertGreater(probe.transport.stats()['serviced'], 0x300 // 4)
@@ -0,0 +1,96 @@
+''' Implements tests for the Ring module. '''
+
+import queue
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerRingTestCase(unittest.TestCase):
+    ''' Implements tests for the Ring module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.protocol = whatabanger.swd.Protocol()
+        self.request = whatabanger.ring.Ring(slots=4)
+        self.response = whatabanger.ring.Ring(slots=4)
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        self.request.close()
+        self.response.close()
+
+    def test_request(self):
+        ''' Ensures requests survive a round trip through the ring. '''
+        for request in [
+                self.protocol.resync(),
+                self.protocol.idr(),
+                self.protocol.tar(addr=0x20000000),
+        ]:
+            self.request.put(request)
+            self.assertEqual(self.request.qsize(), 1)
+            self.assertEqual(self.request.get(), request)
+
+    def test_response(self):
+        ''' Ensures responses survive a round trip through the ring. '''
+        response = whatabanger.swd.payload(0x1BA01477)
+        self.response.put(response)
+        self.assertEqual(self.response.get(), response)
+
+    def test_wrap(self):
+        ''' Ensures slots are reused, and timeouts raise. '''
+        for idx in range(10):
+            self.response.put(whatabanger.swd.payload(idx))
+            self.assertEqual(self.response.get().value & 0xFF, idx)
+
+        with self.assertRaises(queue.Empty):
+            self.response.get(timeout=0.01)
+
+    def test_transport(self):
+        ''' Ensures rings can be used in place of queues for a transport. '''
+        transport = whatabanger.simulator.Simulator(self.request, self.response)
+        transport.start()
+        try:
+            session = whatabanger.session.Session(self.request, self.response)
+            self.assertEqual(
+                session.connect(),
+                whatabanger.simulator.SIM_DP_IDR,
+            )
+        finally:
+            transport.terminate()
+            transport.join()
+
+    def test_correlation(self):
+        ''' Ensures correlation IDs are carried by requests and responses. '''
+        request = dict(self.protocol.idr(), ID=0xDEADBEEF)
+        self.request.put(request)
+        self.assertEqual(self.request.get(), request)
+
+        response = (0x1234, whatabanger.swd.payload(0x1))
+        self.response.put(response)
+        self.assertEqual(self.response.get(), response)
+
+    def test_error(self):
+        ''' Ensures errors survive a round trip through the ring. '''
+        self.response.put((3, whatabanger.transport.AckError(0b100)))
+        ident, result = self.response.get()
+        self.assertEqual(ident, 3)
+        self.assertIsInstance(result, whatabanger.transport.AckError)
+        self.assertEqual(result.ack, whatabanger.swd.SWD_ACK_FAULT)
+
+        # Clock changes aren't ACKs from the target, and stay distinguishable.
+        self.response.put((4, whatabanger.transport.ClockChanged()))
+        ident, result = self.response.get()
+        self.assertEqual(ident, 4)
+        self.assertIsInstance(result, whatabanger.transport.ClockChanged)
+
+    def test_target(self):
+        ''' Ensures targets survive a round trip through the ring. '''
+        request = dict(self.protocol.drw(), ID=7, TARGET=0x11002927)
+        self.request.put(request)
+        self.assertEqual(self.request.get(), request)
+
+        request = self.protocol.wakeup()
+        self.request.put(request)
+        self.assertEqual(self.request.get(), request)
@@ -0,0 +1,339 @@
+''' Implements tests for the Session module. '''
+
+import os
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerSessionTestCase(unittest.TestCase):
+    ''' Implements tests for the Session module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.image = os.urandom(0x1000)
+        self.target = whatabanger.simulator.Simulator(
+            memory={0x20000000: self.image}
+        )
+        loopback = whatabanger.transport.Loopback(self.target)
+        self.session = whatabanger.session.Session(loopback, loopback)
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test_connect(self):
+        ''' Ensures the DP IDR is returned on connection. '''
+        self.assertEqual(
+            self.session.connect(),
+            whatabanger.simulator.SIM_DP_IDR,
+        )
+
+    def test_read_ap(self):
+        ''' Ensures AP registers can be read from any bank. '''
+        self.assertEqual(
+            self.session.read_ap(whatabanger.swd.SWD_AP_IDR),
+            whatabanger.simulator.SIM_AP_IDR,
+        )
+        self.assertEqual(
+            self.session.read_ap(whatabanger.swd.SWD_AP_BASE),
+            whatabanger.simulator.SIM_AP_BASE,
+        )
+
+    def test_read_memory(self):
+        ''' Ensures memory reads across 1KB boundaries are correct. '''
+        self.session.connect()
+        start = self.target.transactions
+
+        candidate = self.session.read_memory(0x20000100, 0x800)
+        self.assertEqual(candidate, self.image[0x100:0x900])
+
+        # One transaction per word, plus TAR and the posted read at each of
+        # the 3 boundaries - and the SELECT and CSW.
+        self.assertEqual(
+            self.target.transactions - start,
+            (0x800 // 4) + (3 * 2) + 2,
+        )
+
+    def test_read_memory_alignment(self):
+        ''' Ensures reads not aligned to the transfer size are rejected. '''
+        with self.assertRaises(Exception):
+            list(self.session.stream_memory(0x20000001, 0x4))
+        with self.assertRaises(Exception):
+            self.session.read_memory(
+                0x20000002,
+                0x4,
+                size=whatabanger.swd.SWD_CSW_SIZE_HALF,
+                packed=True,
+            )
+
+    def test_read_memory_unaligned(self):
+        ''' Ensures unaligned reads only use sub-word transfers at the ends. '''
+        self.assertEqual(
+            self.session._runs(0x20000001, 0xC),
+            [
+                (0x20000001, 0x1, whatabanger.swd.SWD_CSW_SIZE_BYTE),
+                (0x20000002, 0x2, whatabanger.swd.SWD_CSW_SIZE_HALF),
+                (0x20000004, 0x8, whatabanger.swd.SWD_CSW_SIZE_WORD),
+                (0x2000000C, 0x1, whatabanger.swd.SWD_CSW_SIZE_BYTE),
+            ],
+        )
+        for addr, length in [(0x1, 0xC), (0x3, 0x1), (0x2, 0x2), (0x3FE, 0x7)]:
+            self.assertEqual(
+                self.session.read_memory(0x20000000 + addr, length),
+                self.image[addr:addr + length],
+            )
+
+    def test_read_memory_packed(self):
+        ''' Ensures packed transfers read a word per DRW read. '''
+        # The first read needs a SELECT, CSW and TAR - but as the second is
+        # of the same AP, and bank, SELECT is not needed again.
+        for size, setup in ((whatabanger.swd.SWD_CSW_SIZE_BYTE, 3),
+                            (whatabanger.swd.SWD_CSW_SIZE_HALF, 2)):
+            transactions = self.target.transactions
+            data = self.session.read_memory(
+                0x20000100,
+                0x40,
+                size=size,
+                packed=True,
+            )
+            self.assertEqual(data, self.image[0x100:0x140])
+            self.assertEqual(
+                self.target.transactions - transactions,
+                setup + 1 + 0x10,
+            )
+
+        # Without packing, every item is a DRW read.
+        data = self.session.read_memory(
+            0x20000101,
+            0x3,
+            size=whatabanger.swd.SWD_CSW_SIZE_BYTE,
+        )
+        self.assertEqual(data, self.image[0x101:0x104])
+
+    def test_read_words(self):
+        ''' Ensures scattered words are read, with a TAR write per window. '''
+        addrs = [0x20000004, 0x2000000C, 0x20000400, 0x20000FFC, 0x20000000]
+        transactions = self.target.transactions
+        self.assertEqual(self.session.read_words(addrs), [
+            int.from_bytes(self.image[addr - 0x20000000:][:4], 'little')
+            for addr in addrs
+        ])
+
+        # Memory reads after the banked accesses must still be correct.
+        self.assertEqual(self.session.read_memory(0x20000000, 8), self.image[:8])
+        self.assertLess(self.target.transactions - transactions, 30)
+
+    def test_write_memory_unaligned(self):
+        ''' Ensures unaligned writes leave neighbouring bytes untouched. '''
+        self.session.write_memory(0x20000003, b'\xAA' * 0x7)
+        self.assertEqual(
+            self.session.read_memory(0x20000000, 0xC),
+            self.image[0:3] + b'\xAA' * 0x7 + self.image[0xA:0xC],
+        )
+
+    def test_submit(self):
+        ''' Ensures submitted requests are matched to their results. '''
+        self.session.connect()
+        pending = [
+            self.session.submit(self.session.protocol.idr()),
+            self.session.submit(self.session.protocol.stat()),
+            self.session.submit(self.session.protocol.idr()),
+        ]
+        self.assertEqual(
+            [self.session._value(future.result()) for future in pending],
+            [whatabanger.simulator.SIM_DP_IDR, 0x0, whatabanger.simulator.SIM_DP_IDR],
+        )
+        self.assertEqual(self.session._pending, {})
+
+    def test_window(self):
+        ''' Ensures the number of requests in flight is bounded. '''
+        self.session.window = 4
+        for _ in range(10):
+            self.session.submit(self.session.protocol.idr())
+        self.assertEqual(len(self.session._pending), 4)
+
+    def test_error(self):
+        ''' Ensures requests which can't be completed raise from the future. '''
+        self.session.connect()
+        self.target.retries = 0
+        self.target.wait = 1.0
+        future = self.session.submit(self.session.protocol.drw())
+        with self.assertRaises(whatabanger.transport.AckError):
+            future.result()
+        self.assertEqual(self.session._pending, {})
+
+    def test_write_memory(self):
+        ''' Ensures memory can be written, across 1KB boundaries. '''
+        data = os.urandom(0x800)
+        self.session.write_memory(0x20000200, data)
+        self.assertEqual(self.session.read_memory(0x20000200, 0x800), data)
+
+        # Half-words are placed in the byte lanes addressed by TAR.
+        self.session.write_memory(
+            0x20000002,
+            b'\x01\x02\x03\x04\x05\x06',
+            size=whatabanger.swd.SWD_CSW_SIZE_HALF,
+        )
+        self.assertEqual(
+            self.session.read_memory(0x20000000, 0x8)[2:],
+            b'\x01\x02\x03\x04\x05\x06',
+        )
+
+    def test_write_memory_packed(self):
+        ''' Ensures packed transfers write a word per DRW write. '''
+        data = os.urandom(0x100)
+        transactions = self.target.transactions
+        self.session.write_memory(
+            0x20000000,
+            data,
+            size=whatabanger.swd.SWD_CSW_SIZE_BYTE,
+            packed=True,
+        )
+        self.assertEqual(self.target.transactions - transactions, 4 + 0x40)
+        self.assertEqual(self.session.read_memory(0x20000000, 0x100), data)
+
+        with self.assertRaises(Exception):
+            self.session.write_memory(
+                0x20000001,
+                b'\x00',
+                size=whatabanger.swd.SWD_CSW_SIZE_BYTE,
+                packed=True,
+            )
+
+    def test_bus_error(self):
+        ''' Ensures bus errors are raised, rather than returning bad data. '''
+        # Reads run off the end of SRAM, so the FAULT is seen by a later
+        # posted read - which must not be replayed.
+        with self.assertRaises(whatabanger.transport.AckError):
+            self.session.read_memory(0x20000FF8, 0x10)
+
+        # A single write is checked by the RDBUFF read which follows it.
+        with self.assertRaises(whatabanger.transport.AckError):
+            self.session.write_word(0x30000000, 0x12345678)
+
+        self.assertEqual(
+            self.session.read_memory(0x20000FF8, 0x8),
+            self.image[0xFF8:],
+        )
+
+    def test_bus_error_posted(self):
+        ''' Ensures a FAULT on the first DRW read of a block is raised. '''
+        self.session.read_memory(0x20000000, 0x8)
+
+        # A posted write, submitted around the shadows, leaves a bus error -
+        # which the next AP access sees. As the read which follows needs no
+        # setup, that is the first DRW read of its block.
+        pending = [
+            self.session.submit(self.session.protocol.tar(addr=0x30000000)),
+            self.session.submit(self.session.protocol.drw(value=0x0)),
+        ]
+        for future in pending:
+            future.result()
+
+        start, _, writes, reads = next(
+            self.session.submit_read_memory(0x20000008, 0x10)
+        )
+        self.assertEqual(start, 0x20000008)
+        self.assertEqual(len(writes), 1)
+        with self.assertRaises(whatabanger.transport.AckError):
+            writes[0].result()
+
+        self.assertEqual(
+            self.session.read_memory(0x20000008, 0x10),
+            self.image[0x8:0x18],
+        )
+
+    def test_sticky_error(self):
+        ''' Ensures a FAULT on the first posted read of a block is raised. '''
+        self.assertEqual(self.session.read_memory(0x20000000, 0x8), self.image[:8])
+
+        # The read which follows is contiguous, so needs no setup - and the
+        # first DRW read is the one to FAULT. The reads after it must not
+        # return data shifted by a word.
+        self.target.ctrl |= whatabanger.swd.SWD_CTRL_STICKYERR
+        with self.assertRaises(whatabanger.transport.AckError):
+            self.session.read_memory(0x20000008, 0x10)
+
+        self.assertEqual(
+            self.session.read_memory(0x20000008, 0x10),
+            self.image[0x8:0x18],
+        )
+
+    def test_shadow(self):
+        ''' Ensures writes of values already in effect are dropped. '''
+        self.session.connect()
+        self.session.read_memory(0x20000000, 0x10)
+
+        # Contiguous reads need no SELECT, CSW or TAR - just the posted read.
+        start = self.target.transactions
+        data = self.session.read_memory(0x20000010, 0x10)
+        self.assertEqual(data, self.image[0x10:0x20])
+        self.assertEqual(self.target.transactions - start, 1 + 4)
+
+        # Re-writing TAR to where it already is is also dropped.
+        start = self.target.transactions
+        self.session.write_ap(whatabanger.swd.SWD_AP_TAR, 0x20000020)
+        self.assertEqual(self.target.transactions - start, 0)
+
+        # A block ending on a 1KB boundary may, or may not, carry into the
+        # next - so the same block read again must re-write TAR.
+        self.session.read_memory(0x20000000, 0x400)
+        start = self.target.transactions
+        data = self.session.read_memory(0x20000000, 0x400)
+        self.assertEqual(data, self.image[:0x400])
+        self.assertEqual(self.target.transactions - start, 1 + 0x100 + 1)
+
+        # A line reset forgets everything.
+        self.session.transact(self.session.protocol.resync())
+        start = self.target.transactions
+        data = self.session.read_memory(0x20000020, 0x10)
+        self.assertEqual(data, self.image[0x20:0x30])
+        self.assertEqual(self.target.transactions - start, 3 + 1 + 4)
+
+    def test_shadow_fault(self):
+        ''' Ensures shadows are forgotten when a request fails. '''
+        self.session.select(whatabanger.swd.SWD_AP_IDR)
+        self.target.retries = 0
+        self.target.wait = 1.0
+        with self.assertRaises(whatabanger.transport.AckError):
+            self.session.read_ap(whatabanger.swd.SWD_AP_IDR)
+        self.assertIsNone(self.session._select)
+
+    def test_multidrop(self):
+        ''' Ensures each target on a multi-drop bus has its own session. '''
+        images = [os.urandom(0x100), os.urandom(0x100)]
+        targets = [
+            whatabanger.simulator.Simulator(
+                memory={0x20000000: image},
+                instance=instance,
+            )
+            for instance, image in enumerate(images)
+        ]
+        loopback = whatabanger.transport.Loopback(
+            whatabanger.simulator.Bus(targets=targets)
+        )
+
+        selectors = [0x01002927, 0x11002927]
+        multidrop = whatabanger.session.Multidrop(loopback, loopback, selectors)
+        self.assertEqual(
+            list(multidrop.connect().values()),
+            [whatabanger.simulator.SIM_DP_IDR] * 2,
+        )
+
+        # Reads alternate between targets, so each must be re-selected.
+        for _ in range(2):
+            for selector, image in zip(selectors, images):
+                self.assertEqual(
+                    multidrop[selector].read_memory(0x20000000, 0x100),
+                    image,
+                )
+
+        # Targets are unreachable until woken.
+        bus = whatabanger.simulator.Bus(targets=targets)
+        with self.assertRaises(whatabanger.transport.AckError):
+            bus.execute(dict(
+                whatabanger.swd.Protocol().idr(),
+                TARGET=selectors[0],
+            ))
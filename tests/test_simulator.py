@@ -0,0 +1,78 @@
+''' Implements tests for the Simulator module. '''
+
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerSimulatorTestCase(unittest.TestCase):
+    ''' Implements tests for the Simulator module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.protocol = whatabanger.swd.Protocol()
+        self.target = whatabanger.simulator.Simulator(
+            memory={0x20000000: bytes(range(256)) * 8}
+        )
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def _value(self, data):
+        ''' Check parity, and return the value of a response. '''
+        self.assertTrue(whatabanger.swd.check_parity(data[32], data[0:32]))
+        return whatabanger.helpers.bits_to_bytes(data[0:32])
+
+    def test_idr(self):
+        ''' Ensures the DP IDR can be read after a line reset. '''
+        self.assertEqual(self.target.execute(self.protocol.resync()), [])
+        data = self.target.execute(self.protocol.idr())
+        self.assertEqual(self._value(data), whatabanger.simulator.SIM_DP_IDR)
+
+    def test_ap_idr(self):
+        ''' Ensures AP reads are posted, and returned via RDBUFF. '''
+        self.target.execute(self.protocol.select(apbanksel=0b1111))
+        self.target.execute(self.protocol.read(addr=0b11, apndp=0b1))
+        data = self.target.execute(self.protocol.rdbuff())
+        self.assertEqual(self._value(data), whatabanger.simulator.SIM_AP_IDR)
+
+        # APs which are not present read as zero.
+        self.target.execute(self.protocol.select(apsel=0x1, apbanksel=0b1111))
+        self.target.execute(self.protocol.read(addr=0b11, apndp=0b1))
+        data = self.target.execute(self.protocol.rdbuff())
+        self.assertEqual(self._value(data), 0x0)
+
+    def test_drw(self):
+        ''' Ensures memory can be read via TAR and DRW. '''
+        self.target.execute(self.protocol.tar(addr=0x20000004))
+        self.target.execute(self.protocol.drw())
+        data = self.target.execute(self.protocol.rdbuff())
+        self.assertEqual(self._value(data), 0x07060504)
+
+    def test_fault(self):
+        ''' Ensures bus errors result in a FAULT until cleared by ABORT. '''
+        # Requests are put onto the wire directly, so that the transport does
+        # not clear the FAULT itself.
+        self.target._execute(self.protocol.tar(addr=0x30000000))
+        self.target._execute(self.protocol.drw())
+        for _ in range(2):
+            with self.assertRaises(whatabanger.transport.AckError):
+                self.target._execute(self.protocol.rdbuff())
+
+        # CTRL/STAT must still be readable, to find out what went wrong.
+        data = self.target._execute(self.protocol.stat())
+        self.assertTrue(self._value(data) & whatabanger.swd.SWD_CTRL_STICKYERR)
+
+        self.target._execute(self.protocol.abort())
+        self.target._execute(self.protocol.rdbuff())
+        self.assertEqual(self.target.faults, 2)
+
+    def test_wait(self):
+        ''' Ensures WAITs are injected for AP accesses only. '''
+        target = whatabanger.simulator.Simulator(wait=1.0, retries=0)
+        target.execute(self.protocol.idr())
+        with self.assertRaises(whatabanger.transport.AckError):
+            target.execute(self.protocol.drw())
+        self.assertEqual(target.waits, 1)
@@ -0,0 +1,130 @@
+''' Implements tests for the Snapshot module. '''
+
+import os
+import shutil
+import tempfile
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerSnapshotTestCase(unittest.TestCase):
+    ''' Implements tests for the Snapshot module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.image = os.urandom(0x1000)
+        self.target = whatabanger.simulator.CoreSimulator(
+            memory={0x20000000: self.image, 0x08000000: bytes(0x800)},
+            steps=4096,
+        )
+        loopback = whatabanger.transport.Loopback(self.target)
+        self.session = whatabanger.session.Session(loopback, loopback)
+        self.path = tempfile.mkdtemp()
+        self.store = whatabanger.snapshot.Store(
+            self.session,
+            path=os.path.join(self.path, 'store'),
+        )
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        shutil.rmtree(self.path)
+
+    def _image(self, addr, length):
+        ''' Returns the image of a snapshot, as stored. '''
+        _, path = self.store.load(addr, length)
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def _flip(self, addr):
+        ''' Inverts a byte of target memory, behind the session's back. '''
+        self.target.memory[0x20000000][addr - 0x20000000] ^= 0xFF
+
+    def test_diff_first(self):
+        ''' Ensures the first diff takes a snapshot, with every block. '''
+        delta = os.path.join(self.path, 'delta')
+        changed = self.store.diff(0x20000000, 0x1000, delta)
+        self.assertEqual(changed, [0x20000000 + i * 0x400 for i in range(4)])
+        self.assertEqual(
+            whatabanger.snapshot.apply(delta, bytes(0x1000)),
+            self.image,
+        )
+
+        index, _ = self.store.load(0x20000000, 0x1000)
+        self.assertEqual(self._image(0x20000000, 0x1000), self.image)
+        self.assertEqual(len(index['crcs']), 4)
+
+    def test_diff_sampled(self):
+        ''' Ensures sampled words find changed blocks, without reading all. '''
+        self.store.snapshot(0x20000000, 0x1000)
+        before = self._image(0x20000000, 0x1000)
+
+        # The first sample of each block is its first word.
+        self._flip(0x20000802)
+        delta = os.path.join(self.path, 'delta')
+        transactions = self.target.transactions
+        changed = self.store.diff(0x20000000, 0x1000, delta)
+        self.assertEqual(changed, [0x20000800])
+        self.assertLess(self.target.transactions - transactions, 0x400 // 2)
+
+        # The delta is compact, and applies to the previous snapshot.
+        self.assertLess(os.path.getsize(delta), 0x40)
+        after = self._image(0x20000000, 0x1000)
+        self.assertEqual(whatabanger.snapshot.apply(delta, before), after)
+        self.assertEqual(after, bytes(self.target.memory[0x20000000]))
+
+    def test_diff_sampled_schedule(self):
+        ''' Ensures sampled words move on, so changes are eventually found. '''
+        self.store.snapshot(0x20000000, 0x1000)
+        self._flip(0x20000408)
+
+        delta = os.path.join(self.path, 'delta')
+        found = []
+        for _ in range(4):
+            found += self.store.diff(0x20000000, 0x1000, delta)
+        self.assertEqual(found, [0x20000400])
+
+    def test_diff_batches(self):
+        ''' Ensures blocks are sampled in batches, keeping the index whole. '''
+        self.store.block_size = 0x40
+        self.store.snapshot(0x20000000, 0x1000)
+        self._flip(0x20000511)
+        self._flip(0x20000C80)
+
+        batch = whatabanger.snapshot.SNAPSHOT_BATCH
+        whatabanger.snapshot.SNAPSHOT_BATCH = 0x10
+        try:
+            changed = self.store.diff(
+                0x20000000,
+                0x1000,
+                os.path.join(self.path, 'delta'),
+            )
+        finally:
+            whatabanger.snapshot.SNAPSHOT_BATCH = batch
+
+        self.assertEqual(changed, [0x20000500, 0x20000C80])
+        index, path = self.store.load(0x20000000, 0x1000)
+        self.assertEqual(index['crcs'], self.store._crcs(path))
+        self.assertEqual(
+            self._image(0x20000000, 0x1000),
+            bytes(self.target.memory[0x20000000]),
+        )
+
+    def test_diff_checksum(self):
+        ''' Ensures blocks are compared by CRCs computed on the core. '''
+        self.store.checksum = whatabanger.cortexm.Checksum(
+            self.session,
+            base=0x08000000,
+        )
+        self.store.snapshot(0x20000000, 0x1000)
+        self._flip(0x20000ABC)
+        self._flip(0x20000123)
+
+        delta = os.path.join(self.path, 'delta')
+        changed = self.store.diff(0x20000000, 0x1000, delta)
+        self.assertEqual(changed, [0x20000000, 0x20000800])
+        self.assertEqual(
+            self._image(0x20000000, 0x1000),
+            bytes(self.target.memory[0x20000000]),
+        )
@@ -0,0 +1,215 @@
+''' Implements tests for the STM32 module. '''
+
+import os
+import unittest
+import coverage
+
+import whatabanger
+
+from whatabanger import stm32
+
+
+class FlashSimulator(whatabanger.simulator.Simulator):
+    ''' Extends the simulated target with a minimal STM32F103x FPEC. '''
+
+    def __init__(self, flash):
+        ''' Ensure flash, and the FPEC, are in their reset state. '''
+        super(FlashSimulator, self).__init__(
+            memory={stm32.STM32_FLASH_BASE: flash},
+        )
+        self.keys = []
+        self.registers = {
+            stm32.STM32_FLASH_SR: 0x0,
+            stm32.STM32_FLASH_CR: stm32.STM32_CR_LOCK,
+            stm32.STM32_FLASH_AR: 0x0,
+        }
+
+    def _load(self, addr):
+        ''' Returns FPEC registers, or memory. '''
+        if addr in self.registers:
+            return self.registers[addr]
+        return super(FlashSimulator, self)._load(addr)
+
+    def _store(self, addr, value):
+        ''' Performs FPEC operations, or flash programming. '''
+        cr = self.registers[stm32.STM32_FLASH_CR]
+        if addr == stm32.STM32_FLASH_KEYR:
+            self.keys = (self.keys + [value])[-2:]
+            if self.keys == [stm32.STM32_FLASH_KEY1, stm32.STM32_FLASH_KEY2]:
+                self.registers[stm32.STM32_FLASH_CR] &= ~stm32.STM32_CR_LOCK
+        elif addr == stm32.STM32_FLASH_SR:
+            self.registers[addr] &= ~value
+        elif addr in self.registers:
+            if cr & stm32.STM32_CR_LOCK:
+                value |= stm32.STM32_CR_LOCK
+            self.registers[addr] = value
+
+            # Erase the page, if started.
+            if addr == stm32.STM32_FLASH_CR and \
+                    value & stm32.STM32_CR_PER and value & stm32.STM32_CR_STRT:
+                data, offset = self._find(self.registers[stm32.STM32_FLASH_AR])
+                offset -= offset % stm32.STM32_PAGE_SIZE
+                data[offset:offset + stm32.STM32_PAGE_SIZE] = \
+                    b'\xff' * stm32.STM32_PAGE_SIZE
+                self.registers[stm32.STM32_FLASH_SR] |= stm32.STM32_SR_EOP
+        elif cr & stm32.STM32_CR_PG and self._flash(addr):
+            # Flash can only be programmed by half-word, and only if erased.
+            data, offset = self._find(addr)
+            if self._size() != 2 or data[offset:offset + 2] != b'\xff\xff':
+                self.registers[stm32.STM32_FLASH_SR] |= stm32.STM32_SR_PGERR
+                return
+            super(FlashSimulator, self)._store(addr, value)
+            self.registers[stm32.STM32_FLASH_SR] |= stm32.STM32_SR_EOP
+        elif not self._flash(addr):
+            super(FlashSimulator, self)._store(addr, value)
+
+    def _flash(self, addr):
+        ''' Returns whether an address is in flash, rather than elsewhere. '''
+        size = len(self.memory[stm32.STM32_FLASH_BASE])
+        return stm32.STM32_FLASH_BASE <= addr < stm32.STM32_FLASH_BASE + size
+
+
+class LoaderSimulator(FlashSimulator, whatabanger.simulator.CoreSimulator):
+    ''' Extends the simulated FPEC with SRAM, and a core to run loaders. '''
+
+    def __init__(self, flash):
+        ''' Ensure SRAM is mapped. '''
+        super(LoaderSimulator, self).__init__(flash)
+        self.memory[stm32.STM32_SRAM_BASE] = bytearray(0x1000)
+
+
+class WhatABangerStm32TestCase(unittest.TestCase):
+    ''' Implements tests for the STM32 module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.target = FlashSimulator(os.urandom(0x1000))
+        loopback = whatabanger.transport.Loopback(self.target)
+        self.session = whatabanger.session.Session(loopback, loopback)
+        self.flash = stm32.Flash(self.session)
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test_write(self):
+        ''' Ensures flash is erased, programmed and verified page by page. '''
+        image = os.urandom(0x900)
+        self.flash.write(stm32.STM32_FLASH_BASE, image)
+        self.assertEqual(
+            self.session.read_memory(stm32.STM32_FLASH_BASE, len(image)),
+            image,
+        )
+        self.assertEqual(self.flash.verify(stm32.STM32_FLASH_BASE, image), [])
+
+        # The FPEC must be locked again once done.
+        self.assertTrue(
+            self.target.registers[stm32.STM32_FLASH_CR] & stm32.STM32_CR_LOCK
+        )
+
+    def test_write_packed(self):
+        ''' Ensures flash can be programmed with packed transfers. '''
+        image = os.urandom(0x400)
+        self.flash.packed = True
+        self.flash.write(stm32.STM32_FLASH_BASE + 0x400, image)
+        self.assertEqual(
+            self.flash.verify(stm32.STM32_FLASH_BASE + 0x400, image),
+            [],
+        )
+
+    def test_verify(self):
+        ''' Ensures pages which don't match are reported. '''
+        image = self.session.read_memory(stm32.STM32_FLASH_BASE, 0x1000)
+        image = image[:0x800] + bytes([image[0x800] ^ 0xFF]) + image[0x801:]
+        self.assertEqual(
+            self.flash.verify(stm32.STM32_FLASH_BASE, image),
+            [stm32.STM32_FLASH_BASE + 0x800],
+        )
+
+    def test_program_error(self):
+        ''' Ensures programming flash which isn't erased is an error. '''
+        self.flash.unlock()
+        with self.assertRaises(Exception):
+            self.flash.program_page(stm32.STM32_FLASH_BASE, b'\x00' * 4)
+
+    def test_loader(self):
+        ''' Ensures flash is programmed by the loader, via both buffers. '''
+        target = LoaderSimulator(os.urandom(0x1000))
+        loopback = whatabanger.transport.Loopback(target)
+        session = whatabanger.session.Session(loopback, loopback)
+        loader = stm32.Loader(session, buffer_size=0x200)
+
+        image = os.urandom(0xA02)
+        loader.write(stm32.STM32_FLASH_BASE, image)
+        self.assertEqual(
+            session.read_memory(stm32.STM32_FLASH_BASE, len(image)),
+            image,
+        )
+        self.assertTrue(target.halted())
+        self.assertTrue(
+            target.registers[stm32.STM32_FLASH_CR] & stm32.STM32_CR_LOCK
+        )
+
+    def test_loader_error(self):
+        ''' Ensures a programming error stops the loader, and is raised. '''
+        target = LoaderSimulator(os.urandom(0x1000))
+        loopback = whatabanger.transport.Loopback(target)
+        session = whatabanger.session.Session(loopback, loopback)
+        loader = stm32.Loader(session)
+
+        # Erasing is skipped, so programming fails with PGERR.
+        loader.flash.erase_page = lambda page: None
+        with self.assertRaises(Exception) as err:
+            loader.write(stm32.STM32_FLASH_BASE, b'\x00' * 0x10)
+        self.assertIn("loader stopped", str(err.exception))
+
+    def test_verify_checksum(self):
+        ''' Ensures pages are verified by CRCs computed on the core. '''
+        target = LoaderSimulator(os.urandom(0x1000))
+        target.steps = 4096
+        loopback = whatabanger.transport.Loopback(target)
+        session = whatabanger.session.Session(loopback, loopback)
+        flash = stm32.Flash(
+            session,
+            checksum=whatabanger.cortexm.Checksum(session),
+        )
+
+        # Only a CRC per page is read back, rather than every word.
+        image = session.read_memory(stm32.STM32_FLASH_BASE, 0x404)
+        transactions = target.transactions
+        self.assertEqual(flash.verify(stm32.STM32_FLASH_BASE, image), [])
+        self.assertLess(target.transactions - transactions, 0x404 // 4)
+
+        image = image[:0x400] + bytes([image[0x400] ^ 0xFF]) + image[0x401:]
+        self.assertEqual(
+            flash.verify(stm32.STM32_FLASH_BASE, image),
+            [stm32.STM32_FLASH_BASE + 0x400],
+        )
+
+    def test_write_checksum(self):
+        ''' Ensures only pages which differ are programmed. '''
+        target = LoaderSimulator(os.urandom(0x1000))
+        target.steps = 256
+        loopback = whatabanger.transport.Loopback(target)
+        session = whatabanger.session.Session(loopback, loopback)
+        flash = stm32.Flash(
+            session,
+            checksum=whatabanger.cortexm.Checksum(session),
+        )
+
+        erased = []
+        erase_page = flash.erase_page
+        flash.erase_page = lambda page: erased.append(page) or erase_page(page)
+
+        image = session.read_memory(stm32.STM32_FLASH_BASE, 0x800)
+        image = image[:0x400] + os.urandom(0x10) + image[0x410:]
+        stm32.Loader(session, flash=flash).write(
+            stm32.STM32_FLASH_BASE,
+            image,
+        )
+        self.assertEqual(erased, [stm32.STM32_FLASH_BASE + 0x400])
+        self.assertEqual(flash.verify(stm32.STM32_FLASH_BASE, image), [])
+
+        # Once up to date, nothing is programmed at all.
+        flash.write(stm32.STM32_FLASH_BASE, image)
+        self.assertEqual(len(erased), 1)
@@ -160,3 +160,75 @@ class WhatABangerSWDTestCase(unittest.TestCase):
         # Ensure flags are valid.
         self.assertEqual(candidate['ACK'], True)
         self.assertEqual(candidate['READ'], False)
+
+    def test_write(self):
+        ''' Ensures the write method generates correct packets. '''
+        candidate = self.protocol.write(addr=0b01, apndp=0b1, value=0x20000000)
+        self.assertEqual(candidate, self.protocol.tar(addr=0x20000000))
+
+    def test_csw(self):
+        ''' Ensures the csw method generates correct packets. '''
+        candidate = self.protocol.csw()
+        desired = [1, 1, 0, 0, 0, 1, 0, 1]
+        self.assertEqual(candidate['CMD'], desired)
+
+        # Word sized, single auto-increment, with the default HPROT.
+        self.assertEqual(
+            whatabanger.helpers.bits_to_bytes(candidate['DATA'][0:32]),
+            0x23000012,
+        )
+
+    def test_calculate_parity(self):
+        ''' Ensures parity can be calculated over an integer (popcount). '''
+        self.assertEqual(whatabanger.swd.calculate_parity(0x20000000), 1)
+        self.assertEqual(whatabanger.swd.calculate_parity(0x23000010), 0)
+
+    def test_headers(self):
+        ''' Ensures all request headers are pre-built. '''
+        self.assertEqual(len(whatabanger.swd.SWD_HEADERS), 16)
+        self.assertIs(self.protocol.idr()['CMD'], self.protocol.read()['CMD'])
+        with self.assertRaises(Exception):
+            self.protocol._request(addr=0b100)
+
+    def test_ctrl(self):
+        ''' Ensures the ctrl method sets ORUNDETECT only when requested. '''
+        candidate = self.protocol.ctrl(cdbgpweupreq=0b1)
+        self.assertEqual(candidate['DATA'], whatabanger.swd.payload(1 << 28))
+
+        candidate = self.protocol.ctrl(orundetect=0b1)
+        self.assertEqual(
+            candidate['DATA'],
+            whatabanger.swd.payload(whatabanger.swd.SWD_CTRL_ORUNDETECT),
+        )
+
+    def test_drw(self):
+        ''' Ensures the drw method generates READ, and WRITE, packets. '''
+        self.assertEqual(self.protocol.drw(), self.protocol.read(addr=0b11, apndp=0b1))
+        self.assertEqual(
+            self.protocol.drw(value=0x1234),
+            self.protocol.write(addr=0b11, apndp=0b1, value=0x1234),
+        )
+
+    def test_wakeup(self):
+        ''' Ensures the dormant state wake-up sequence is built correctly. '''
+        candidate = self.protocol.wakeup()
+        self.assertFalse(candidate['ACK'])
+        self.assertEqual(len(candidate['CMD']), 8 + 128 + 4 + 8)
+        self.assertEqual(candidate['CMD'][0:8].value, 0xFF)
+        self.assertEqual(
+            candidate['CMD'][140:148].value,
+            whatabanger.swd.SWD_ACTIVATION_SWD,
+        )
+
+    def test_targetsel(self):
+        ''' Ensures TARGETSEL is sent as a sequence, ignoring the ACK. '''
+        candidate = self.protocol.targetsel(0x01002927)
+        self.assertFalse(candidate['ACK'])
+        self.assertEqual(
+            candidate['CMD'][0:8],
+            self.protocol.write(addr=0b11)['CMD'],
+        )
+        self.assertEqual(
+            candidate['CMD'][13:46],
+            whatabanger.swd.payload(0x01002927),
+        )
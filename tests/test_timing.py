@@ -0,0 +1,81 @@
+''' Implements tests for the Timing module. '''
+
+import time
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerTimingTestCase(unittest.TestCase):
+    ''' Implements tests for the Timing module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.clock = whatabanger.timing.Clock(0.001)
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test_rate(self):
+        ''' Ensures the interface rate follows the interval, or is maximal. '''
+        self.assertEqual(self.clock.rate(), 1000)
+        self.assertEqual(
+            whatabanger.timing.Clock(0).rate(),
+            whatabanger.timing.TIMING_ZERO_DELAY_RATE,
+        )
+
+    def test_pace(self):
+        ''' Ensures writes are scheduled against the previous deadline. '''
+        start = time.monotonic()
+        for _ in range(10):
+            self.clock.pace(5)
+        elapsed = time.monotonic() - start
+
+        # The first write isn't delayed, and the last is only waited for by
+        # the next - so 9 writes of 5ms are waited for.
+        self.assertGreaterEqual(elapsed, 0.045)
+        self.assertAlmostEqual(
+            self.clock._deadline - start,
+            0.050,
+            delta=0.005,
+        )
+
+    def test_pace_idle(self):
+        ''' Ensures the deadline restarts after idle, rather than catching up. '''
+        self.clock.pace(1)
+        time.sleep(whatabanger.timing.TIMING_SLACK * 2)
+
+        start = time.monotonic()
+        self.clock.pace(1)
+        self.assertGreaterEqual(self.clock._deadline, start)
+
+    def test_zero_delay(self):
+        ''' Ensures zero-delay mode never waits. '''
+        clock = whatabanger.timing.Clock(None)
+        clock.pace(1 << 20)
+        self.assertIsNone(clock._deadline)
+
+    def test_calibrate(self):
+        ''' Ensures the achieved frequency is measured, then forgotten. '''
+        def exchange(states):
+            self.clock.pace(len(states))
+            time.sleep(len(states) * 0.0005)
+            self.clock.account(len(states), len(states) * 0.0005)
+
+        frequency = self.clock.calibrate(exchange, bytes(200))
+        self.assertAlmostEqual(frequency, 1000.0)
+        self.assertEqual(self.clock.calibrated, frequency)
+        self.assertEqual(self.clock.frequency(), 0.0)
+
+        self.clock.account(100, 0.1)
+        self.assertAlmostEqual(self.clock.frequency(), 500.0)
+
+    def test_cycles(self):
+        ''' Ensures calibration of a slow clock is bounded in time. '''
+        self.assertEqual(self.clock.cycles(), 25)
+        self.assertEqual(
+            whatabanger.timing.Clock(0).cycles(),
+            whatabanger.timing.TIMING_CALIBRATION_CYCLES,
+        )
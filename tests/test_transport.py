@@ -0,0 +1,198 @@
+''' Implements tests for the Transport module. '''
+
+import unittest
+import coverage
+import multiprocessing
+
+import whatabanger
+
+
+class WhatABangerTransportTestCase(unittest.TestCase):
+    ''' Implements tests for the Transport module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.protocol = whatabanger.swd.Protocol()
+        self.request = multiprocessing.Queue()
+        self.response = multiprocessing.Queue()
+
+        self.transport = None
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        if self.transport is not None and self.transport.is_alive():
+            self.transport.terminate()
+            self.transport.join()
+
+    def test_run(self):
+        ''' Ensures requests are serviced, and time accounted for. '''
+        self.transport = whatabanger.simulator.Simulator(
+            self.request,
+            self.response,
+            keepalive=0.01,
+        )
+        self.transport.start()
+
+        self.request.put(self.protocol.idr())
+        data = self.response.get(timeout=5)
+        self.assertEqual(
+            whatabanger.helpers.bits_to_bytes(data[0:32]),
+            whatabanger.simulator.SIM_DP_IDR,
+        )
+
+        stats = self.transport.stats()
+        self.assertEqual(stats['serviced'], 1)
+        self.assertGreater(stats['idle'], 0.0)
+        self.assertGreater(stats['busy'], 0.0)
+
+    def test_wait(self):
+        ''' Ensures WAITs are retried, backing off, until the budget is spent. '''
+        target = whatabanger.simulator.Simulator(
+            memory={0x0: bytes(0x100)},
+            wait=0.5,
+            seed=1,
+        )
+        for _ in range(32):
+            target.execute(self.protocol.drw())
+
+        stats = target.stats()
+        self.assertEqual(stats['waits'], target.waits)
+        self.assertEqual(stats['retries'], target.waits)
+        self.assertEqual(stats['faults'], 0)
+
+        # A target which never completes an access eventually gives up.
+        target = whatabanger.simulator.Simulator(
+            memory={0x0: bytes(0x100)},
+            wait=1.0,
+            retries=3,
+        )
+        with self.assertRaises(whatabanger.transport.AckError) as err:
+            target.execute(self.protocol.drw())
+        self.assertEqual(err.exception.ack, whatabanger.swd.SWD_ACK_WAIT)
+        self.assertEqual(target.waits, 4)
+
+        # Idle cycles between retries are doubled after every WAIT.
+        self.assertEqual(
+            target.cycles,
+            4 * whatabanger.simulator.SIM_TRANSFER_CYCLES + 8 + 16 + 32,
+        )
+
+    def test_fault(self):
+        ''' Ensures FAULTs are cleared with ABORT, and passed back not replayed. '''
+        target = whatabanger.simulator.Simulator(
+            memory={0x20000000: bytes(range(256))},
+        )
+        target.execute(self.protocol.tar(addr=0x30000000))
+        target.execute(self.protocol.drw())
+
+        # The read from unmapped memory is posted, so only the next access
+        # sees the FAULT - which must not be hidden by a replay.
+        with self.assertRaises(whatabanger.transport.AckError) as err:
+            target.execute(self.protocol.rdbuff())
+        self.assertEqual(err.exception.ack, whatabanger.swd.SWD_ACK_FAULT)
+        self.assertFalse(target.ctrl & whatabanger.swd.SWD_CTRL_STICKY)
+
+        target.execute(self.protocol.tar(addr=0x20000004))
+        target.execute(self.protocol.drw())
+        data = target.execute(self.protocol.rdbuff())
+        self.assertEqual(
+            whatabanger.helpers.bits_to_bytes(data[0:32]),
+            0x07060504,
+        )
+
+        stats = target.stats()
+        self.assertEqual(stats['faults'], 1)
+        self.assertEqual(stats['retries'], 0)
+
+    def test_service(self):
+        ''' Ensures requests which can't be completed are answered with errors. '''
+        target = whatabanger.simulator.Simulator(wait=1.0, retries=0)
+        ident, result = target.service(dict(self.protocol.drw(), ID=7))
+        self.assertEqual(ident, 7)
+        self.assertIsInstance(result, whatabanger.transport.AckError)
+
+    def test_overrun(self):
+        ''' Ensures streamed requests are replayed from the first overrun. '''
+        target = whatabanger.simulator.Simulator(
+            memory={0x20000000: bytes(range(256))},
+            wait=0.2,
+            seed=3,
+        )
+        target.execute(self.protocol.ctrl(orundetect=0b1))
+        self.assertTrue(target._orundetect)
+
+        requests = [self.protocol.csw(), self.protocol.tar(addr=0x20000000)]
+        requests += [self.protocol.drw()]
+        requests += [self.protocol.drw() for _ in range(15)]
+        requests += [self.protocol.rdbuff()]
+        results = target._complete(requests)
+
+        words = [
+            whatabanger.helpers.bits_to_bytes(data[0:32])
+            for data in results[3:]
+        ]
+        self.assertEqual(words, [
+            int.from_bytes(bytes(range(idx, idx + 4)), 'little')
+            for idx in range(0, 64, 4)
+        ])
+
+        stats = target.stats()
+        self.assertGreater(stats['waits'], 0)
+        self.assertEqual(stats['retries'], stats['waits'])
+        self.assertEqual(stats['faults'], 0)
+        self.assertFalse(target.ctrl & whatabanger.swd.SWD_CTRL_STICKY)
+
+    def test_batch(self):
+        ''' Ensures pending requests are batched once ORUNDETECT is set. '''
+        image = bytes(range(256)) * 16
+        self.transport = whatabanger.simulator.Simulator(
+            self.request,
+            self.response,
+            memory={0x20000000: image},
+            wait=0.1,
+        )
+        self.transport.start()
+
+        session = whatabanger.session.Session(self.request, self.response)
+        session.connect()
+        session.overrun_detect()
+        self.assertEqual(session.read_memory(0x20000000, len(image)), image)
+        self.assertGreater(self.transport.stats()['waits'], 0)
+
+    def test_interleave(self):
+        ''' Ensures a target which WAITs doesn't stall others on the bus. '''
+        targets = [
+            whatabanger.simulator.Simulator(
+                memory={0x0: bytes(0x100)},
+                wait=1.0,
+            ),
+            whatabanger.simulator.Simulator(
+                memory={0x0: bytes(range(0x100))},
+                instance=0x1,
+            ),
+        ]
+        self.transport = whatabanger.simulator.Bus(
+            self.request,
+            self.response,
+            targets=targets,
+            keepalive=0.01,
+            retries=1 << 20,
+        )
+        self.transport.start()
+
+        multidrop = whatabanger.session.Multidrop(
+            self.request,
+            self.response,
+            [0x01002927, 0x11002927],
+        )
+        multidrop.connect()
+
+        # The first target never completes an access, but reads from the
+        # second are serviced in the meantime.
+        stalled = multidrop[0x01002927].submit(self.protocol.drw())
+        self.assertEqual(
+            multidrop[0x11002927].read_memory(0x0, 0x100),
+            bytes(range(0x100)),
+        )
+        self.assertFalse(stalled.done())
+        self.assertGreater(self.transport.stats()['waits'], 0)
@@ -0,0 +1,84 @@
+''' Implements tests for the Waveform module. '''
+
+import unittest
+import coverage
+
+import whatabanger
+
+
+class WhatABangerWaveformTestCase(unittest.TestCase):
+    ''' Implements tests for the Waveform module. '''
+
+    def setUp(self):
+        ''' Ensure the application is setup for testing. '''
+        self.protocol = whatabanger.swd.Protocol()
+        self.compiler = whatabanger.waveform.Compiler(swclk=0x01, swdio=0x02)
+
+    def tearDown(self):
+        ''' Ensure everything is torn down between tests. '''
+        pass
+
+    def test_write(self):
+        ''' Ensures bits are written as port states with a trailing LOW. '''
+        candidate = self.compiler.write([1, 0, 1])
+        desired = bytearray([0x2, 0x3, 0x0, 0x1, 0x2, 0x3, 0x2])
+        self.assertEqual(candidate, desired)
+
+    def test_read(self):
+        ''' Ensures reads are sampled from the state after the RISING edge. '''
+        states, samples = self.compiler.read(2)
+        self.assertEqual(states, bytearray([0x1, 0x0, 0x1, 0x0]))
+        self.assertEqual(samples, [1, 3])
+
+    def test_compile_read(self):
+        ''' Ensures READ requests are compiled into the expected phases. '''
+        phases = self.compiler.compile(self.protocol.idr())
+        self.assertEqual(
+            [phase.drive for phase in phases],
+            [True, False, False, True],
+        )
+
+        # CMD (8 cycles) and a 'turn-round'.
+        self.assertEqual(len(phases[0].states), (8 * 2 + 1) + 2)
+
+        # The ACK alone, so it is checked before any data is clocked.
+        self.assertEqual(phases[1].ack, 3)
+        self.assertEqual(phases[1].read, 0)
+        self.assertEqual(len(phases[1].samples), 3)
+
+        # Data and parity, then a 'turn-round'.
+        self.assertEqual(phases[2].ack, 0)
+        self.assertEqual(phases[2].read, 33)
+        self.assertEqual(len(phases[2].samples), 33)
+        self.assertEqual(len(phases[2].states), 34 * 2)
+
+        # Trailing idle cycles.
+        self.assertEqual(len(phases[3].states), 8 * 2 + 1)
+
+    def test_compile_write(self):
+        ''' Ensures WRITE requests split the ACK from the data phase. '''
+        phases = self.compiler.compile(self.protocol.tar(addr=0x20000000))
+        self.assertEqual([phase.drive for phase in phases], [True, False, True])
+        self.assertEqual(phases[1].ack, 3)
+        self.assertEqual(phases[1].read, 0)
+        self.assertEqual(len(phases[2].states), (41 * 2 + 2))
+
+    def test_compile_resync(self):
+        ''' Ensures requests without an ACK are a single phase. '''
+        phases = self.compiler.compile(self.protocol.resync())
+        self.assertEqual(len(phases), 1)
+        self.assertEqual(phases[0].samples, [])
+
+    def test_write_fragments(self):
+        ''' Ensures writes built from per-byte fragments are correct. '''
+        candidate = self.compiler.write(whatabanger.helpers.Bits(0x1A5, 10))
+        desired = bytearray()
+        for bit in [1, 0, 1, 0, 0, 1, 0, 1, 1, 0]:
+            desired.extend([0x2 * bit, 0x2 * bit | 0x1])
+        desired.append(0x0)
+        self.assertEqual(candidate, desired)
+
+    def test_compile_cached(self):
+        ''' Ensures requests without data are only compiled once. '''
+        candidate = self.compiler.compile(self.protocol.idr())
+        self.assertIs(self.compiler.compile(self.protocol.idr()), candidate)